@@ -0,0 +1,292 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Materialized analytics cube keyed by day x period x student x metric. Every
+# metric is additive (counts, sums of seconds), so any roll-up is a plain sum
+# and rates such as correct rate are derived from the summed parts. The cube
+# is built once from the tutor log, detector results and an event master file
+# with the Python APIs, and stored column by column as .npy files: int8 day
+# and period ID's (-1 for NaN), int32 student codes, int16 metric codes and
+# float64 values, plus a json manifest with the student and metric
+# dictionaries. Roll-ups per period, per day or per student read the memory-
+# mapped columns and group small integer codes, and can be exported as csv
+# files for the Rmd reports
+################################################################################
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import detectorDataAPI as detectorAPI
+import observationDataAPI as observationAPI
+import stop_detection as sd
+
+DIM_COLS = ["dayID", "periodID", "studentID"]
+MISSING_ID = -1 # day/period ID on disk for rows not in any class window
+DETECTOR_NAMES = ["idle", "struggle", "gaming", "misuse"]
+# derived metric -> (numerator metric, denominator metric)
+DERIVED_METRICS = {"tutor.correctRate": ("tutor.correct", "tutor.attempts"),
+                   "tutor.hintRate": ("tutor.hints", "tutor.attempts"),
+                   "tutor.timePerStep": ("tutor.duration", "tutor.steps"),
+                   "stops.meanLength": ("stops.totalLength", "stops.count")}
+
+def _toLongDF(wideDF, modality):
+    """
+    Stacks the metric columns of a (dayID, periodID, studentID) keyed frame
+    into (dayID, periodID, studentID, metric, value) rows
+    """
+    longDF = wideDF.melt(id_vars=DIM_COLS, var_name="metric", value_name="value")
+    longDF["metric"] = modality + "." + longDF["metric"]
+    return longDF
+
+def getTutorMetrics(tutorLogDF, studentCol="Anon Student Id"):
+    """
+    Additive tutor metrics per (dayID, periodID, student): transactions,
+    attempts (correct, incorrect and hint outcomes), correct, incorrect,
+    hints, steps (last attempts), problemsDone (`done ButtonPressed`) and
+    duration (seconds)
+
+    Args:
+        tutorLogDF (pandas.DataFrame): tutor log with `dayID` and `periodID` columns, e.g. returned by
+            tutorDataAPI.getAnnotatedTutorLogDF() with a schedule
+
+    Returns:
+        pandas.DataFrame: long format cube rows
+    """
+
+    outcomes = tutorLogDF["Outcome"].to_numpy(dtype=object)
+    rowsDF = pd.DataFrame({"dayID": tutorLogDF["dayID"].to_numpy(dtype=np.float64),
+                           "periodID": tutorLogDF["periodID"].to_numpy(dtype=np.float64),
+                           "studentID": tutorLogDF[studentCol].to_numpy(dtype=object),
+                           "transactions": 1,
+                           "attempts": np.isin(outcomes, ["CORRECT", "INCORRECT", "HINT"]).astype(np.int64),
+                           "correct": (outcomes == "CORRECT").astype(np.int64),
+                           "incorrect": (outcomes == "INCORRECT").astype(np.int64),
+                           "hints": (outcomes == "HINT").astype(np.int64),
+                           "steps": pd.to_numeric(tutorLogDF["Is Last Attempt"], errors="coerce").to_numpy(),
+                           "problemsDone": (tutorLogDF["Step Name"] == "done ButtonPressed").to_numpy().astype(np.int64),
+                           "duration": pd.to_numeric(tutorLogDF["Duration (sec)"], errors="coerce").to_numpy()})
+    metricsDF = rowsDF.groupby(DIM_COLS, dropna=False, sort=True).sum().reset_index()
+    return _toLongDF(metricsDF, "tutor")
+
+def getDetectorMetrics(detectorResultsDF, detectorNames=DETECTOR_NAMES):
+    """
+    Seconds each student spent in each detector state per (dayID, periodID),
+    summed over the intervals of detectorDataAPI.getStartEndEvents()
+
+    Returns:
+        pandas.DataFrame: long format cube rows, metrics named `detector.{detectorName}Duration`
+    """
+
+    eventsDF = detectorAPI.getStartEndEvents(detectorResultsDF, detectorNames)
+    durationsDF = pd.DataFrame({"dayID": eventsDF["dayID"].to_numpy(dtype=np.float64),
+                                "periodID": eventsDF["periodID"].to_numpy(dtype=np.float64),
+                                "studentID": eventsDF["actor"].to_numpy(dtype=object),
+                                "metric": "detector." + eventsDF["event"].astype(object) + "Duration",
+                                "value": (eventsDF["end"] - eventsDF["start"]).to_numpy(dtype=np.float64)})
+    return durationsDF.groupby(DIM_COLS + ["metric"], dropna=False, sort=True)["value"].sum().reset_index()
+
+def getEventMasterMetrics(eventMasterDF):
+    """
+    Teacher stop and visit metrics per (dayID, periodID, student) of an event
+    master file: stop count and total stop length (seconds) of the stops in
+    range of the student, as in the analytics notebook, with each stop in the
+    day and period of its last row; and the on-task visit, hand raise and
+    off-task visit counts of observationDataAPI.getObservationEventCounts()
+
+    Returns:
+        pandas.DataFrame: long format cube rows
+    """
+
+    stopsDF = eventMasterDF.loc[eventMasterDF["event"] == "Stopping"].reset_index(drop=True)
+    runsDF = sd.getStopRuns({None: stopsDF})
+    runsDF = pd.DataFrame({"dayID": stopsDF["dayID"].to_numpy(dtype=np.float64)[runsDF["endRow"].to_numpy()],
+                           "periodID": stopsDF["periodID"].to_numpy(dtype=np.float64)[runsDF["endRow"].to_numpy()],
+                           "studentID": runsDF["studentID"].to_numpy(dtype=object),
+                           "count": 1,
+                           "totalLength": runsDF["length"].to_numpy()})
+    stopMetricsDF = runsDF.groupby(DIM_COLS, dropna=False, sort=True).sum().reset_index()
+
+    obsEventsDF = eventMasterDF.loc[eventMasterDF["modality"] == "observation"]
+    visitMetricsDF = observationAPI.getObservationEventCounts(obsEventsDF)
+    visitMetricsDF = visitMetricsDF.astype({"dayID": np.float64, "periodID": np.float64})
+
+    return pd.concat([_toLongDF(stopMetricsDF, "stops"), _toLongDF(visitMetricsDF, "observation")], ignore_index=True)
+
+def buildAnalyticsCube(tutorLogDF=None, detectorResultsDF=None, eventMasterDF=None, detectorNames=DETECTOR_NAMES):
+    """
+    Long format cube of all given sources, one row per (dayID, periodID,
+    studentID, metric) with a non-zero value
+
+    Args:
+        tutorLogDF (pandas.DataFrame, optional): annotated tutor log with day and period ID's. Defaults to None.
+        detectorResultsDF (pandas.DataFrame, optional): encoded detector results. Defaults to None.
+        eventMasterDF (pandas.DataFrame, optional): event master file of one rng. Defaults to None.
+        detectorNames (List[str], optional): Defaults to DETECTOR_NAMES.
+
+    Returns:
+        pandas.DataFrame: `dayID`, `periodID`, `studentID`, `metric` and `value` columns
+    """
+
+    parts = []
+    if tutorLogDF is not None: parts.append(getTutorMetrics(tutorLogDF))
+    if detectorResultsDF is not None: parts.append(getDetectorMetrics(detectorResultsDF, detectorNames))
+    if eventMasterDF is not None: parts.append(getEventMasterMetrics(eventMasterDF))
+    assert len(parts) > 0, "At least one data source should be given"
+
+    cubeDF = pd.concat(parts, ignore_index=True)
+    cubeDF["value"] = cubeDF["value"].astype(np.float64)
+    # zero cells are implied, missing student ID's cannot be rolled up by student
+    cubeDF = cubeDF.loc[(cubeDF["value"] != 0) & cubeDF["studentID"].notnull()]
+    return cubeDF.sort_values(["metric"] + DIM_COLS, kind="stable").reset_index(drop=True)
+
+def writeAnalyticsCube(cubeDF, directory):
+    """
+    Writes a cube returned by buildAnalyticsCube() to the columnar layout
+
+    Args:
+        cubeDF (pandas.DataFrame): long format cube
+        directory (str): output directory, created if not existing
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    for col in ["dayID", "periodID"]:
+        values = cubeDF[col].to_numpy(dtype=np.float64)
+        assert np.all(np.isnan(values) | ((values >= 0) & (values <= np.iinfo(np.int8).max))), f"Column <{col}> does not fit in int8"
+        np.save(os.path.join(directory, f"{col}.npy"), np.where(np.isnan(values), MISSING_ID, values).astype(np.int8))
+
+    studentCodes, students = pd.factorize(cubeDF["studentID"].to_numpy(dtype=object), sort=True)
+    metricCodes, metrics = pd.factorize(cubeDF["metric"].to_numpy(dtype=object), sort=True)
+    np.save(os.path.join(directory, "studentID.npy"), studentCodes.astype(np.int32))
+    np.save(os.path.join(directory, "metric.npy"), metricCodes.astype(np.int16))
+    np.save(os.path.join(directory, "value.npy"), cubeDF["value"].to_numpy(dtype=np.float64))
+
+    with open(os.path.join(directory, "manifest.json"), "w") as manifestFile:
+        json.dump({"numOfRows": len(cubeDF), "students": list(students), "metrics": list(metrics)}, manifestFile)
+
+
+class AnalyticsCube:
+
+    """
+    Read access to a cube written by writeAnalyticsCube(). Columns are
+    memory-mapped, and filters and roll-ups work on the integer codes
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as manifestFile:
+            manifest = json.load(manifestFile)
+
+        self.students = np.array(manifest["students"], dtype=object)
+        self.metrics = np.array(manifest["metrics"], dtype=object)
+        self.columns = { col: np.load(os.path.join(directory, f"{col}.npy"), mmap_mode="r")
+                         for col in ["dayID", "periodID", "studentID", "metric", "value"] }
+        assert len(self.columns["value"]) == manifest["numOfRows"], "Cube columns do not match the manifest"
+
+    def __len__(self):
+        return len(self.columns["value"])
+
+    def getMetrics(self):
+        """
+        Returns the stored metric names followed by the derived metrics that can be computed from them
+        """
+        stored = self.metrics.tolist()
+        return stored + [ name for name, (numerator, denominator) in DERIVED_METRICS.items()
+                          if numerator in stored and denominator in stored ]
+
+    def _mask(self, dayIDs, periodIDs, students, metricCodes):
+        mask = np.isin(self.columns["metric"], metricCodes)
+        if dayIDs is not None: mask &= np.isin(self.columns["dayID"], np.asarray(dayIDs, dtype=np.int8))
+        if periodIDs is not None: mask &= np.isin(self.columns["periodID"], np.asarray(periodIDs, dtype=np.int8))
+        if students is not None: mask &= np.isin(self.columns["studentID"], np.flatnonzero(np.isin(self.students, list(students))))
+        return mask
+
+    def rollUp(self, by=["periodID"], metrics=None, dayIDs=None, periodIDs=None, students=None):
+        """
+        Sums the metrics over every dimension not in `by`, e.g. by=["periodID"]
+        for per period totals or by=["dayID", "studentID"] for daily totals of
+        each student. Derived metrics are computed from their summed parts
+
+        Args:
+            by (List[str], optional): subset of DIM_COLS to keep. Defaults to ["periodID"].
+            metrics (List[str], optional): stored and/or derived metrics. Defaults to all of getMetrics().
+            dayIDs (List[int], optional): only include these days. Defaults to None.
+            periodIDs (List[int], optional): only include these periods. Defaults to None.
+            students (List[str], optional): only include these students. Defaults to None.
+
+        Returns:
+            pandas.DataFrame: one row per combination of `by` values, one column per metric; NaN day/period ID's
+                for rows not in any class window
+        """
+
+        for col in by: assert col in DIM_COLS, f"Cannot roll up by <{col}>"
+        if metrics is None: metrics = self.getMetrics()
+
+        # stored metrics needed, including the parts of derived ones
+        needed = []
+        for metric in metrics:
+            parts = DERIVED_METRICS[metric] if metric in DERIVED_METRICS else (metric,)
+            for part in parts:
+                assert part in self.metrics, f"Metric <{part}> is not in the cube"
+                if part not in needed: needed.append(part)
+        metricCodes = np.flatnonzero(np.isin(self.metrics, needed))
+
+        mask = self._mask(dayIDs, periodIDs, students, metricCodes)
+        codesDF = pd.DataFrame({ col: self.columns[col][mask] for col in by + ["metric"] })
+        codesDF["value"] = self.columns["value"][mask]
+        # grand totals are a roll-up by a constant column
+        groupCols = by if len(by) > 0 else ["total"]
+        if len(by) == 0: codesDF["total"] = 0
+        summedDF = codesDF.groupby(groupCols + ["metric"], sort=True)["value"].sum().unstack("metric", fill_value=0.0)
+        summedDF = summedDF.reindex(columns=metricCodes, fill_value=0.0)
+        summedDF.columns = self.metrics[metricCodes]
+
+        rollUpDF = pd.DataFrame(index=summedDF.index)
+        for metric in metrics:
+            if metric in DERIVED_METRICS:
+                numerator, denominator = DERIVED_METRICS[metric]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    rollUpDF[metric] = summedDF[numerator] / summedDF[denominator].where(summedDF[denominator] != 0)
+            else: rollUpDF[metric] = summedDF[metric]
+        rollUpDF = rollUpDF.reset_index() if len(by) > 0 else rollUpDF.reset_index(drop=True)
+
+        # decode the dimension columns
+        for col in by:
+            if col == "studentID": rollUpDF[col] = self.students[rollUpDF[col].to_numpy()]
+            else: rollUpDF[col] = rollUpDF[col].astype(np.float64).where(rollUpDF[col] != MISSING_ID)
+
+        return rollUpDF
+
+    def toDF(self):
+        """
+        Returns the whole cube in long format
+        """
+        dayIDs = self.columns["dayID"].astype(np.float64)
+        periodIDs = self.columns["periodID"].astype(np.float64)
+        return pd.DataFrame({"dayID": np.where(dayIDs == MISSING_ID, np.nan, dayIDs),
+                             "periodID": np.where(periodIDs == MISSING_ID, np.nan, periodIDs),
+                             "studentID": self.students[np.asarray(self.columns["studentID"])],
+                             "metric": self.metrics[np.asarray(self.columns["metric"])],
+                             "value": np.asarray(self.columns["value"])})
+
+
+if __name__ == "__main__":
+
+    import tutorDataAPI as tutorAPI
+    from class_schedule import getRETTLSchedule
+
+    schedule = getRETTLSchedule()
+    tutorLogDF = tutorAPI.getAnnotatedTutorLogDF("raw data/tutor_log.tsv", schedule=schedule)
+    detectorResultsDF = detectorAPI.getDetectorResultsDF(schedule=schedule)
+    eventMasterDF = pd.read_csv("output_files/event_master_file_D10_R500_RNG1000_sprint2_shou.csv", index_col=False)
+
+    cubeDF = buildAnalyticsCube(tutorLogDF, detectorResultsDF, eventMasterDF)
+    writeAnalyticsCube(cubeDF, "output_files/analytics_cube")
+
+    # roll-ups for the reports
+    cube = AnalyticsCube("output_files/analytics_cube")
+    cube.rollUp(by=["periodID"]).to_csv("output_files/cube_by_period.csv", index=False)
+    cube.rollUp(by=["dayID"]).to_csv("output_files/cube_by_day.csv", index=False)
+    cube.rollUp(by=["studentID"]).to_csv("output_files/cube_by_student.csv", index=False)
@@ -0,0 +1,179 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Benchmark suite of the analytics APIs on synthetic data (synthetic_data.py).
+# At every scale (number of classrooms) a data set is generated, then the
+# loaders, the per-student tutor metrics, detector interval extraction and
+# stop detection are timed, and their peak memory is traced with tracemalloc
+# in a separate run so that tracing does not inflate the timings. Results are
+# written to a json file
+#
+# usage: python benchmark.py --scales 1 10 100 --output output_files/benchmark_results.json
+################################################################################
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import tutorDataAPI as tutorAPI
+import detectorDataAPI as detectorAPI
+import stop_detection as sd
+import synthetic_data
+from class_schedule import ClassSchedule
+
+DETECTORS = ["struggle", "idle", "misuse", "gaming"]
+STOP_DURATION, STOP_RADIUS = 10, 500 # stop detection parameters, in seconds and in unit of coordinates
+
+def measure(func, repeat=1, traceMemory=True):
+    """
+    Times a function call and traces its peak memory
+
+    Args:
+        func (callable): function without arguments
+        repeat (int, optional): number of timed calls. Defaults to 1.
+        traceMemory (bool, optional): whether to make one more call under tracemalloc. Defaults to True.
+
+    Returns:
+        (object, List[float], float): result of the last call, wall time of each timed call in seconds,
+            and peak memory allocated during the traced call in bytes (NaN if not traced)
+    """
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+
+    peakMemory = np.nan
+    if traceMemory:
+        tracemalloc.start()
+        try:
+            func()
+            peakMemory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return result, seconds, peakMemory
+
+def getBenchmarks(paths):
+    """
+    Benchmarks of one data set, as (group, name, function) tuples. Functions
+    of later groups use the data loaded by the loader benchmarks
+
+    Args:
+        paths (dict): paths returned by synthetic_data.writeSyntheticDataset()
+
+    Returns:
+        List[(str, str, callable)]: benchmarks to run in order
+    """
+
+    data = dict()
+    schedule = ClassSchedule.fromCSV(paths["schedule"])
+
+    def load(key, func):
+        def run():
+            data[key] = func()
+            return data[key]
+        return run
+
+    def stopArgs():
+        posDF = data["position"]
+        return posDF["chosen_X"], posDF["chosen_Y"], posDF["time_stamp"], posDF["periodID"], posDF["dayID"], STOP_DURATION, STOP_RADIUS
+
+    benchmarks = [
+        ("loader", "getAnnotatedTutorLogDF", load("tutor", lambda: tutorAPI.getAnnotatedTutorLogDF(paths["tutorLog"], schedule=schedule))),
+        ("loader", "transformRawDetectorResults", load("detector", lambda: detectorAPI.transformRawDetectorResults(paths["detectorResults"], schedule=schedule))),
+        ("loader", "getTeacherPositionDF", load("position", lambda: sd.getTeacherPositionDF(paths["teacherPosition"], schedule=schedule)))
+    ]
+
+    for func in [tutorAPI.getIncorrectCount, tutorAPI.getFirstAttemptPerf, tutorAPI.getAvgCorrectStepDuration,
+                 tutorAPI.getAvgErrorStepDuration, tutorAPI.getAvgHintDurationPerStep, tutorAPI.getAssistanceScorePerStep]:
+        benchmarks.append(("per-student metric", func.__name__, lambda func=func: func(data["tutor"])))
+
+    benchmarks += [
+        ("interval extraction", "getStartEndEvents", lambda: detectorAPI.getStartEndEvents(data["detector"], DETECTORS)),
+        ("stop detection", "getStops", lambda: sd.getStops(*stopArgs())),
+        ("stop detection", "getStopsFast", lambda: sd.getStopsFast(*stopArgs()))
+    ]
+
+    return benchmarks
+
+def runBenchmarks(scales, repeat=1, traceMemory=True, seed=0, directory=None, **datasetKwargs):
+    """
+    Runs the benchmark suite at every scale
+
+    Args:
+        scales (Iterable[int]): numbers of classrooms
+        repeat (int, optional): number of timed runs of each benchmark. Defaults to 1.
+        traceMemory (bool, optional): whether to measure peak memory. Defaults to True.
+        seed (int, optional): seed of the synthetic data. Defaults to 0.
+        directory (str, optional): where to write the synthetic data sets. Defaults to a temporary directory.
+        datasetKwargs: passed to synthetic_data.writeSyntheticDataset()
+
+    Returns:
+        List[dict]: one record per (scale, benchmark)
+    """
+
+    # the loader benchmarks encode the detector results themselves
+    datasetKwargs.setdefault("encodeDetectorResults", False)
+    results = []
+    with tempfile.TemporaryDirectory() as tempDirectory:
+        for scale in scales:
+            datasetDirectory = os.path.join(directory or tempDirectory, f"classrooms_{scale}")
+            paths = synthetic_data.writeSyntheticDataset(datasetDirectory, scale, seed=seed, **datasetKwargs)
+
+            for group, name, func in getBenchmarks(paths):
+                result, seconds, peakMemory = measure(func, repeat=repeat, traceMemory=traceMemory)
+                results.append({"numOfClassrooms": scale,
+                                "group": group,
+                                "benchmark": name,
+                                "numOfResults": len(result),
+                                "seconds": seconds,
+                                "minSeconds": min(seconds),
+                                "peakMemoryMB": None if np.isnan(peakMemory) else peakMemory / 2**20})
+                print(f"[{scale} classrooms] {name}: {min(seconds):.3f} s" +
+                      ("" if np.isnan(peakMemory) else f", {peakMemory / 2**20:.1f} MB"))
+
+    return results
+
+def writeResults(results, path, **meta):
+    """
+    Writes benchmark results to a json file, together with the environment
+    they were measured in
+    """
+
+    directory = os.path.dirname(path)
+    if directory != "": os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as resultFile:
+        json.dump({"meta": dict(date=datetime.now().isoformat(timespec="seconds"),
+                                python=sys.version.split()[0],
+                                numpy=np.__version__,
+                                pandas=pd.__version__,
+                                platform=platform.platform(),
+                                cpuCount=os.cpu_count(),
+                                **meta),
+                   "results": results}, resultFile, indent=2)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks the analytics APIs on synthetic data")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 5, 20], help="numbers of classrooms")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs of each benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--data-dir", default=None, help="keep the synthetic data sets in this directory")
+    parser.add_argument("--output", default="output_files/benchmark_results.json")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.scales, repeat=args.repeat, traceMemory=not args.no_memory,
+                            seed=args.seed, directory=args.data_dir)
+    writeResults(results, args.output, scales=args.scales, repeat=args.repeat, seed=args.seed)
+    print("Results written to", args.output)
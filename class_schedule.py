@@ -0,0 +1,190 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# This module holds the day/period windows of the experiment and assigns dayID
+# and periodID to epoch time stamps. The tutor log, detector results and
+# teacher position traces should all be annotated by one ClassSchedule object
+# so that they agree on which class session each record belongs to
+################################################################################
+
+import pandas as pd
+import numpy as np
+import tutorDataAPI as tutorAPI
+
+class ClassSchedule:
+
+    """
+    A table of class windows, where each window is a (dayID, periodID, start,
+    end) row and start/end are epoch time stamps (both inclusive). Windows are
+    kept sorted by start time so that whole arrays of time stamps can be
+    assigned to windows by binary search instead of scanning every window for
+    every row
+    """
+
+    def __init__(self, dayIDs, periodIDs, starts, ends):
+
+        # input check
+        assert len(dayIDs) == len(periodIDs) == len(starts) == len(ends), \
+               "Schedule columns should be of the same length"
+        assert len(starts) > 0, "Schedule should have at least one window"
+
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        order = np.argsort(starts, kind="stable") # sort windows by start time
+
+        self.dayIDs = np.asarray(dayIDs)[order]
+        self.periodIDs = np.asarray(periodIDs)[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+
+        assert np.all(self.ends >= self.starts), "Window end is earlier than window start"
+        # binary search below relies on windows not overlapping each other
+        assert np.all(self.starts[1:] > self.ends[:-1]), "Windows in the schedule are overlapping"
+
+    @classmethod
+    def fromDF(cls, scheduleDF, dayCol="dayID", periodCol="periodID",
+               startCol="start", endCol="end", format="%Y-%m-%d %H:%M:%S"):
+        """
+        Builds a schedule from a table of windows. Start and end values may be
+        epoch time stamps or EDT date-time strings
+
+        Args:
+            scheduleDF (pandas.DataFrame): one row per window
+            dayCol (str, optional): day ID column name. Defaults to "dayID".
+            periodCol (str, optional): period ID column name. Defaults to "periodID".
+            startCol (str, optional): window start column name. Defaults to "start".
+            endCol (str, optional): window end column name. Defaults to "end".
+            format (str, optional): date-time string format, only used if start/end are strings. Defaults to "%Y-%m-%d %H:%M:%S".
+
+        Returns:
+            ClassSchedule: schedule holding the windows in scheduleDF
+        """
+
+        def toEpoch(col):
+            # date-time strings are in EDT, same as the hand-written schedules in the notebooks
+            if pd.api.types.is_numeric_dtype(col): return col.to_numpy(dtype=np.float64)
+            return np.array([tutorAPI.EDTDatetime2epoch(s, format=format) for s in col])
+
+        return cls(scheduleDF[dayCol].to_numpy(),
+                   scheduleDF[periodCol].to_numpy(),
+                   toEpoch(scheduleDF[startCol]),
+                   toEpoch(scheduleDF[endCol]))
+
+    @classmethod
+    def fromCSV(cls, path, delimiter=",", **kwargs):
+        """
+        Reads a schedule file with `dayID`, `periodID`, `start` and `end`
+        columns. Keyword arguments are passed to ClassSchedule.fromDF()
+        """
+        scheduleDF = pd.read_csv(path, delimiter=delimiter, index_col=False)
+        return cls.fromDF(scheduleDF, **kwargs)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def toDF(self):
+        """
+        Returns the schedule as a dataframe with `dayID`, `periodID`, `start`
+        and `end` columns, sorted by start time
+        """
+        return pd.DataFrame({"dayID": self.dayIDs,
+                             "periodID": self.periodIDs,
+                             "start": self.starts,
+                             "end": self.ends})
+
+    def getWindowIndex(self, timestamps):
+        """
+        Finds the window each time stamp falls in
+
+        Args:
+            timestamps (Iterable[float]): epoch time stamps, need not be sorted
+
+        Returns:
+            numpy.ndarray: index of the window (row in toDF()) for each time stamp; -1 if not in any window
+        """
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        # last window starting at or before each time stamp
+        ind = np.searchsorted(self.starts, timestamps, side="right") - 1
+        clipped = np.clip(ind, 0, len(self.starts) - 1)
+        inWindow = (ind >= 0) & (timestamps <= self.ends[clipped])
+
+        return np.where(inWindow, ind, -1)
+
+    def assignDayPeriod(self, timestamps):
+        """
+        Vectorized replacement of the getDayPeriod() helper in the notebooks
+
+        Args:
+            timestamps (Iterable[float]): epoch time stamps
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): dayID and periodID arrays of the same length as timestamps; NaN if the time stamp is not in any day/period
+        """
+
+        ind = self.getWindowIndex(timestamps)
+        inWindow = ind >= 0
+        dayIDs = np.full(len(ind), np.nan)
+        periodIDs = np.full(len(ind), np.nan)
+        dayIDs[inWindow] = self.dayIDs[ind[inWindow]]
+        periodIDs[inWindow] = self.periodIDs[ind[inWindow]]
+
+        return dayIDs, periodIDs
+
+    def annotateDF(self, DF, timestampCol="timestamp", dayCol="dayID", periodCol="periodID", dropOutside=False):
+        """
+        Returns a copy of DF with day and period ID columns assigned from the
+        time stamp column
+
+        Args:
+            DF (pandas.DataFrame): any dataframe with an epoch time stamp column
+            timestampCol (str, optional): time stamp column name. Defaults to "timestamp".
+            dayCol (str, optional): output day ID column name. Defaults to "dayID".
+            periodCol (str, optional): output period ID column name. Defaults to "periodID".
+            dropOutside (bool, optional): whether to drop rows outside of every window. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: annotated dataframe
+        """
+
+        assert timestampCol in DF.columns, f"Time stamp column <{timestampCol}> not found"
+
+        annotatedDF = DF.copy()
+        dayIDs, periodIDs = self.assignDayPeriod(annotatedDF[timestampCol])
+        annotatedDF[dayCol] = dayIDs
+        annotatedDF[periodCol] = periodIDs
+
+        if dropOutside:
+            annotatedDF = annotatedDF.loc[annotatedDF[dayCol].notnull()]
+
+        return annotatedDF
+
+
+def getRETTLSchedule():
+    """
+    Returns the day/period windows of the May 23-25, 2022 RETTL study, i.e.
+    the 3x5 grid hard-coded as getDayPeriod() in the notebooks
+    """
+
+    dates = ["2022-05-23", "2022-05-24", "2022-05-25"]
+                  # period1   period2    period3    period4    period5
+    startTimes = [ ["08:26:00", "10:13:00", "11:05:00", "12:36:00", "14:17:00"], # day1
+                   ["08:21:00", "10:02:00", "10:57:00", "12:24:00", "14:07:00"], # day2
+                   ["08:21:00", "10:01:00", "10:55:00", "12:24:00", "14:07:00"] ] # day3
+    endTimes =   [ ["08:53:00", "10:41:00", "11:30:00", "13:00:00", "14:40:00"], # day1
+                   ["08:43:00", "10:27:00", "11:15:00", "12:48:00", "14:30:00"], # day2
+                   ["08:43:00", "10:24:00", "11:18:00", "12:47:00", "14:30:00"] ] # day3
+
+    dayIDs, periodIDs, starts, ends = [], [], [], []
+    for day in range(len(dates)):
+        for period in range(len(startTimes[day])):
+            # counting from 1 for day and period ID's
+            dayIDs.append(day + 1)
+            periodIDs.append(period + 1)
+            starts.append(dates[day] + " " + startTimes[day][period])
+            ends.append(dates[day] + " " + endTimes[day][period])
+
+    return ClassSchedule.fromDF(pd.DataFrame({"dayID": dayIDs,
+                                              "periodID": periodIDs,
+                                              "start": starts,
+                                              "end": ends}))
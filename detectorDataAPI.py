@@ -13,8 +13,10 @@ import pandas as pd
 import numpy as np 
 from datetime import datetime, timezone, timedelta
 import os
+from profiling import instrument, section
 
-def transformRawDetectorResults(path: str): 
+@instrument
+def transformRawDetectorResults(path: str, schedule=None): 
 
     """
     Given the path to a directory, this function reads and combines the raw 
@@ -23,6 +25,7 @@ def transformRawDetectorResults(path: str):
 
     Args:
         path (str): path to directory holding the detector output tsv files
+        schedule (ClassSchedule, optional): if given, `dayID` and `periodID` columns are assigned from it. Defaults to None.
 
     Returns:
         pandas.DataFrame: dataframe with all students' status at some transaction's timestamp 
@@ -41,7 +44,8 @@ def transformRawDetectorResults(path: str):
     fetchedDetectors = []
     for fileName in fileNames: 
         fullPath = path + "/" + fileName
-        DF = pd.read_csv(fullPath, delimiter="\t", index_col=False) 
+        with section("detectorDataAPI.transformRawDetectorResults: read_csv"): 
+            DF = pd.read_csv(fullPath, delimiter="\t", index_col=False) 
         detectorName = DF.loc[0, "Detector_Name"] # get detector name of the file
         assert detectorName in nameMapping, f"Encountered unexpeted detector: {detectorName}" # safety 
         newDetectorName = nameMapping[detectorName] # get shorter name of detector
@@ -72,9 +76,10 @@ def transformRawDetectorResults(path: str):
     studentStatusDF = pd.DataFrame() 
     # here we are going to get only the first string value in each student-time 
     # pair, since there may be multiple for on column
-    for name in shortNames: 
-        if name in pd.unique(detectorDF.columns): 
-            studentStatusDF[name] = studentTimePairs[name].apply(getFirstStringInIterable)
+    with section("detectorDataAPI.transformRawDetectorResults: first strings", rows=len(detectorDF)): 
+        for name in shortNames: 
+            if name in pd.unique(detectorDF.columns): 
+                studentStatusDF[name] = studentTimePairs[name].apply(getFirstStringInIterable)
 
     # extract studentID and time from group column 
     studentIDs = [] 
@@ -108,7 +113,8 @@ def transformRawDetectorResults(path: str):
         return timestamp 
 
     # transform UTC date-time to epoch time stamp 
-    studentStatusDF["timestamp"] = studentStatusDF["time"].apply(lambda x: UTCDatetime2epoch(x, format="%Y-%m-%dT%H:%M:%S.%fZ"))
+    with section("detectorDataAPI.transformRawDetectorResults: strptime", rows=len(studentStatusDF)): 
+        studentStatusDF["timestamp"] = studentStatusDF["time"].apply(lambda x: UTCDatetime2epoch(x, format="%Y-%m-%dT%H:%M:%S.%fZ"))
 
     # re-order the columns so that it looks better 
     reorderedCols = ['studentID', 'time', 'time_zone', 'timestamp'] + fetchedDetectors
@@ -149,13 +155,33 @@ def transformRawDetectorResults(path: str):
     encodedDF = studentStatusDF.replace(encoding)
     encodedDF = encodedDF.sort_values("timestamp")
 
+    # assign day and period ID's with the shared class schedule 
+    if schedule is not None: encodedDF = schedule.annotateDF(encodedDF, timestampCol="timestamp")
+
     return encodedDF
 
 
-def getDetectorResultsDF(path="output_files/detector_results.csv", delimiter=","): 
+@instrument
+def getDetectorResultsDF(path="output_files/detector_results.csv", delimiter=",", schedule=None): 
+
+    """
+    Reads in the encoded detector results data file 
+
+    Args:
+        path (str, optional): path to detector results file. Defaults to "output_files/detector_results.csv".
+        delimiter (str, optional): Defaults to ",".
+        schedule (ClassSchedule, optional): if given, `dayID` and `periodID` columns are (re-)assigned from it, so that 
+            files without these columns can be read in as well. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: detector results dataframe
+    """
 
     DF = pd.read_csv(path, delimiter=delimiter, index_col=False)
 
+    # assign day and period ID's with the shared class schedule 
+    if schedule is not None: DF = schedule.annotateDF(DF, timestampCol="timestamp")
+
     # ensure that necessary columns are in DF 
     assert "studentID" in DF.columns and "timestamp" in DF.columns and \
            "dayID" in DF.columns and "periodID" in DF.columns, \
@@ -163,6 +189,7 @@ def getDetectorResultsDF(path="output_files/detector_results.csv", delimiter=","
 
     return DF 
 
+@instrument
 def getStatusStartEndTime(detectorResultsDF, studentID: str, detectorName: str): 
 
     """
@@ -240,6 +267,7 @@ def getStatusStartEndTime(detectorResultsDF, studentID: str, detectorName: str):
     return intervals
 
 
+@instrument
 def getStartEndEvents(detectorResultsDF, detectorNames: 'list[str]'): 
     """
     As requested by Yeyu, we developed a new event format, where each event will 
@@ -306,6 +334,7 @@ def getStartEndEvents(detectorResultsDF, detectorNames: 'list[str]'):
     return res 
 
 
+@instrument
 def getDetectorEvents(detectorResultsDF, detectorNames): 
 
     """
@@ -348,6 +377,7 @@ def getDetectorEvents(detectorResultsDF, detectorNames):
 
     return detectorEventsDF
 
+@instrument
 def getStudentStatusDurationByDetector(detectorResultsDF, detectorName: str, studentID: str, periodID=None, dayID=None) -> float: 
 
     """
@@ -396,6 +426,7 @@ def getStudentStatusDurationByDetector(detectorResultsDF, detectorName: str, stu
 
     return res 
 
+@instrument
 def getStudentStatusDurationByDetector2(detectorResultsDF, detectorName: str, studentID: str, periodID=None, dayID=None) -> float: 
 
     """
@@ -477,6 +508,60 @@ def getStudentStatusDurationByDetector2(detectorResultsDF, detectorName: str, st
 
     return res 
 
+@instrument
+def annotateTutorLogWithDetectors(tutorLogDF, detectorResultsDF, detectorNames=["idle", "struggle", "gaming", "misuse"], 
+                                  tolerance=None, studentCol="Anon Student Id"): 
+
+    """
+    Annotates every tutor transaction with the student's current level of each 
+    detector, i.e. the last non-NaN detector value of the student at or before 
+    the transaction. This is a sorted as-of join by student, one per detector, 
+    so it takes O((n+m) log(n+m)) for n transactions and m detector rows, 
+    instead of scanning each student's intervals 
+
+    Args:
+        tutorLogDF (pandas.DataFrame): usually returned by tutorDataAPI.getAnnotatedTutorLogDF()
+        detectorResultsDF (pandas.DataFrame): encoded detector results, usually returned by getDetectorResultsDF()
+        detectorNames (List[str], optional): detector columns of detectorResultsDF. Defaults to ["idle", "struggle", "gaming", "misuse"].
+        tolerance (float, optional): detector values older than this many seconds are considered stale and not used. 
+            Defaults to None, i.e. no limit.
+        studentCol (str, optional): student ID column of tutorLogDF. Defaults to "Anon Student Id".
+
+    Returns:
+        pandas.DataFrame: copy of tutorLogDF with one column per detector, holding the detector level at the 
+        transaction; NaN if the student has no (fresh enough) detector value yet 
+    """
+
+    for detectorName in detectorNames: 
+        assert detectorName in detectorResultsDF.columns, "Detector specified in parameter not present in input dataframe"
+    assert tolerance is None or tolerance >= 0, "Tolerance should be non-negative"
+
+    # transactions sorted by time, rows without a timestamp are never matched 
+    timestamps = tutorLogDF["timestamp"].to_numpy(dtype=np.float64)
+    isTimed = ~np.isnan(timestamps)
+    transactionsDF = pd.DataFrame({"row": np.flatnonzero(isTimed), 
+                                   "student": tutorLogDF[studentCol].to_numpy(dtype=object)[isTimed], 
+                                   "timestamp": timestamps[isTimed]}) 
+    transactionsDF = transactionsDF.sort_values("timestamp", kind="stable") 
+
+    annotatedDF = tutorLogDF.copy()
+    for detectorName in detectorNames: 
+        # only rows carrying a value of this detector change its state 
+        isValued = detectorResultsDF[detectorName].notnull().to_numpy() 
+        levelsDF = pd.DataFrame({"student": detectorResultsDF["studentID"].to_numpy(dtype=object)[isValued], 
+                                 "timestamp": detectorResultsDF["timestamp"].to_numpy(dtype=np.float64)[isValued], 
+                                 "level": detectorResultsDF[detectorName].to_numpy(dtype=np.float64)[isValued]}) 
+        levelsDF = levelsDF.loc[levelsDF["timestamp"].notnull()].sort_values("timestamp", kind="stable") 
+
+        joinedDF = pd.merge_asof(transactionsDF, levelsDF, on="timestamp", by="student", direction="backward", 
+                                 tolerance=None if tolerance is None else float(tolerance)) 
+
+        levels = np.full(len(tutorLogDF), np.nan) 
+        levels[joinedDF["row"].to_numpy()] = joinedDF["level"].to_numpy() 
+        annotatedDF[detectorName] = levels 
+
+    return annotatedDF 
+
 # test cases 
 if __name__ == "__main__": 
 
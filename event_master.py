@@ -0,0 +1,323 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Builder of the multimodal event master file, following the steps of
+# merge_modalities.ipynb. Modality streams are already sorted by time stamp,
+# so they are merged by rank instead of sorting the concatenated frame. Seat
+# numbers are resolved with hash lookups over whole columns, tutor
+# event names are rewritten with string masks, and multi-subject rows are
+# split with a single explode
+################################################################################
+
+import argparse
+import numpy as np
+import pandas as pd
+import stop_detection as sd
+import detectorDataAPI as detectorAPI
+from spatial_index import ClassroomObjectIndex
+from id_resolution import StudentIDResolver
+
+def mergeSortedStreams(DFs, timestampCol="timestamp"):
+    """
+    Merges dataframes sorted by time stamp into one sorted dataframe. The
+    position of a row in the output is its position in its own stream plus
+    the number of rows before it in every other stream, which is found by
+    binary search, so no global sort is needed. Rows with equal time stamps
+    are kept in stream order. A stream that is not sorted is (stably) sorted
+    on its own first
+
+    Args:
+        DFs (List[pandas.DataFrame]): event streams, e.g. tutor, position and observation events
+        timestampCol (str, optional): time stamp column name. Defaults to "timestamp".
+
+    Returns:
+        pandas.DataFrame: concatenation of the streams in time order, re-indexed from 0
+    """
+
+    streams = [] # (sorted time stamps, row order within the stream)
+    for DF in DFs:
+        timestamps = DF[timestampCol].to_numpy(dtype=np.float64) if len(DF) > 0 else np.zeros(0)
+        if DF[timestampCol].is_monotonic_increasing or len(DF) == 0: order = np.arange(len(timestamps))
+        else: order = np.argsort(timestamps, kind="stable")
+        streams.append((timestamps[order], order))
+
+    total = sum(len(timestamps) for timestamps, order in streams)
+    rowOrder = np.empty(total, dtype=np.int64)
+    offset = 0
+    for s, (timestamps, order) in enumerate(streams):
+        positions = np.arange(len(timestamps))
+        for t, (otherTimestamps, otherOrder) in enumerate(streams):
+            if t == s: continue
+            # rows of earlier streams go first on ties
+            positions = positions + np.searchsorted(otherTimestamps, timestamps, side="right" if t < s else "left")
+        rowOrder[positions] = offset + order
+        offset += len(timestamps)
+
+    mergedDF = pd.concat(DFs, ignore_index=True)
+    return mergedDF.take(rowOrder).reset_index(drop=True)
+
+def resolveSeatNumbers(eventMasterDF, mappingDF, resolver=None):
+    """
+    Replaces seat numbers in the `actor` and `subject` columns with anon user
+    ID's of the students seated there during the row's day and period, same as
+    the seat mapping loop in merge_modalities.ipynb. Multiple subjects are
+    separated by "; " in the output
+
+    Args:
+        eventMasterDF (pandas.DataFrame): event master data with `dayID`, `periodID`, `actor` and `subject` columns
+        mappingDF (pandas.DataFrame): student seat mapping, e.g. output_files/student_position_sprint1_shou.csv
+        resolver (StudentIDResolver, optional): index of mappingDF, built from it if not given. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: copy of eventMasterDF with seat numbers resolved
+    """
+
+    eventMasterDF = eventMasterDF.copy()
+    if resolver is None: resolver = StudentIDResolver(mappingDF)
+    dayIDs, periodIDs = eventMasterDF["dayID"].to_numpy(), eventMasterDF["periodID"].to_numpy()
+
+    # seat numbers are all-digit actors
+    actors = eventMasterDF["actor"].map(str) # same as str() in the notebook, NaN becomes "nan"
+    isSeat = actors.str.isdigit().to_numpy(dtype=bool)
+    if np.any(isSeat):
+        seatActors = actors.to_numpy(dtype=object)[isSeat]
+        anonIDs = resolver.getAnonIDsBySeat(seatActors, dayIDs[isSeat], periodIDs[isSeat])
+        newActors = eventMasterDF["actor"].to_numpy(dtype=object).copy()
+        newActors[isSeat] = np.where(anonIDs == "", seatActors + ", but no student seated", anonIDs)
+        eventMasterDF["actor"] = newActors
+
+    # and subjects that are not all letters, one or more seats separated by ";"
+    subjects = eventMasterDF["subject"].map(str)
+    isSeat = (~subjects.str.isalpha()).to_numpy(dtype=bool)
+    if np.any(isSeat):
+        seatsDF = pd.DataFrame({"seat": subjects[isSeat].str.split(";").to_numpy(),
+                                "dayID": dayIDs[isSeat], "periodID": periodIDs[isSeat],
+                                "row": np.flatnonzero(isSeat)}).explode("seat")
+        # seat numbers maybe '3.0'
+        seatNums = pd.to_numeric(seatsDF["seat"], errors="coerce").to_numpy(dtype=np.float64)
+        assert not np.any(np.isnan(seatNums)), "Subject seat numbers should be numeric"
+        anonIDs = resolver.getAnonIDsBySeat(seatNums, seatsDF["dayID"].to_numpy(), seatsDF["periodID"].to_numpy())
+        seatStrs = seatNums.astype(np.int64).astype(str).astype(object)
+        seatsDF["seat"] = np.where(anonIDs == "", seatStrs + ", but no student seated", anonIDs)
+
+        newSubjects = eventMasterDF["subject"].to_numpy(dtype=object).copy()
+        newSubjects[isSeat] = seatsDF.groupby("row", sort=True)["seat"].agg("; ".join).to_numpy()
+        eventMasterDF["subject"] = newSubjects
+
+    return eventMasterDF
+
+def _contains(col, pattern):
+    """
+    Boolean mask of rows whose value is a string containing pattern
+    """
+    if not (pd.api.types.is_object_dtype(col) or pd.api.types.is_string_dtype(col)): return np.zeros(len(col), dtype=bool)
+    return col.str.contains(pattern, regex=False, na=False).to_numpy(dtype=bool)
+
+def renameTutorEvents(eventMasterDF):
+    """
+    Renames ATTEMPT events to "Correct attempt" or "Incorrect attempt" by
+    their content, and HINT_REQUEST events to "Hint request", same as the
+    renaming loop in merge_modalities.ipynb
+
+    Returns:
+        pandas.DataFrame: copy of eventMasterDF with tutor events renamed
+    """
+
+    eventMasterDF = eventMasterDF.copy()
+    isIncorrect = _contains(eventMasterDF["content"], "INCORRECT")
+    isCorrect = ~isIncorrect & _contains(eventMasterDF["content"], "CORRECT")
+
+    # safety check
+    isAttempt = isIncorrect | isCorrect
+    assert np.all(eventMasterDF["event"].to_numpy()[isAttempt] == "ATTEMPT") and \
+           np.all(eventMasterDF["modality"].to_numpy()[isAttempt] == "tutor")
+
+    events = eventMasterDF["event"].to_numpy(dtype=object).copy()
+    events[isIncorrect] = "Incorrect attempt"
+    events[isCorrect] = "Correct attempt"
+    events[events == "HINT_REQUEST"] = "Hint request"
+    eventMasterDF["event"] = events
+
+    return eventMasterDF
+
+def splitSubjects(eventMasterDF, sep=";"):
+    """
+    Splits talking and stopping events with multiple subjects into one row
+    per subject, same as the splitting loop in merge_modalities.ipynb. Split
+    rows stay where the original row was, so the output is still in time order
+
+    Returns:
+        pandas.DataFrame: event master data with one subject per talking/stopping row, re-indexed from 0
+    """
+
+    isGroupEvent = _contains(eventMasterDF["event"], "Talking to small group") | \
+                   _contains(eventMasterDF["event"], "Talking to student") | \
+                   _contains(eventMasterDF["event"], "Stopping")
+    subjects = eventMasterDF["subject"]
+    isStr = subjects.str.len().notna().to_numpy() if pd.api.types.is_object_dtype(subjects) or pd.api.types.is_string_dtype(subjects) \
+            else np.zeros(len(subjects), dtype=bool)
+    isSplit = isGroupEvent & isStr
+
+    newSubjects = subjects.to_numpy(dtype=object).copy()
+    newSubjects[isSplit] = subjects[isSplit].str.split(sep).to_numpy()
+    eventMasterDF = eventMasterDF.assign(subject=newSubjects)
+
+    return eventMasterDF.explode("subject", ignore_index=True)
+
+
+################################################################################
+# Modality streams
+################################################################################
+
+def getFirstWord(s):
+    """
+    Returns the part of s before the first space
+    """
+    return s.split(" ", 1)[0]
+
+def getPositionEventsDF(positionRawDF, objPos, duration, radius, rng):
+    """
+    Teacher position events in event-actor-subject format, same as the
+    position chunk of merge_modalities.ipynb
+
+    Args:
+        positionRawDF (pandas.DataFrame): teacher position data, usually returned by stop_detection.getTeacherPositionDF()
+        objPos (pandas.DataFrame): seating chart with `object`, `X` and `Y` columns, and optionally `dayID` and `periodID`
+        duration (float): stop duration parameter, in seconds
+        radius (float): stop radius parameter, in milimeter
+        rng (float): seats within this distance from a stop centroid are the subjects of the stop
+
+    Returns:
+        pandas.DataFrame: position events
+    """
+
+    stops = sd.getStopsFast(positionRawDF.chosen_X, positionRawDF.chosen_Y, positionRawDF.time_stamp,
+                            positionRawDF.periodID, positionRawDF.dayID, duration, radius)
+    labels = sd.getStopLabels(positionRawDF.time_stamp, stops)
+    events, centroids = sd.getStopEventsFromLabels(positionRawDF.chosen_X, positionRawDF.chosen_Y, labels)
+
+    positionEventsDF = pd.DataFrame()
+    positionEventsDF["timestamp"] = positionRawDF["time_stamp"].to_numpy()
+    positionEventsDF["dayID"] = positionRawDF["dayID"].to_numpy()
+    positionEventsDF["periodID"] = positionRawDF["periodID"].to_numpy()
+    positionEventsDF["event"] = [ getFirstWord(event) for event in events ]
+    positionEventsDF["actor"] = "teacher"
+    # a seating chart with dayID/periodID columns is looked up by the class session of each row
+    objIndex = ClassroomObjectIndex(objPos)
+    keys = [ positionRawDF[col].to_numpy() for col in objIndex.keyCols ] if len(objIndex.keyCols) > 0 else None
+    positionEventsDF["subject"] = objIndex.getObjsInRange(centroids, rng, keys=keys)
+    positionEventsDF["content"] = events
+    positionEventsDF["modality"] = "position" # add tag for modality origin
+
+    return positionEventsDF
+
+def getObservationEventsDF(path="output_files/observation_events.tsv"):
+    """
+    Observation events in event-actor-subject format, same as the
+    observation chunk of merge_modalities.ipynb
+    """
+
+    obsEventsDF = pd.read_csv(path, delimiter="\t", index_col=False)
+    obsEventsDF = obsEventsDF.loc[obsEventsDF["event"] != "Period begins"] # do not want this signaling event
+    obsEventsDF = obsEventsDF.drop(["time", "note", "where", "keyword"], axis=1)
+    obsEventsDF["modality"] = "observation" # add tag for modality origin
+
+    return obsEventsDF
+
+def distillTutorEvents(tutorLogDF, schedule):
+    """
+    Tutor events in event-actor-subject format, same as tutor_distill.ipynb:
+    attempts with a result and hint requests with a hint message, within
+    the class windows of the schedule
+
+    Args:
+        tutorLogDF (pandas.DataFrame): tutor log with `timestamp` column, usually returned by tutorDataAPI.getAnnotatedTutorLogDF()
+        schedule (ClassSchedule): class windows, e.g. class_schedule.getRETTLSchedule()
+
+    Returns:
+        pandas.DataFrame: tutor events with `dayID`, `periodID`, `timestamp`, `event`, `actor`, `subject` and `content` columns
+    """
+
+    isAttempt = (tutorLogDF["Student Response Type"] == "ATTEMPT") & (tutorLogDF["Tutor Response Type"] == "RESULT")
+    isHint = (tutorLogDF["Student Response Type"] == "HINT_REQUEST") & (tutorLogDF["Tutor Response Type"] == "HINT_MSG")
+    dayIDs, periodIDs = schedule.assignDayPeriod(tutorLogDF["timestamp"])
+    isEvent = (isAttempt | isHint).to_numpy() & ~np.isnan(dayIDs)
+
+    eventsDF = tutorLogDF.loc[isEvent]
+    isAttempt, isHint = isAttempt.loc[isEvent], isHint.loc[isEvent]
+    assert eventsDF.loc[isAttempt, "Outcome"].isin(["CORRECT", "INCORRECT"]).all() # safety check
+    assert (eventsDF.loc[isHint, "Outcome"] == "HINT").all() # safety check
+
+    level = "problem level is " + eventsDF["Level (ProblemSet)"]
+    content = ("Outcome is " + eventsDF["Outcome"] + "; student input is " + eventsDF["Input"] + "; " + level).where(isAttempt,
+              "Hint message is " + eventsDF["Feedback Text"] + "; " + level)
+
+    return pd.DataFrame({"dayID": dayIDs[isEvent].astype(int),
+                         "periodID": periodIDs[isEvent].astype(int),
+                         "timestamp": eventsDF["timestamp"].to_numpy(),
+                         "event": eventsDF["Student Response Type"].to_numpy(),
+                         "actor": eventsDF["Anon Student Id"].to_numpy(),
+                         "subject": "tutor",
+                         "content": content.to_numpy()})
+
+def getTutorEventsDF(path="output_files/tutor_events.csv"):
+    """
+    Tutor events distilled by tutor_distill.ipynb
+    """
+
+    tutorEventsDF = pd.read_csv(path)
+    tutorEventsDF["modality"] = "tutor" # add tag for modality origin
+
+    return tutorEventsDF
+
+def buildEventMaster(tutorEventsDF, positionEventsDF, obsEventsDF, mappingDF, detectorEventsDF=None):
+    """
+    Builds the event master data from the modality streams, same as the
+    event master chunks of merge_modalities.ipynb. Rows with equal time
+    stamps are in tutor, position, observation, detector order
+
+    Args:
+        tutorEventsDF (pandas.DataFrame): usually returned by getTutorEventsDF()
+        positionEventsDF (pandas.DataFrame): usually returned by getPositionEventsDF()
+        obsEventsDF (pandas.DataFrame): usually returned by getObservationEventsDF()
+        mappingDF (pandas.DataFrame): student seat mapping
+        detectorEventsDF (pandas.DataFrame, optional): usually returned by detectorDataAPI.getDetectorEvents(). Defaults to None.
+
+    Returns:
+        pandas.DataFrame: event master data
+    """
+
+    eventMasterDF = mergeSortedStreams([tutorEventsDF, positionEventsDF, obsEventsDF])
+    eventMasterDF = resolveSeatNumbers(eventMasterDF, mappingDF)
+    eventMasterDF = renameTutorEvents(eventMasterDF)
+    eventMasterDF = splitSubjects(eventMasterDF)
+
+    if detectorEventsDF is not None:
+        eventMasterDF = mergeSortedStreams([eventMasterDF, detectorEventsDF])
+
+    return eventMasterDF
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Builds the event master file of the sprint 1 data")
+    parser.add_argument("--duration", type=float, default=10, help="stop duration, in seconds")
+    parser.add_argument("--radius", type=float, default=500, help="stop radius, in milimeter")
+    parser.add_argument("--rng", type=float, default=1000, help="seats within this distance from a stop centroid are its subjects")
+    args = parser.parse_args()
+    # integral values keep the file names of the notebook, e.g. D10_R500_RNG1000
+    duration, radius, rng = [ int(value) if value == int(value) else value for value in [args.duration, args.radius, args.rng] ]
+
+    positionRawDF = pd.read_csv("output_files/teacher_position_sprint1_shou.csv", index_col=False)
+    objPos = pd.read_csv("raw data/seating_chart_x_y_seat_only_sprint1_shou.csv", index_col=False)
+    mappingDF = pd.read_csv("output_files/student_position_sprint1_shou.csv", index_col=False)
+    detectorEventsDF = detectorAPI.getDetectorEvents(detectorAPI.getDetectorResultsDF(), ["struggle", "idle", "misuse", "gaming"])
+
+    eventMasterDF = buildEventMaster(getTutorEventsDF(),
+                                     getPositionEventsDF(positionRawDF, objPos, duration, radius, rng),
+                                     getObservationEventsDF(),
+                                     mappingDF,
+                                     detectorEventsDF)
+
+    outputFilePath = f"output_files/event_master_file_D{duration}_R{radius}_RNG{rng}_sprint2_shou.csv"
+    eventMasterDF.to_csv(outputFilePath, index=False)
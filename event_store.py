@@ -0,0 +1,222 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Columnar store for event-actor-subject data, i.e. the event master files of
+# merge_modalities.ipynb / event_master.py and the start/end events returned by
+# detectorDataAPI.getStartEndEvents(). Rows are partitioned by (dayID,
+# periodID, modality) and sorted by time within each partition. Every column
+# is saved as one .npy file per partition; string columns are dictionary-
+# encoded into int32 codes shared by all partitions. The manifest keeps a zone
+# map of each partition (time range, event and actor codes), so reads with
+# time-range, actor or event predicates skip partitions that cannot match and
+# binary search the time range in the memory-mapped columns of the rest
+################################################################################
+
+import os
+import glob
+import json
+import numpy as np
+import pandas as pd
+from event_master import mergeSortedStreams
+
+PARTITION_COLS = ["dayID", "periodID", "modality"]
+ZONE_MAP_COLS = ["event", "actor"] # columns whose distinct codes are kept per partition
+MISSING_CODE = -1 # dictionary code of NaN
+
+def _toJSONValue(value):
+    # numpy scalars are not json serializable
+    return value.item() if isinstance(value, np.generic) else value
+
+def _isMissing(value):
+    return isinstance(value, float) and np.isnan(value)
+
+def _partitionName(key):
+    return "_".join([ "none" if _isMissing(value) else str(value) for value in key ])
+
+def writeEventStore(eventsDF, directory, timeCol=None):
+    """
+    Writes event-actor-subject data to a columnar store
+
+    Args:
+        eventsDF (pandas.DataFrame): events with `dayID`, `periodID` and `modality` columns
+        directory (str): output directory, created if not existing; an existing store there is overwritten
+        timeCol (str, optional): time column rows are sorted and range-filtered on. Defaults to `timestamp`,
+            or `start` if there is no `timestamp` column.
+    """
+
+    if timeCol == None: timeCol = "timestamp" if "timestamp" in eventsDF.columns else "start"
+    for col in PARTITION_COLS + [timeCol]: assert col in eventsDF.columns, f"Event data does not have column <{col}>"
+
+    os.makedirs(directory, exist_ok=True)
+    eventsDF = eventsDF.reset_index(drop=True)
+
+    # dictionary encoding of non-numeric columns, shared by all partitions
+    schema, dictionaries, codes = dict(), dict(), dict()
+    for col in eventsDF.columns:
+        if pd.api.types.is_numeric_dtype(eventsDF[col]) and not pd.api.types.is_bool_dtype(eventsDF[col]):
+            schema[col] = "numeric"
+        else:
+            schema[col] = "dictionary"
+            codes[col], uniques = pd.factorize(eventsDF[col].to_numpy(dtype=object), use_na_sentinel=True)
+            codes[col] = codes[col].astype(np.int32)
+            dictionaries[col] = [ _toJSONValue(value) for value in uniques ]
+
+    partitions = []
+    groups = eventsDF.groupby(PARTITION_COLS, dropna=False, sort=True).indices
+    for key, rows in groups.items():
+        # rows sorted by time within the partition, ties in input order
+        rows = rows[np.argsort(eventsDF[timeCol].to_numpy(dtype=np.float64)[rows], kind="stable")]
+        name = _partitionName(key)
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+        for col in eventsDF.columns:
+            values = eventsDF[col].to_numpy()[rows] if schema[col] == "numeric" else codes[col][rows]
+            np.save(os.path.join(directory, name, f"{col}.npy"), values)
+
+        times = eventsDF[timeCol].to_numpy(dtype=np.float64)[rows]
+        partitions.append({"name": name,
+                           "key": [ None if _isMissing(value) else _toJSONValue(value) for value in key ],
+                           "numOfRows": len(rows),
+                           "minTime": None if np.all(np.isnan(times)) else float(np.nanmin(times)),
+                           "maxTime": None if np.all(np.isnan(times)) else float(np.nanmax(times)),
+                           "codes": { col: np.unique(codes[col][rows]).tolist() for col in ZONE_MAP_COLS if col in codes }})
+
+    with open(os.path.join(directory, "manifest.json"), "w") as manifestFile:
+        json.dump({"columns": list(eventsDF.columns),
+                   "schema": schema,
+                   "timeCol": timeCol,
+                   "dictionaries": dictionaries,
+                   "partitions": partitions}, manifestFile)
+
+def convertEventCSV(path, directory, timeCol=None):
+    """
+    Converts an event csv file, e.g. an event_master_file_D*_R*_RNG*.csv, to
+    a columnar store
+    """
+    writeEventStore(pd.read_csv(path, index_col=False), directory, timeCol=timeCol)
+
+
+class EventStore:
+
+    """
+    Read access to a store written by writeEventStore(). Partitions are
+    pruned with the manifest before any column file is opened, and column
+    files are memory-mapped, so only the row ranges that are read get paged in
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as manifestFile:
+            manifest = json.load(manifestFile)
+
+        self.columns = manifest["columns"]
+        self.schema = manifest["schema"]
+        self.timeCol = manifest["timeCol"]
+        self.partitions = manifest["partitions"]
+        self.dictionaries = { col: np.array(values + [np.nan], dtype=object) # code -1 decodes to NaN
+                              for col, values in manifest["dictionaries"].items() }
+        # mapping: column -> {value: code}
+        self.codeLookup = { col: { value: code for code, value in enumerate(values) }
+                            for col, values in manifest["dictionaries"].items() }
+
+    def __len__(self):
+        return sum(partition["numOfRows"] for partition in self.partitions)
+
+    def getPartitions(self):
+        """
+        Returns the manifest of each partition as a dataframe, one row per
+        (dayID, periodID, modality)
+        """
+        return pd.DataFrame([ dict(zip(PARTITION_COLS, partition["key"]),
+                                   numOfRows=partition["numOfRows"],
+                                   minTime=partition["minTime"],
+                                   maxTime=partition["maxTime"]) for partition in self.partitions ])
+
+    def _encode(self, col, values):
+        """
+        Dictionary codes of the given values of a column; values not in the
+        store are dropped since they cannot match any row
+        """
+        return np.array(sorted({ self.codeLookup[col][value] for value in values if value in self.codeLookup[col] }), dtype=np.int32)
+
+    def read(self, startTime=None, endTime=None, events=None, actors=None, modalities=None,
+             dayIDs=None, periodIDs=None, columns=None):
+        """
+        Reads the events matching all given predicates
+
+        Args:
+            startTime (float, optional): earliest time (inclusive) of the time column. Defaults to None.
+            endTime (float, optional): latest time (inclusive) of the time column. Defaults to None.
+            events (Iterable[str], optional): event names to keep. Defaults to None.
+            actors (Iterable[str], optional): actors to keep. Defaults to None.
+            modalities (Iterable[str], optional): modalities to keep. Defaults to None.
+            dayIDs (Iterable[int], optional): day ID's to keep. Defaults to None.
+            periodIDs (Iterable[int], optional): period ID's to keep. Defaults to None.
+            columns (List[str], optional): columns to return. Defaults to all columns.
+
+        Returns:
+            pandas.DataFrame: matching events sorted by the time column, re-indexed from 0
+        """
+
+        columns = self.columns if columns == None else columns
+        for col in columns: assert col in self.columns, f"Column <{col}> not in the store"
+
+        # equality predicates on dictionary-encoded columns, as arrays of codes
+        codePredicates = { col: self._encode(col, values)
+                           for col, values in [("event", events), ("actor", actors)] if values is not None }
+        keyPredicates = [ (i, set(values)) for i, values in enumerate([dayIDs, periodIDs, modalities]) if values is not None ]
+
+        partitionDFs = []
+        for partition in self.partitions:
+            # partition pruning with the manifest
+            if any(partition["key"][i] not in values for i, values in keyPredicates): continue
+            if partition["numOfRows"] == 0 or partition["minTime"] == None: pass
+            elif startTime != None and partition["maxTime"] < startTime: continue
+            elif endTime != None and partition["minTime"] > endTime: continue
+            if any(col in partition["codes"] and len(np.intersect1d(codes, partition["codes"][col])) == 0
+                   for col, codes in codePredicates.items()): continue
+
+            partitionDF = self._readPartition(partition, startTime, endTime, codePredicates, columns)
+            if len(partitionDF) > 0: partitionDFs.append(partitionDF)
+
+        if len(partitionDFs) == 0:
+            return pd.DataFrame({ col: pd.Series(dtype=np.float64 if self.schema[col] == "numeric" else object) for col in columns })
+
+        # partitions are each sorted by time
+        timeCol = self.timeCol if self.timeCol in columns else None
+        if timeCol == None: return pd.concat(partitionDFs, ignore_index=True)
+        return mergeSortedStreams(partitionDFs, timestampCol=timeCol)
+
+    def _readPartition(self, partition, startTime, endTime, codePredicates, columns):
+
+        def load(col):
+            return np.load(os.path.join(self.directory, partition["name"], f"{col}.npy"), mmap_mode="r")
+
+        # rows are sorted by time, so the time range is one slice
+        start, end = 0, partition["numOfRows"]
+        if startTime != None or endTime != None:
+            times = load(self.timeCol)
+            if startTime != None: start = np.searchsorted(times, startTime, side="left")
+            if endTime != None: end = np.searchsorted(times, endTime, side="right")
+        if end <= start: return pd.DataFrame(columns=columns)
+
+        isMatch = np.ones(end - start, dtype=bool)
+        for col, codes in codePredicates.items():
+            isMatch &= np.isin(load(col)[start: end], codes)
+        rows = np.flatnonzero(isMatch) + start
+
+        data = dict()
+        for col in columns:
+            values = load(col)[rows]
+            data[col] = values if self.schema[col] == "numeric" else self.dictionaries[col][values]
+
+        return pd.DataFrame(data)
+
+
+if __name__ == "__main__":
+
+    # one store per parameter combination of the event master files
+    for path in glob.glob("output_files/event_master_file_D*_R*_RNG*.csv"):
+        directory = os.path.splitext(path)[0] + "_store"
+        convertEventCSV(path, directory)
+        print(path, "->", directory, len(EventStore(directory)), "rows")
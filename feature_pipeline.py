@@ -0,0 +1,504 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Feature pipeline building `analyticsDF` of
+# detector_and_teacher_help_analytics.ipynb. Each feature group is a Stage
+# declaring its input stages, input files and parameters. A stage's cache key
+# is the hash of its code, its parameters, the content of its input files and
+# the content hashes of its input stages' outputs, so a stage only reruns when
+# one of these changed; everything else is read from the cache. A stage's code
+# is the source of its function and of the modules it calls into, CODE_MODULES
+# by default. Stages whose inputs are ready run in parallel in worker processes
+################################################################################
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import tutorDataAPI as tutorAPI
+import detectorDataAPI as detectorAPI
+import stop_detection as sd
+import observationDataAPI as observationAPI
+import id_resolution
+from id_resolution import StudentIDResolver
+
+# modules the stage functions call into; editing any of them invalidates the cache
+CODE_MODULES = [tutorAPI, detectorAPI, observationAPI, sd, id_resolution]
+
+def hashFile(path, blockSize=2**20):
+    """
+    Returns the sha256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as inFile:
+        for block in iter(lambda: inFile.read(blockSize), b""): digest.update(block)
+    return digest.hexdigest()
+
+def hashOutput(output):
+    """
+    Returns a content hash of a stage output. Dataframes and series are
+    hashed by their values, index, column names and dtypes, so that two equal
+    frames have the same hash no matter how they were computed; other objects
+    are hashed by their pickle
+    """
+    digest = hashlib.sha256()
+    if isinstance(output, (pd.DataFrame, pd.Series)):
+        digest.update(type(output).__name__.encode())
+        digest.update(repr(list(output.columns) if isinstance(output, pd.DataFrame) else output.name).encode())
+        digest.update(repr(output.dtypes.astype(str).tolist() if isinstance(output, pd.DataFrame) else str(output.dtype)).encode())
+        digest.update(pd.util.hash_pandas_object(output, index=True).to_numpy().tobytes())
+    else:
+        digest.update(pickle.dumps(output))
+    return digest.hexdigest()
+
+def hashCode(obj):
+    """
+    Returns the sha256 hex digest of the source of a module or function
+    """
+    try: source = inspect.getsource(obj)
+    except (OSError, TypeError): source = f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', obj.__name__)}"
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class Stage:
+
+    """
+    A feature group of the pipeline. When run, func is called with the
+    outputs of the input stages, the paths of the input files and the
+    parameters, all as keyword arguments named as declared. func should be a
+    module level function so that it can be sent to worker processes.
+    Only the source of func and of the `code` modules or functions is part of
+    the cache key, so for their edits to rerun the stage, helpers func uses
+    from elsewhere must be listed in `code` and constants passed in `params`
+    """
+
+    def __init__(self, name, func, inputs=None, files=None, params=None, code=None):
+        """
+        Args:
+            name (str): unique stage name
+            func (callable): function computing the stage output
+            inputs (dict, optional): mapping from keyword argument to input stage name. Defaults to None.
+            files (dict, optional): mapping from keyword argument to input file path. Defaults to None.
+            params (dict, optional): mapping from keyword argument to a json serializable parameter value. Defaults to None.
+            code (Iterable, optional): modules or functions func depends on, hashed by source. Defaults to CODE_MODULES.
+        """
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs or {})
+        self.files = dict(files or {})
+        self.params = dict(params or {})
+        self.code = list(CODE_MODULES if code == None else code)
+
+    def getKey(self, inputHashes):
+        """
+        Cache key of the stage given the output hashes of its input stages
+        """
+        digest = hashlib.sha256()
+        digest.update(hashCode(self.func).encode())
+        for obj in self.code: digest.update(f"{obj.__name__}={hashCode(obj)}".encode())
+        digest.update(json.dumps(self.params, sort_keys=True, default=str).encode())
+        for arg in sorted(self.files): digest.update(f"{arg}={hashFile(self.files[arg])}".encode())
+        for arg in sorted(self.inputs): digest.update(f"{arg}={inputHashes[self.inputs[arg]]}".encode())
+        return digest.hexdigest()
+
+def _runStage(func, kwargs):
+    start = time.perf_counter()
+    output = func(**kwargs)
+    return output, time.perf_counter() - start
+
+
+class FeaturePipeline:
+
+    """
+    A set of stages forming a directed acyclic graph, with outputs cached on
+    disk by key: <cacheDir>/<stage name>/<key>.pkl holds the output and
+    <key>.json its content hash, so that downstream keys can be computed
+    without loading cached outputs
+    """
+
+    def __init__(self, stages, cacheDir="output_files/feature_cache", processes=None):
+        """
+        Args:
+            stages (Iterable[Stage]): stages of the pipeline
+            cacheDir (str, optional): cache directory. Defaults to "output_files/feature_cache".
+            processes (int, optional): number of worker processes, 1 to run stages in this process. Defaults to os.cpu_count().
+        """
+        self.stages = { stage.name: stage for stage in stages }
+        self.cacheDir = cacheDir
+        self.processes = processes or os.cpu_count() or 1
+        self.lastRun = dict() # mapping: stage name -> ("cached"/"ran", seconds) of the last run()
+
+        for stage in self.stages.values():
+            for inputName in stage.inputs.values():
+                assert inputName in self.stages, f"Stage <{stage.name}> has unknown input stage <{inputName}>"
+        self.getOrder(list(self.stages)) # cycle check
+
+    def getOrder(self, targets):
+        """
+        Returns the target stages and all stages they depend on, inputs first
+        """
+        order, state = [], dict() # state: 1 while visiting, 2 when done
+        def visit(name):
+            assert state.get(name) != 1, f"Stage <{name}> depends on itself"
+            if state.get(name) == 2: return
+            state[name] = 1
+            for inputName in self.stages[name].inputs.values(): visit(inputName)
+            state[name] = 2
+            order.append(name)
+        for target in targets:
+            assert target in self.stages, f"Unknown stage <{target}>"
+            visit(target)
+        return order
+
+    def _cachePath(self, name, key, extension):
+        return os.path.join(self.cacheDir, name, f"{key}.{extension}")
+
+    def _readCachedHash(self, name, key):
+        if not os.path.exists(self._cachePath(name, key, "pkl")): return None
+        try:
+            with open(self._cachePath(name, key, "json")) as metaFile: return json.load(metaFile)["outputHash"]
+        except (OSError, ValueError, KeyError): return None
+
+    def _writeCache(self, name, key, output, outputHash):
+        os.makedirs(os.path.join(self.cacheDir, name), exist_ok=True)
+        # write to temporary files first so that an interrupted run leaves no partial entry
+        with open(self._cachePath(name, key, "pkl.tmp"), "wb") as outFile: pickle.dump(output, outFile)
+        os.replace(self._cachePath(name, key, "pkl.tmp"), self._cachePath(name, key, "pkl"))
+        with open(self._cachePath(name, key, "json"), "w") as metaFile: json.dump({"outputHash": outputHash}, metaFile)
+
+    def run(self, targets=None, force=False, verbose=True):
+        """
+        Brings the target stages up to date and returns their outputs
+
+        Args:
+            targets (Iterable[str], optional): stage names. Defaults to all stages.
+            force (bool, optional): rerun every needed stage regardless of the cache. Defaults to False.
+            verbose (bool, optional): print a line per stage. Defaults to True.
+
+        Returns:
+            dict: mapping from target stage name to its output
+        """
+
+        targets = list(self.stages) if targets == None else list(targets)
+        pending = self.getOrder(targets)
+        hashes, keys, outputs = dict(), dict(), dict()
+        self.lastRun = dict()
+
+        def load(name):
+            if name not in outputs:
+                with open(self._cachePath(name, keys[name], "pkl"), "rb") as inFile: outputs[name] = pickle.load(inFile)
+            return outputs[name]
+
+        def finish(name, output, seconds):
+            hashes[name] = hashOutput(output)
+            outputs[name] = output
+            self._writeCache(name, keys[name], output, hashes[name])
+            self.lastRun[name] = ("ran", seconds)
+            if verbose: print(f"Stage <{name}> ran in {seconds:.2f} s")
+
+        executor = ProcessPoolExecutor(max_workers=self.processes) if self.processes > 1 else None
+        running = dict() # mapping: future -> stage name
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                # stages whose inputs are all resolved, in dependency order
+                ready = [ name for name in pending if all(inputName in hashes for inputName in self.stages[name].inputs.values()) ]
+                for name in ready:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    keys[name] = stage.getKey(hashes)
+                    cachedHash = None if force else self._readCachedHash(name, keys[name])
+                    if cachedHash != None:
+                        hashes[name] = cachedHash
+                        self.lastRun[name] = ("cached", 0.0)
+                        if verbose: print(f"Stage <{name}> is up to date")
+                        continue
+
+                    kwargs = dict(stage.params, **stage.files)
+                    kwargs.update({ arg: load(inputName) for arg, inputName in stage.inputs.items() })
+                    if executor == None: finish(name, *_runStage(stage.func, kwargs))
+                    else: running[executor.submit(_runStage, stage.func, kwargs)] = name
+
+                # resolving a cached stage may make others ready without waiting
+                if any(all(inputName in hashes for inputName in self.stages[name].inputs.values()) for name in pending): continue
+                if len(running) == 0: continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done: finish(running.pop(future), *future.result())
+        finally:
+            if executor != None: executor.shutdown(cancel_futures=True)
+
+        return { target: load(target) for target in targets }
+
+
+################################################################################
+# Stages of analyticsDF, ported from detector_and_teacher_help_analytics.ipynb
+################################################################################
+
+RNGS = [500, 1000, 2000] # position-event ranges of the stop features
+KC_NAMES = ['cancel-const', 'division-simple', 'divide',
+            'subtraction-const', 'combine-like-const', 'subtraction-var',
+            'combine-like-var', 'cancel-var', 'distribute-division',
+            'division-complex']
+# columns where a missing value means the student had none of the events
+ZERO_FILL_COLS = ["totalOnTaskTeacherVisits", "totalOffTaskTeacherVisits", "totalHandRaises"] + \
+                 [ f"{feature}_rng{rng}" for rng in RNGS
+                   for feature in ["totalStopLength", "stopsLengthMean", "stopsLengthStd", "stopsLengthMin", "stopsLengthMax"] ] + \
+                 ["idle", "struggle", "gaming", "misuse"]
+
+def readObservationEvents(eventMasterPath):
+    """
+    Observation events of an event master file
+    """
+    obsEventsDF = pd.read_csv(eventMasterPath, index_col=False)
+    return obsEventsDF.loc[obsEventsDF["modality"] == "observation"]
+
+def readStopEvents(eventMasterPath):
+    """
+    Stopping events of an event master file, re-indexed from 0
+    """
+    stopsDF = pd.read_csv(eventMasterPath, index_col=False)
+    stopsDF = stopsDF.loc[stopsDF["event"] == "Stopping"]
+    stopsDF.index = np.arange(len(stopsDF))
+    return stopsDF
+
+def getTeacherHelpFeatures(obsEventsDF):
+    """
+    Number of on-task teacher visits and hand raises of each student, summed
+    over days and periods
+
+    Returns:
+        pandas.DataFrame: `studentID`, `totalOnTaskTeacherVisits` and `totalHandRaises` columns
+    """
+
+    countsDF = observationAPI.getStudentEventCounts(obsEventsDF)
+    countsDF = countsDF.loc[(countsDF["onTaskTeacherVisits"] > 0) | (countsDF["handRaises"] > 0)]
+    return pd.DataFrame({"studentID": countsDF["studentID"],
+                         "totalOnTaskTeacherVisits": countsDF["onTaskTeacherVisits"],
+                         "totalHandRaises": countsDF["handRaises"]}).reset_index(drop=True)
+
+def getOffTaskVisitFeatures(obsEventsDF):
+    """
+    Number of off-task conversations of the teacher with each student
+
+    Returns:
+        pandas.DataFrame: `studentID` and `totalOffTaskTeacherVisits` columns
+    """
+
+    countsDF = observationAPI.getStudentEventCounts(obsEventsDF)
+    countsDF = countsDF.loc[countsDF["offTaskTeacherVisits"] > 0]
+    return pd.DataFrame({"studentID": countsDF["studentID"],
+                         "totalOffTaskTeacherVisits": countsDF["offTaskTeacherVisits"]}).reset_index(drop=True)
+
+def getStopFeatures(**stopsDFs):
+    """
+    Lengths of the teacher's stops in range of each student, for every rng at
+    once. Stop boundaries are where `content` changes; the last stop of each
+    frame is not counted
+
+    Args:
+        stopsDFs: stop events frames, one keyword argument `rng{rng}` per rng
+
+    Returns:
+        pandas.DataFrame: `studentID` column, then for each rng total/mean/std/min/max stop length columns
+            suffixed by `_rng{rng}` and `stopsCountRNG{rng}`
+    """
+
+    rngs = sorted( int(name[len("rng"):]) for name in stopsDFs )
+    statsDF = sd.getStudentStopLengths({ rng: stopsDFs[f"rng{rng}"] for rng in rngs })
+
+    stopsDF = pd.DataFrame({"studentID": pd.unique(statsDF["studentID"])})
+    for rng in rngs:
+        rngStatsDF = statsDF.loc[statsDF["rng"] == rng]
+        rngStatsDF = pd.DataFrame({"studentID": rngStatsDF["studentID"],
+                                   f"totalStopLength_rng{rng}": rngStatsDF["total"],
+                                   f"stopsLengthMean_rng{rng}": rngStatsDF["mean"],
+                                   f"stopsLengthStd_rng{rng}": rngStatsDF["std"],
+                                   f"stopsLengthMin_rng{rng}": rngStatsDF["min"],
+                                   f"stopsLengthMax_rng{rng}": rngStatsDF["max"],
+                                   f"stopsCountRNG{rng}": rngStatsDF["count"]})
+        stopsDF = pd.merge(stopsDF, rngStatsDF, on="studentID", how="left")
+
+    return stopsDF
+
+def readTutorLog(tutorLogPath, experimentStart="2022-05-23 08:00:00", experimentEnd="2022-05-25 16:00:00"):
+    """
+    Tutor log of the experiment period, with start and end given in EDT
+    """
+    return tutorAPI.getAnnotatedTutorLogDF(tutorLogPath,
+                                           startTimestamp=tutorAPI.EDTDatetime2epoch(experimentStart),
+                                           endTimestamp=tutorAPI.EDTDatetime2epoch(experimentEnd))
+
+def getTutorSummaryFeatures(tutorLogDF, kcNames=KC_NAMES):
+    """
+    Overall performance, hints, problems, steps, time per step and KC level
+    performance of each student
+    """
+
+    # problems and steps are aggregated from the problem table instead of rescanning the log per student
+    problemsDF = tutorAPI.getProblemTable(tutorAPI.segmentTutorLog(tutorLogDF))
+    rows = []
+    for studentID in tutorLogDF["Anon Student Id"].unique().tolist():
+        row = {"studentID": studentID,
+               "overallPerformance": tutorAPI.getStudentPerformanceSummary(tutorLogDF, students=[studentID]),
+               "hintRequested": tutorAPI.getNumOfHints(tutorLogDF, students=[studentID]),
+               "problemsSolved": tutorAPI.getNumOfProblemsSolved(tutorLogDF, students=[studentID], problemTable=problemsDF),
+               "totalSteps": tutorAPI.getNumOfSteps(tutorLogDF, students=[studentID], problemTable=problemsDF),
+               "timePerStep": tutorAPI.getTimePerStep(tutorLogDF, students=[studentID])}
+        row.update(tutorAPI.getKCLevelPerformance(tutorLogDF, students=[studentID], suffix="Performance"))
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=["studentID", "overallPerformance", "hintRequested", "problemsSolved",
+                                       "totalSteps", "timePerStep"] + [ kc + "Performance" for kc in kcNames ])
+
+def getTutorStepFeatures(tutorLogDF):
+    """
+    Incorrect count, first attempt performance and step duration features of
+    each student
+    """
+
+    stepDF = tutorAPI.getIncorrectCount(tutorLogDF)
+    for func in [tutorAPI.getFirstAttemptPerf, tutorAPI.getAvgCorrectStepDuration, tutorAPI.getAvgErrorStepDuration,
+                 tutorAPI.getAvgHintDurationPerStep, tutorAPI.getAssistanceScorePerStep]:
+        stepDF = pd.merge(stepDF, func(tutorLogDF), on="studentID", how="outer")
+
+    return stepDF
+
+def getDetectorFeatures(detectorResultsPath, maxDuration=5000):
+    """
+    Seconds each student spent under each detector status, leaving out
+    students with `maxDuration` or more seconds under any status
+    """
+
+    detectorDF = detectorAPI.getDetectorResultsDF(detectorResultsPath)
+    studentIDs = detectorDF["studentID"].unique().tolist()
+
+    detectorSummaryDF = pd.DataFrame({"studentID": studentIDs})
+    for detectorName in ["idle", "struggle", "gaming", "misuse"]:
+        detectorSummaryDF[detectorName] = [ detectorAPI.getStudentStatusDurationByDetector(detectorDF, detectorName, studentID)
+                                            for studentID in studentIDs ]
+
+    # get rid of outlier students
+    for col in ["idle", "struggle", "gaming", "misuse"]:
+        detectorSummaryDF = detectorSummaryDF.loc[detectorSummaryDF[col] < maxDuration]
+
+    return detectorSummaryDF
+
+def getTestScoreFeatures(scoresPath, IDMappingPath, PfullScore=5, CfullScore=16):
+    """
+    Procedural and conceptual learning gains and pre-test scores of each
+    student, with actual user ID's replaced by anon ID's
+    """
+
+    prePostScoresDF = pd.read_csv(scoresPath, index_col=False)
+    resolver = StudentIDResolver.fromFile(IDMappingPath)
+
+    # change the `greencat` id's to anon id's like Stu_xxxxxxxxxxxx
+    prePostScoresDF["Anon Student Id"] = resolver.getAnonIDs(prePostScoresDF["Anon Student Id"].to_numpy())
+    prePostScoresDF = prePostScoresDF.loc[prePostScoresDF["Anon Student Id"].notnull()]
+
+    return pd.DataFrame({"studentID": prePostScoresDF["Anon Student Id"],
+                         "PlearningGain": (prePostScoresDF["pk"] - prePostScoresDF["pk_pre"]) / (PfullScore - prePostScoresDF["pk_pre"]),
+                         "ClearningGain": (prePostScoresDF["ck"] - prePostScoresDF["ck_pre"]) / (CfullScore - prePostScoresDF["ck_pre"]),
+                         "CPreScore": prePostScoresDF["ck_pre"],
+                         "PPreScore": prePostScoresDF["pk_pre"]}).reset_index(drop=True)
+
+def assembleAnalyticsDF(teacherHelp, offTaskVisits, tutorSummary, tutorSteps, detector, testScores, stops, maxTimePerStep=500,
+                        rngs=RNGS, zeroFillCols=ZERO_FILL_COLS):
+    """
+    Outer joins the feature groups by student and builds the derived
+    features, in the order of the notebook
+
+    Args:
+        stops (pandas.DataFrame): stop features of every rng, see getStopFeatures()
+    """
+
+    analyticsDF = teacherHelp
+    analyticsDF = pd.merge(analyticsDF, stops, on="studentID", how="outer")
+    analyticsDF = pd.merge(offTaskVisits, analyticsDF, on="studentID", how="outer")
+    for featureDF in [tutorSummary, detector, tutorSteps, testScores]:
+        analyticsDF = pd.merge(analyticsDF, featureDF, on="studentID", how="outer")
+
+    # the stop count of 2000 keeps the column name the reports read
+    for rng in rngs: analyticsDF[f"stopsCountRNG{rng}"] = analyticsDF[f"stopsCountRNG{rng}"].fillna(0)
+    analyticsDF = analyticsDF.rename(columns={"stopsCountRNG2000": "stopsCountRNG52000"})
+    analyticsDF["totalTimeInTutor"] = analyticsDF["totalSteps"] * analyticsDF["timePerStep"]
+
+    # columns that can be filled with zero's
+    for col in zeroFillCols: analyticsDF[col] = analyticsDF[col].fillna(0)
+
+    # filter out students with very minimal attempt in tutor, and outliers
+    analyticsDF = analyticsDF.loc[analyticsDF["overallPerformance"].notnull()]
+    analyticsDF["hintPerStep"] = analyticsDF["hintRequested"] / analyticsDF["totalSteps"]
+    analyticsDF = analyticsDF.loc[analyticsDF["timePerStep"] < maxTimePerStep]
+
+    # 1 if the student gets at least the average number of on-task teacher visits
+    avgOnTaskVisitCount = np.mean(analyticsDF["totalOnTaskTeacherVisits"])
+    analyticsDF = analyticsDF.assign(helpAboveAvg=(analyticsDF["totalOnTaskTeacherVisits"] >= avgOnTaskVisitCount).astype(int))
+
+    return analyticsDF.reset_index(drop=True)
+
+def getAnalyticsPipeline(eventMasterPaths, tutorLogPath, detectorResultsPath, scoresPath, IDMappingPath,
+                         obsRNG=1000, cacheDir="output_files/feature_cache", processes=None):
+    """
+    The pipeline of analyticsDF, whose `analytics` stage output is the
+    cleaned analyticsDF of the notebook
+
+    Args:
+        eventMasterPaths (dict): mapping from rng to the event master file of that rng
+        tutorLogPath (str): Datashop tutor log file
+        detectorResultsPath (str): encoded detector results file
+        scoresPath (str): pre/post test scores file
+        IDMappingPath (str): student position file mapping actual to anon user ID's
+        obsRNG (int, optional): rng of the event master file the observation events are read from. Defaults to 1000.
+        cacheDir (str, optional): Defaults to "output_files/feature_cache".
+        processes (int, optional): Defaults to os.cpu_count().
+
+    Returns:
+        FeaturePipeline: the pipeline
+    """
+
+    stages = [Stage("observationEvents", readObservationEvents, files={"eventMasterPath": eventMasterPaths[obsRNG]}),
+              Stage("teacherHelp", getTeacherHelpFeatures, inputs={"obsEventsDF": "observationEvents"}),
+              Stage("offTaskVisits", getOffTaskVisitFeatures, inputs={"obsEventsDF": "observationEvents"}),
+              Stage("tutorLog", readTutorLog, files={"tutorLogPath": tutorLogPath}),
+              Stage("tutorSummary", getTutorSummaryFeatures, inputs={"tutorLogDF": "tutorLog"}, params={"kcNames": KC_NAMES}),
+              Stage("tutorSteps", getTutorStepFeatures, inputs={"tutorLogDF": "tutorLog"}),
+              Stage("detector", getDetectorFeatures, files={"detectorResultsPath": detectorResultsPath}),
+              Stage("testScores", getTestScoreFeatures, files={"scoresPath": scoresPath, "IDMappingPath": IDMappingPath})]
+    stages += [ Stage(f"stopEvents_rng{rng}", readStopEvents, files={"eventMasterPath": eventMasterPaths[rng]}) for rng in RNGS ]
+    stages.append(Stage("stops", getStopFeatures, inputs={ f"rng{rng}": f"stopEvents_rng{rng}" for rng in RNGS }))
+
+    stages.append(Stage("analytics", assembleAnalyticsDF,
+                        inputs={"teacherHelp": "teacherHelp",
+                                "offTaskVisits": "offTaskVisits",
+                                "tutorSummary": "tutorSummary",
+                                "tutorSteps": "tutorSteps",
+                                "detector": "detector",
+                                "testScores": "testScores",
+                                "stops": "stops"},
+                        params={"rngs": RNGS, "zeroFillCols": ZERO_FILL_COLS}))
+
+    return FeaturePipeline(stages, cacheDir=cacheDir, processes=processes)
+
+def exportAnalyticsDF(analyticsDF, path="output_files/analytics_data.csv"):
+    """
+    Writes analyticsDF for the R analysis, with dashes in column names
+    replaced by underscores
+    """
+    analyticsDF.rename(columns={ col: col.replace("-", "_") for col in analyticsDF.columns if "-" in col }).to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+
+    pipeline = getAnalyticsPipeline({ rng: f"output_files/event_master_file_D10_R500_RNG{rng}_sprint2_shou.csv" for rng in RNGS },
+                                    tutorLogPath="raw data/tutor_log.tsv",
+                                    detectorResultsPath="output_files/detector_results.csv",
+                                    scoresPath="raw data/WVW_pre_post_scores.csv",
+                                    IDMappingPath="output_files/student_position_sprint1_shou.csv")
+    analyticsDF = pipeline.run(["analytics"])["analytics"]
+    exportAnalyticsDF(analyticsDF)
@@ -0,0 +1,152 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Student ID resolution. The student position table (e.g.
+# output_files/student_position_sprint1_shou.csv) maps seats to students for
+# every class session, gives the coordinates of each student's seat, and maps
+# actual user ID's to anon ID's. The notebooks filter this table once per
+# lookup; StudentIDResolver hashes it into indexes once, and resolves whole
+# columns of keys with a single hash probe per column
+################################################################################
+
+import numpy as np
+import pandas as pd
+
+def _getKeyIndex(keyArrays):
+    """
+    Hash index over rows of key arrays. Rows with a missing key are never
+    matched, same as dictionary lookups with NaN keys in the notebooks
+    """
+    return pd.MultiIndex.from_arrays([ pd.Index(keys) for keys in keyArrays ])
+
+def _lookup(index, keyArrays):
+    """
+    Positions in `index` of each row of the query key arrays, -1 if not found
+    """
+    if len(keyArrays[0]) == 0: return np.zeros(0, dtype=np.int64)
+    positions = index.get_indexer(pd.MultiIndex.from_arrays([ pd.Index(keys) for keys in keyArrays ]))
+    # missing query keys must not match anything
+    isMissing = np.zeros(len(positions), dtype=bool)
+    for keys in keyArrays: isMissing |= pd.isna(keys)
+    positions[isMissing] = -1
+    return positions
+
+def _asFloats(values):
+    return pd.to_numeric(pd.Series(np.asarray(values, dtype=object)), errors="coerce").to_numpy(dtype=np.float64)
+
+class StudentIDResolver:
+
+    """
+    Indexes of a student position table:
+    - (seatNum, dayID, periodID) -> anon user ID, as seatNum2AnonStudID() in merge_modalities.ipynb
+    - (dayID, periodID, anon user ID) -> seat X, Y, as positionMapping in stamp_tutor_with_stops.ipynb
+    - actual user ID -> anon user ID, as actualID2AnonID() in the analytics notebook
+    Numeric keys are compared as floats, so 3 and 3.0 are the same seat
+    """
+
+    def __init__(self, mappingDF, seatCol="seatNum", dayCol="dayID", periodCol="periodID",
+                 anonIDCol="anon_user_id", actualIDCol="actual_user_id", XCol="X", YCol="Y"):
+
+        # seat -> student; a seat documented more than once has multiple students
+        if seatCol in mappingDF.columns:
+            seatKeys = [_asFloats(mappingDF[seatCol]), _asFloats(mappingDF[dayCol]), _asFloats(mappingDF[periodCol])]
+            isComplete = ~(np.isnan(seatKeys[0]) | np.isnan(seatKeys[1]) | np.isnan(seatKeys[2]))
+            seatKeys = [ keys[isComplete] for keys in seatKeys ]
+            anonIDs = mappingDF[anonIDCol].to_numpy(dtype=object)[isComplete]
+            allSeats = pd.MultiIndex.from_arrays(seatKeys)
+            isDuplicated, isFirst = allSeats.duplicated(keep=False), ~allSeats.duplicated(keep="first")
+            self.seatIndex = _getKeyIndex([ keys[isFirst] for keys in seatKeys ])
+            # empty seats are documented with a NaN anon ID
+            self.seatAnonIDs = np.array([ "" if str(anonID) == "nan" else anonID for anonID in anonIDs[isFirst] ], dtype=object)
+            self.isMultipleSeat = isDuplicated[isFirst]
+        else: self.seatIndex = None
+
+        # student -> seat coordinates; later rows override earlier ones as in the notebook's dictionary
+        if XCol in mappingDF.columns and YCol in mappingDF.columns:
+            positionsDF = pd.DataFrame({"dayID": _asFloats(mappingDF[dayCol]), "periodID": _asFloats(mappingDF[periodCol]),
+                                        "student": mappingDF[anonIDCol].to_numpy(dtype=object),
+                                        "X": mappingDF[XCol].to_numpy(dtype=np.float64),
+                                        "Y": mappingDF[YCol].to_numpy(dtype=np.float64)})
+            positionsDF = positionsDF.dropna(subset=["dayID", "periodID", "student"])
+            positionsDF = positionsDF.drop_duplicates(subset=["dayID", "periodID", "student"], keep="last")
+            self.positionIndex = _getKeyIndex([positionsDF["dayID"].to_numpy(), positionsDF["periodID"].to_numpy(),
+                                               positionsDF["student"].to_numpy()])
+            self.positionXs, self.positionYs = positionsDF["X"].to_numpy(), positionsDF["Y"].to_numpy()
+        else: self.positionIndex = None
+
+        # actual ID -> anon ID; the first entry of an actual ID is used
+        if actualIDCol in mappingDF.columns:
+            IDsDF = pd.DataFrame({"actual": mappingDF[actualIDCol].to_numpy(dtype=object),
+                                  "anon": mappingDF[anonIDCol].to_numpy(dtype=object)})
+            IDsDF = IDsDF.loc[IDsDF["actual"].notnull()].drop_duplicates(subset="actual", keep="first")
+            self.actualIDIndex = pd.Index(IDsDF["actual"].to_numpy())
+            self.actualIDAnonIDs = IDsDF["anon"].to_numpy()
+        else: self.actualIDIndex = None
+
+    @classmethod
+    def fromFile(cls, filePath, **kwargs):
+        """
+        Builds the resolver from a student position csv file
+        """
+        return cls(pd.read_csv(filePath, index_col=False), **kwargs)
+
+    def getAnonIDsBySeat(self, seatNums, dayIDs, periodIDs):
+        """
+        Anon user ID's of the students seated at each (seatNum, dayID,
+        periodID)
+
+        Args:
+            seatNums (array-like): seat numbers, numeric or numeric strings like "3.0"
+            dayIDs (array-like): day ID's
+            periodIDs (array-like): period ID's
+
+        Returns:
+            numpy.ndarray: anon user ID's; empty string if no student seated
+        """
+
+        assert self.seatIndex is not None, "The mapping table has no seat column"
+        positions = _lookup(self.seatIndex, [_asFloats(seatNums), _asFloats(dayIDs), _asFloats(periodIDs)])
+        isFound = positions >= 0
+        assert not np.any(self.isMultipleSeat[positions[isFound]]), "Multiple students found. "
+
+        anonIDs = np.full(len(positions), "", dtype=object)
+        anonIDs[isFound] = self.seatAnonIDs[positions[isFound]]
+        return anonIDs
+
+    def getPositions(self, dayIDs, periodIDs, studentIDs):
+        """
+        Seat coordinates of each (dayID, periodID, anon user ID)
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): X and Y arrays; NaN if the student's seat is not documented
+        """
+
+        assert self.positionIndex is not None, "The mapping table has no X, Y columns"
+        positions = _lookup(self.positionIndex, [_asFloats(dayIDs), _asFloats(periodIDs), np.asarray(studentIDs, dtype=object)])
+        isFound = positions >= 0
+        X, Y = np.full(len(positions), np.nan), np.full(len(positions), np.nan)
+        X[isFound], Y[isFound] = self.positionXs[positions[isFound]], self.positionYs[positions[isFound]]
+        return X, Y
+
+    def getAnonIDs(self, actualIDs):
+        """
+        Anon user ID's of actual user ID's, e.g. `greencat` ID's of the test
+        score files
+
+        Returns:
+            numpy.ndarray: anon user ID's; NaN if the actual ID is not documented
+        """
+
+        assert self.actualIDIndex is not None, "The mapping table has no actual user ID column"
+        actualIDs = np.asarray(actualIDs, dtype=object)
+        positions = self.actualIDIndex.get_indexer(actualIDs) if len(actualIDs) > 0 else np.zeros(0, dtype=np.int64)
+        positions[pd.isna(actualIDs)] = -1
+        anonIDs = np.full(len(positions), np.nan, dtype=object)
+        anonIDs[positions >= 0] = self.actualIDAnonIDs[positions[positions >= 0]]
+        return anonIDs
+
+
+if __name__ == "__main__":
+
+    resolver = StudentIDResolver.fromFile("output_files/student_position_sprint1_shou.csv")
+    print(resolver.getAnonIDsBySeat([1, 2, 3], [1, 1, 1], [1, 1, 1]))
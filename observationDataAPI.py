@@ -0,0 +1,192 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# This set of API provides analytics tools for the observation events of the
+# event master file, which must have `event`, `actor`, `subject`, `dayID`
+# and `periodID` columns. Subjects may list multiple students separated by
+# ";". Student ID's are the anon ID's starting with "Stu_"
+################################################################################
+
+import pandas as pd
+import numpy as np
+from profiling import instrument
+
+ON_TASK_VISIT_EVENTS = ["Talking to student: ON-task", "Talking to small group: ON-task"]
+HAND_RAISE_EVENT = "Raising hand"
+VISIT_EVENTS = ["Talking to student: ON-task", "Talking to student: OFF-task",
+                "Talking to small group: ON-task", "Talking to small group: OFF-task"]
+COUNT_COLS = ["onTaskTeacherVisits", "handRaises", "offTaskTeacherVisits"]
+
+def isValidStudIDs(values):
+    """
+    Vectorized version of isValidStudID() of the analytics notebook
+
+    Args:
+        values (array-like): student ID's, may contain NaN or non-string values
+
+    Returns:
+        numpy.ndarray: boolean array, True for strings starting with "Stu_"
+    """
+    values = pd.Series(np.asarray(values, dtype=object))
+    isString = values.map(type).to_numpy() == str
+    # the string test only needs to look at string values
+    isValid = np.zeros(len(values), dtype=bool)
+    isValid[isString] = values[isString].astype(str).str.startswith("Stu_").to_numpy(dtype=bool)
+    return isValid
+
+@instrument
+def getObservationEventCounts(obsEventsDF):
+
+    """
+    Counts on-task teacher visits, hand raises and off-task conversations of
+    each student in each class session, same counts as the event loops of the
+    analytics notebook:
+    - an on-task visit counts once for every valid student in its subject
+    - a hand raise counts once for its actor, if the actor is a valid student
+    - an event with "off-task" in its name counts once for every valid student in its subject
+    Subjects are split with one explode and all counts come from one groupby.
+    Unlike the notebook, spaces around subject student ID's are stripped, so
+    students after the first of a "; " joined subject are counted too
+
+    Args:
+        obsEventsDF (pandas.DataFrame): observation events of the event master file
+
+    Returns:
+        pandas.DataFrame: `dayID`, `periodID`, `studentID` and the COUNT_COLS columns, one row per
+            (dayID, periodID, studentID) with at least one event, sorted by these keys
+    """
+
+    events = obsEventsDF["event"].to_numpy(dtype=object)
+    isVisit = pd.Series(events).isin(ON_TASK_VISIT_EVENTS).to_numpy()
+    isHandRaise = events == HAND_RAISE_EVENT
+    isOffTask = pd.Series(events, dtype=object).str.lower().str.contains("off-task", regex=False).fillna(False).to_numpy(dtype=bool)
+
+    # one row per (event, subject student) of visit and off-task events
+    subjects = obsEventsDF["subject"].to_numpy(dtype=object)
+    hasSubjects = (isVisit | isOffTask) & (pd.Series(subjects).map(type).to_numpy() == str)
+    subjectsDF = pd.DataFrame({"dayID": obsEventsDF["dayID"].to_numpy()[hasSubjects],
+                               "periodID": obsEventsDF["periodID"].to_numpy()[hasSubjects],
+                               "studentID": pd.Series(subjects[hasSubjects], dtype=object).str.split(";").to_numpy(),
+                               "onTaskTeacherVisits": isVisit[hasSubjects].astype(np.int64),
+                               "handRaises": 0,
+                               "offTaskTeacherVisits": isOffTask[hasSubjects].astype(np.int64)}).explode("studentID")
+    # resolved subjects are joined with "; "
+    subjectsDF["studentID"] = subjectsDF["studentID"].str.strip()
+
+    # one row per hand raise
+    actors = obsEventsDF["actor"].to_numpy(dtype=object)
+    actorsDF = pd.DataFrame({"dayID": obsEventsDF["dayID"].to_numpy()[isHandRaise],
+                             "periodID": obsEventsDF["periodID"].to_numpy()[isHandRaise],
+                             "studentID": actors[isHandRaise],
+                             "onTaskTeacherVisits": 0,
+                             "handRaises": 1,
+                             "offTaskTeacherVisits": 0})
+
+    countsDF = pd.concat([subjectsDF, actorsDF], ignore_index=True)
+    countsDF = countsDF.loc[isValidStudIDs(countsDF["studentID"])]
+    countsDF = countsDF.astype({col: np.int64 for col in COUNT_COLS})
+    # events without day or period still count towards the student's totals
+    countsDF = countsDF.groupby(["dayID", "periodID", "studentID"], dropna=False, sort=True)[COUNT_COLS].sum()
+
+    return countsDF.reset_index()
+
+@instrument
+def getStudentEventCounts(obsEventsDF):
+
+    """
+    Totals of getObservationEventCounts() over all class sessions
+
+    Returns:
+        pandas.DataFrame: `studentID` and the COUNT_COLS columns, sorted by student ID
+    """
+
+    countsDF = getObservationEventCounts(obsEventsDF)
+    return countsDF.groupby("studentID", sort=True)[COUNT_COLS].sum().reset_index()
+
+
+@instrument
+def getHandRaiseLatencies(obsEventsDF, visitEvents=VISIT_EVENTS):
+
+    """
+    Matches every hand raise to the next teacher visit to the raising student
+    in the same day and period, with a forward as-of join on time stamps by
+    (studentID, dayID, periodID). A visit to a small group counts for every
+    student of its subject, and several hand raises before the same visit are
+    all answered by it
+
+    Args:
+        obsEventsDF (pandas.DataFrame): observation events of the event master file, with a `timestamp` column
+        visitEvents (List[str], optional): events that are teacher visits. Defaults to VISIT_EVENTS.
+
+    Returns:
+        pandas.DataFrame: one row per hand raise of a valid student, with `dayID`, `periodID`, `studentID`,
+            `raiseTimestamp`, `visitTimestamp` and `latency` (seconds) columns; NaN visit time stamp and latency
+            if no visit followed within the period. Hand raises without day or period are left out
+    """
+
+    events = obsEventsDF["event"].to_numpy(dtype=object)
+    keyCols = ["studentID", "dayID", "periodID"]
+
+    isHandRaise = events == HAND_RAISE_EVENT
+    raisesDF = pd.DataFrame({"dayID": obsEventsDF["dayID"].to_numpy()[isHandRaise],
+                             "periodID": obsEventsDF["periodID"].to_numpy()[isHandRaise],
+                             "studentID": obsEventsDF["actor"].to_numpy(dtype=object)[isHandRaise],
+                             "timestamp": obsEventsDF["timestamp"].to_numpy(dtype=np.float64)[isHandRaise]})
+    raisesDF = raisesDF.loc[isValidStudIDs(raisesDF["studentID"])].dropna(subset=["dayID", "periodID", "timestamp"])
+
+    # one row per (visit, visited student)
+    subjects = obsEventsDF["subject"].to_numpy(dtype=object)
+    isVisit = pd.Series(events).isin(visitEvents).to_numpy() & (pd.Series(subjects).map(type).to_numpy() == str)
+    visitsDF = pd.DataFrame({"dayID": obsEventsDF["dayID"].to_numpy()[isVisit],
+                             "periodID": obsEventsDF["periodID"].to_numpy()[isVisit],
+                             "studentID": pd.Series(subjects[isVisit], dtype=object).str.split(";").to_numpy(),
+                             "timestamp": obsEventsDF["timestamp"].to_numpy(dtype=np.float64)[isVisit]}).explode("studentID")
+    # resolved subjects are joined with "; "
+    visitsDF["studentID"] = visitsDF["studentID"].str.strip()
+    visitsDF = visitsDF.loc[isValidStudIDs(visitsDF["studentID"])].dropna(subset=["dayID", "periodID", "timestamp"])
+    visitsDF["visitTimestamp"] = visitsDF["timestamp"]
+
+    # key columns of both sides need the same dtypes for the join
+    raisesDF = raisesDF.astype({"studentID": object, "dayID": np.float64, "periodID": np.float64})
+    visitsDF = visitsDF.astype({"studentID": object, "dayID": np.float64, "periodID": np.float64})
+    latenciesDF = pd.merge_asof(raisesDF.sort_values("timestamp", kind="stable"),
+                                visitsDF.sort_values("timestamp", kind="stable"),
+                                on="timestamp", by=keyCols, direction="forward")
+
+    latenciesDF = latenciesDF.rename(columns={"timestamp": "raiseTimestamp"})
+    latenciesDF["latency"] = latenciesDF["visitTimestamp"] - latenciesDF["raiseTimestamp"]
+    return latenciesDF[["dayID", "periodID", "studentID", "raiseTimestamp", "visitTimestamp", "latency"]]
+
+@instrument
+def getLatencyDistribution(latenciesDF, by="studentID"):
+
+    """
+    Distribution of hand raise latencies per group, e.g. per student or per
+    class session
+
+    Args:
+        latenciesDF (pandas.DataFrame): usually returned by getHandRaiseLatencies()
+        by (str | List[str], optional): grouping columns, e.g. ["dayID", "periodID"]. Defaults to "studentID".
+
+    Returns:
+        pandas.DataFrame: grouping columns, `handRaises`, `answered` (number of hand raises followed by a visit), and
+            `mean`, `std`, `min`, `q25`, `median`, `q75` and `max` of the latencies of answered hand raises
+    """
+
+    latencies = latenciesDF.groupby(by, sort=True)["latency"]
+    distributionDF = latencies.agg(handRaises="size", answered="count", mean="mean", std="std", min="min")
+    distributionDF["q25"] = latencies.quantile(0.25)
+    distributionDF["median"] = latencies.median()
+    distributionDF["q75"] = latencies.quantile(0.75)
+    distributionDF["max"] = latencies.max()
+
+    return distributionDF.reset_index()
+
+if __name__ == "__main__":
+
+    eventMasterDF = pd.read_csv("output_files/event_master_file_D10_R500_RNG1000_sprint2_shou.csv", index_col=False)
+    obsEventsDF = eventMasterDF.loc[eventMasterDF["modality"] == "observation"]
+    print(getStudentEventCounts(obsEventsDF))
+    latenciesDF = getHandRaiseLatencies(obsEventsDF)
+    print(getLatencyDistribution(latenciesDF, by="studentID"))
+    print(getLatencyDistribution(latenciesDF, by=["dayID", "periodID"]))
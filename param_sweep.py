@@ -0,0 +1,511 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Parameter sweep engine for teacher stop detection. The triangulation helper
+# functions are ported from triangulation.ipynb so that worker processes can
+# import them. Stops only depend on (duration, radius), so each stop set is
+# computed once and every (range, timeframe) combination is scored against it.
+# (duration, radius) pairs are fanned out over a process pool, and finished
+# pairs are checkpointed to a csv file so that an interrupted sweep can resume
+################################################################################
+
+import os
+import copy
+import numpy as np
+import pandas as pd
+import stop_detection as sd
+from spatial_index import ClassroomObjectIndex
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# column order of the sweep results table, same as run_param_sweep() in triangulation.ipynb
+SWEEP_COLUMNS = ["duration", "radius", "range",
+                 "perc_of_stops_in_both", "perc_of_stops_in_pos", "perc_of_stops_in_obs",
+                 "right_match_percentage", "right_guess_percentage",
+                 "timeframe", "n_rewards", "n_penalties"]
+
+def isWithinStop(row, stop):
+
+    """
+    :param row: a pandas dataframe with only one row, has to have column named `time_stamp`
+    :param stop: a stop represented by a tuple, denoting the start and end timestamp of a stop
+    :return: returns a boolean of whether this row's timestamp is within the given stop
+    """
+
+    assert(type(stop) == tuple and len(stop) == 2)
+
+    stopStart, stopEnd = stop
+    rowTimestamp = row.loc["time_stamp"]
+
+    return stopStart <= rowTimestamp and rowTimestamp <= stopEnd
+
+def getStopEvent(posDF, stops):
+
+    """
+    This function generates the events and centroids of classroom actor's stops
+    :param posDF: a pandas dataframe denoting the position data of an real-world object. Must have columns `chosen_X`, `chosen_Y`, and `time_stamp`
+    :param stops: an array of tuples denoting the start and end timestamps of stops. Usually values returned by sd.getStops()
+    :return: returns a tuple of two arrays. The first is an array of strings, denoting the stopping events; the second is a string of tuple points, denoting stop centroid coordinates
+    """
+
+    # values to be returned
+    events = []
+    centroids = []
+
+    i, j = 0, 0 # i is index for posDF; j is for indexing the list stops
+    while(j < len(stops) ):
+        currStop = stops[j]
+        currStopStartInd = i
+        inStop = False
+
+        while(i < len(posDF) and isWithinStop(posDF.loc[i], currStop)):
+            inStop = True # indicate to the following code that we do run into the current stop
+            i += 1
+
+        if(inStop): # did run into a stop, currStopInd and i shoud not be the same
+            assert(currStopStartInd != i)
+
+            rows = posDF.loc[currStopStartInd:i-1] # rows that are within currStop
+            points = sd.cols2tuples(rows.chosen_X, rows.chosen_Y)
+            centroid = sd.getCentroid(points) # get the centroid of current stop
+            assert(type(centroid) == tuple and len(centroid) == 2) # ensures that centroid is a point represented by a tuple
+
+            event = "Stopping in location: " + str(centroid) # format event in string
+
+            # need to append multiple events since we are treating stop as a continuous event now
+            for k in range(i - currStopStartInd):
+                events.append(event)
+                centroids.append(centroid)
+
+            j += 1 # we have found all rows corresponding to the current stop, go to next stop
+
+        else: # did not run into the current stop
+            assert(currStopStartInd == i)
+
+            # not stopping event, denote as moving
+            events.append("Moving")
+            centroids.append(np.nan)
+
+            # need to go to next row in position dataframe
+            i += 1
+
+    # j reaches the end of stop list, but we still need to populate the events list to the same length as the original position dataframe
+    while(i < len(posDF)):
+        events.append("Moving")
+        centroids.append(np.nan)
+        i += 1
+
+    assert( len(events) == len(posDF) and len(events) == len(centroids) )
+    return events, centroids
+
+def getClosestObjs(actorDF, objDF, rng):
+    """
+    This function returns a list of tuples, where the list is of the same length as actorDF. Tuples contain the names of top objects closest to the centroid stopping points specified in actorDF. Length of tuples are specified by numOfObjs parameter
+
+    :param actorDF: pandas dataframe documenting the position of an `actor` by continuous unix timestamp. Must contain column `centroid`
+    :param objDF: pandas dataframe documenting the coordinates of all classroom objects. Must have columns: `object`, `X`, and `Y`
+    :param rng: range parameter; of any classroom objects is with the range distance of the stop centroid, this object gets thrown to the set of objects
+    :return: returns a list of tuples. List is of the same length as actorDF. Tuples contain top objects closest to centroids of stops
+    """
+    assert(type(rng) == int or type(rng) == float)
+    assert(rng > 0)
+
+    closestObjs = [] # value to be returned, going to contain dictionaries in {<objName1>:<distance1>, <objName2>:<distance2>} format
+    centroids = actorDF.centroid # centroid points for stops, represented by tuples of two ints
+    objPoints = sd.cols2tuples(objDF.X, objDF.Y) # X Y coordinates for classroom objects
+    objNames = objDF.object
+    assert(len(objNames) == len(objPoints)) # these two list/series should have one-to-one corresponding relation
+
+    i = 0 # indexing for centroids
+    while(i < len(centroids)):
+
+        centroid = centroids.iloc[i]
+        if( np.any(np.isnan(centroid)) ): # actor is not in a stop
+            closestObjs.append(np.nan)
+
+        elif(i - 1 >= 0 and centroids[i-1] == centroid): # if this current centroid is not the first one in the dataframe, and the previous centroid is the same as the current
+            objDistDict = copy.deepcopy(closestObjs[len(closestObjs)-1]) # copy the previous object-distance dictionary
+            closestObjs.append(objDistDict) # then append the copy
+
+        else: # this means that we need to go through the coordinates of all the classroom objects to find these within range and append them to closetObjs list
+            objDistDict = dict() # create an empty dictionary to hold the entries in the future
+
+            j = 0
+            while(j < len(objNames)):
+                if( sd.getDist(centroid, objPoints[j]) < rng ): # if object j within range
+                    objDistDict[ objNames[j] ] = sd.getDist(centroid, objPoints[j]) # create a new entry as <object name>:<distance to centroid>
+                j += 1
+
+            closestObjs.append(objDistDict)
+
+        i += 1
+
+    assert(len(closestObjs) == len(actorDF)) # ensure that output length is correct
+    return(closestObjs)
+
+def isEmpty(obj):
+    return not bool(obj)
+
+def getObsInTimeframe(obsDF, timeframeStart, timeframeEnd):
+    obsTimestamps = obsDF["timestamp"]
+    # timestamps of observation data are ensured to be monotonically sorted
+    timeframeStartInd = obsTimestamps.searchsorted(timeframeStart)
+    timeframeEndInd = obsTimestamps.searchsorted(timeframeEnd)
+    return obsDF.loc[timeframeStartInd:timeframeEndInd]
+
+def calcTriangulationScoreAndPercentages(posDF, obsDF, timeframe=10):
+
+    """
+    :param posDF: distilled pozyx position data with stopping event and possible subjects specified
+    :param obsDF: distilled observation log data. See observation_distilled_sprint1_shou.tsv for an example
+    :param timeframe: specified how many seconds we look back in time to find the correct subject, unit is second.
+    :return: returns right match percentage, right guess percentage, number of rewards and number of penalties
+    """
+
+    # these two counts are for the calculation of recall
+    rightMatchCount = 0
+    totalMatchCount = 0
+    # these two counts are for the calculation of ~precision
+    rightGuessCount = 0
+    totalGuessCount = 0
+
+    i_rewards = i_penalties = 0
+
+    i = 0  # indexing for observation data
+    while(i < len(obsDF)):
+        obsRow = obsDF.iloc[i]
+        obsEvent = obsRow["event"] # event name specified in observation data
+
+        # events that we can to valid with position data
+        if(obsEvent in sd.getObsStopEvents()):
+
+            trueSubjects = obsRow["subject"] # get the true subject(s) from observation data
+            assert(type(trueSubjects) == str and trueSubjects != "") # should now be a string but not empty, in format like "12;13"
+            trueSubjects = trueSubjects.split(";") # split by semicolon since seat numbers are demilited by semicolons in distilling process
+
+            # we look both back and forward in time in position dataframe to check for occurrence of the true subject
+            back = timeframe / 2
+            forward = timeframe - timeframe / 2
+            assert(back + forward == timeframe)
+            timeframeCenter = obsRow["timestamp"]
+            timeframeStart = timeframeCenter - back
+            timeframeEnd = timeframeCenter + forward
+            # filter the position dataframe to get the rows within the timeframe and stopping
+            posInTimeframe = posDF.loc[(timeframeStart < posDF["time_stamp"]) & (posDF["time_stamp"] < timeframeEnd)]
+            subjSets = posInTimeframe["possibleSubjects"]
+
+            for ind in range(len(trueSubjects)): # go thru trueSubjects list to see if they are included in possible subject sets
+                assert( trueSubjects[ind].isdigit() ) # ensure that each subject is a seat number
+
+                trueSubject = "seat" + trueSubjects[ind] # convert to "seat12" format to align with position data
+                bookMarkedSet = None # we bookmark the set we have seen to avoid counting repeating guesses/matches, only unique sets
+
+                for subjSet in subjSets:
+                    if(type(subjSet) == dict): # this means that the teacher is detected to be stopping
+                        if(isEmpty(subjSet)):
+                            i_penalties += 1 # penalize if nothing is in the set
+                        elif(trueSubject in subjSet):
+                            i_rewards += 1 # reward if true subject is in the set
+                            i_penalties += max(len(subjSet) - 1, 0) # penalize for every wrong guess in the set
+                        else:
+                            i_penalties += len(subjSet) # penalize since all guesses are wrong
+                    else: # teacher motion is detected, so subject set is NaN
+                        assert(np.isnan(subjSet))
+                        i_penalties += 1 # penalize as if it is an empty set
+
+                    # do counting for the percentages only to unique subject sets
+                    # we have seen this before, so skip
+                    if(subjSet == bookMarkedSet):
+                        pass
+                    # special case where subjSet is NaN, going to skip
+                    elif(not isinstance(subjSet, dict)):
+                        pass
+                    # we have not seen this, bookmark this set and do counting
+                    else:
+                        bookMarkedSet = subjSet
+                        totalGuessCount += len(subjSet) # the number of guesses is the number of guessed subjects
+                        totalMatchCount += 1 # one match attempt for each unique set
+                        if(trueSubject in subjSet):
+                            rightMatchCount += 1 # a correct match detected
+                            rightGuessCount += 1 # a correct guess detected
+
+        i += 1
+
+    # we are going to run through position data again just to see if there is any stopping rows in the position data that does not match to any timeframe.
+    j = 0
+    while(j < len(posDF)):
+        posRow = posDF.iloc[j]
+        if(posRow["event"] == "Moving"):
+            j += 1
+            continue # only care about stopping rows
+
+        # get the starting and ending timestamp of the timeframe
+        back = timeframe / 2
+        forward = timeframe - timeframe / 2
+        assert(back + forward == timeframe)
+        timeframeCenter = posRow["time_stamp"]
+        timeframeStart = timeframeCenter - back
+        timeframeEnd = timeframeCenter + forward
+
+        # get all the observation events within the timeframe of the stopping row
+        obsInTimeframe = getObsInTimeframe(obsDF, timeframeStart, timeframeEnd)
+        obsEvents = obsInTimeframe["event"]
+
+        # if any stopping event does exist in the stopping row's timeframe, then we don't care; if not, penalize.
+        # NOTE: `in` on a pandas Series tests the index rather than the values,
+        # this is kept as in the notebook so that sweep results stay comparable
+        if("Talking to student: ON-task" in obsEvents or
+           "Talking to student: OFF-task" in obsEvents or
+           "Talking to small group: ON-task" in obsEvents or
+           "Talking to small group: OFF-task" in obsEvents):
+            pass
+        else:
+            i_penalties += 1
+
+        j += 1
+
+    try:
+        f1 = rightMatchCount / totalMatchCount
+    except ZeroDivisionError:
+        f1 = np.nan
+    try:
+        f2 = rightGuessCount / totalGuessCount
+    except ZeroDivisionError:
+        f2 = np.nan
+    return f1, f2, i_rewards, i_penalties
+
+def getPercentages(posStops, obsStops, timeframe, epsilon=0.01):
+
+    """
+    :param posStops: stops datamined from position data, formatted as [(start_stop_1, end_stop_1), (start_stop_2, end_stop_2), ... ]
+    :param obsStops: stops datamined from observation data, formatted as [start_stop_1, start_stop_2, ... ]
+    :param timeframe: timeframe parameter specified in triangulation model
+    :return: returns three percentages, in-both%, in-position-only%, and in-observation-only%
+    """
+
+    assert(type(posStops) == list and type(obsStops) == list)
+    posStopsCount = len(posStops)
+    obsStopsCount = len(obsStops)
+    inPosCount = 0 # number of stops only in position data, not in observation data
+    inObsCount = 0 # number of stops only in observation data, not in position data
+
+    # loop thru position stops to get these only in position not in observation
+    # use the fact that obsStop is a strictly increasing list of ints
+    for posStopStart, posStopEnd in posStops:
+
+        back = timeframe / 2
+        forward = timeframe - back
+        TFstart = posStopStart - back # timeframe start
+        TFend = posStopEnd + forward  # timeframe end
+
+        for obsStop in obsStops:
+
+            if(obsStop < TFstart):
+                # observation stop is before the timeframe setup by position stop, continue to the next observation stop
+                continue
+            elif(TFstart <= obsStop and obsStop <= TFend):
+                # this position stop is corresponding to this observation stop, so break
+                break
+            else:
+                # when gets here, it means that this position stop is not corresponding to any observation stops
+                assert(TFend < obsStop)
+                inPosCount += 1
+                break
+
+    # loop thru observation stops to get these only in observation not in position
+    # use the fact that posStops is a strictly increasing list of int tuples
+    for obsStop in obsStops:
+        for posStopStart, posStopEnd in posStops:
+
+            back = timeframe / 2
+            forward = timeframe - back
+            TFstart = posStopStart - back # timeframe start
+            TFend = posStopEnd + forward  # timeframe end
+
+            if(TFend < obsStop):
+                # observation stop is before the timeframe setup by position stop, continue to the next observation stop
+                continue
+            elif(TFstart <= obsStop and obsStop <= TFend):
+                # this position stop is corresponding to this observation stop, so break
+                break
+            else:
+                # when gets here, it means that this position stop is not corresponding to any observation stops
+                assert(obsStop < TFstart)
+                inObsCount += 1
+                break
+
+    # now in-position-only and in-observation-only counts have been calculated
+    # we need to get in-both count
+    inBothCount = int((obsStopsCount + posStopsCount - inObsCount - inPosCount) / 2)
+    assert(inBothCount > 0) # safety check
+    totalCount = inBothCount + inPosCount + inObsCount
+
+    # return the percentages
+    return inBothCount / totalCount, inPosCount / totalCount, inObsCount / totalCount
+
+
+# data shared by all tasks in a sweep worker process, set by _initSweepWorker()
+_sweepData = dict()
+
+def _initSweepWorker(teacherPos, objPos, obsLog, ranges, timeframes):
+    """
+    Process pool initializer, so that the input dataframes are sent to each
+    worker once instead of once per task
+    """
+    _sweepData["teacherPos"] = teacherPos
+    _sweepData["objPos"] = objPos
+    _sweepData["objIndex"] = ClassroomObjectIndex(objPos) # seating chart is the same for every task
+    _sweepData["obsLog"] = obsLog
+    _sweepData["obsStops"] = sd.getStopsFromObs(obsLog) # observation stops do not depend on any parameter
+    _sweepData["ranges"] = ranges
+    _sweepData["timeframes"] = timeframes
+
+def _sweepDurationRadius(duration, radius):
+    """
+    Scores every (range, timeframe) combination for one (duration, radius)
+    pair, detecting stops only once
+
+    Returns:
+        pandas.DataFrame: sweep results rows of this (duration, radius) pair
+    """
+
+    teacherPos = _sweepData["teacherPos"].copy()
+    objIndex = _sweepData["objIndex"]
+    obsLog = _sweepData["obsLog"]
+    obsStops = _sweepData["obsStops"]
+
+    # call stop detection utility, get starting and end timestamp for each stop with corresponding parameters (duration, radius)
+    teacherStops = sd.getStopsFast(teacherPos.chosen_X, teacherPos.chosen_Y,
+                                   teacherPos.time_stamp, teacherPos.periodID,
+                                   teacherPos.dayID, duration, radius)
+
+    # stop percentages only depend on the timeframe, same values as getPercentages()
+    agreementDF = sd.getStopAgreement(teacherStops, obsStops, _sweepData["timeframes"])
+    percentages = { timeframe: (row.perc_of_stops_in_both, row.perc_of_stops_in_pos, row.perc_of_stops_in_obs)
+                    for timeframe, row in zip(_sweepData["timeframes"], agreementDF.itertuples()) }
+
+    # same events and centroids as getStopEvent(), derived from the stop label of each row
+    stopLabels = sd.getStopLabels(teacherPos.time_stamp, teacherStops)
+    events, centroids = sd.getStopEventsFromLabels(teacherPos.chosen_X, teacherPos.chosen_Y, stopLabels)
+    teacherPos["event"] = events # populate event column for teacher positon dataframe
+    teacherPos["centroid"] = centroids
+
+    rows = []
+    for rng in _sweepData["ranges"]:
+        rng = int(rng)
+
+        # get the objects and their correpsonding distances to centroid within rng (range)
+        # same output as getClosestObjs(teacherPos, objPos, rng), from the seating chart index
+        teacherPos["possibleSubjects"] = objIndex.getObjDistDicts(teacherPos.centroid, rng)
+
+        for timeframe in _sweepData["timeframes"]:
+            inBoth, inPos, inObs = percentages[timeframe]
+            rightMatchPercentage, rightGuessPercentage, n_rewards, n_penalties = calcTriangulationScoreAndPercentages(teacherPos, obsLog, timeframe=timeframe)
+            rows.append({"duration": duration,
+                         "radius": radius,
+                         "range": rng,
+                         "perc_of_stops_in_both": inBoth,
+                         "perc_of_stops_in_pos": inPos,
+                         "perc_of_stops_in_obs": inObs,
+                         "right_match_percentage": rightMatchPercentage,
+                         "right_guess_percentage": rightGuessPercentage,
+                         "timeframe": timeframe,
+                         "n_rewards": n_rewards,
+                         "n_penalties": n_penalties})
+
+    return pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+
+def _appendCheckpoint(checkpointPath, DF):
+    """
+    Appends finished rows to the checkpoint csv file, writing the header only
+    if the file is new
+    """
+    writeHeader = not os.path.exists(checkpointPath)
+    DF.to_csv(checkpointPath, mode="a", header=writeHeader, index=False)
+
+def runParamSweep(teacherPos, objPos, obsLog, durations, radii, ranges, timeframes,
+                  checkpointPath=None, processes=None, verbose=False):
+    """
+    Runs the same parameter sweep as run_param_sweep() in triangulation.ipynb
+    and returns the same results table. Stops are computed once per (duration,
+    radius) pair, and pairs are run in parallel over a process pool
+
+    Args:
+        teacherPos (pandas.DataFrame): teacher position data with `chosen_X`, `chosen_Y`, `time_stamp`, `dayID`, and `periodID` columns
+        objPos (pandas.DataFrame): classroom object coordinates with `object`, `X`, and `Y` columns
+        obsLog (pandas.DataFrame): distilled observation log
+        durations (Iterable[int]): grid of duration parameters
+        radii (Iterable[int]): grid of radius parameters
+        ranges (Iterable[int]): grid of range parameters
+        timeframes (Iterable[int]): grid of timeframe parameters
+        checkpointPath (str, optional): csv file that finished (duration, radius) pairs are appended to; pairs already
+            in the file are not recomputed. Defaults to None for no checkpointing.
+        processes (int, optional): number of worker processes; 1 runs in the current process. Defaults to None for one per CPU.
+        verbose (bool, optional): print progress. Defaults to False.
+
+    Returns:
+        pandas.DataFrame: sweep results, one row per (timeframe, duration, radius, range) in grid order
+    """
+
+    teacherPos = teacherPos.reset_index(drop=True) # getStopEvent() indexes rows from 0
+    pairs = [ (duration, radius) for duration in durations for radius in radii ]
+    combosPerPair = len(ranges) * len(timeframes)
+
+    # read back finished pairs from the checkpoint file
+    resultDFs = []
+    if checkpointPath != None and os.path.exists(checkpointPath):
+        checkpointDF = pd.read_csv(checkpointPath, index_col=False)
+        pairCounts = checkpointDF.groupby(["duration", "radius"]).size()
+        finishedPairs = { pair for pair, count in pairCounts.items() if count >= combosPerPair }
+        checkpointDF = checkpointDF.loc[ [ (d, r) in finishedPairs for d, r in zip(checkpointDF["duration"], checkpointDF["radius"]) ] ]
+        resultDFs.append(checkpointDF)
+        pairs = [ pair for pair in pairs if pair not in finishedPairs ]
+        if verbose: print(f"Resuming sweep, {len(finishedPairs)} (duration, radius) pairs loaded from {checkpointPath}")
+
+    def collect(pairDF, duration, radius):
+        resultDFs.append(pairDF)
+        if checkpointPath != None: _appendCheckpoint(checkpointPath, pairDF)
+        if verbose: print(f"Parameter set (duration, radius) = ({duration}, {radius}) done, {len(pairDF)} rows")
+
+    initArgs = (teacherPos, objPos, obsLog, list(ranges), list(timeframes))
+    if processes == 1:
+        _initSweepWorker(*initArgs)
+        for duration, radius in pairs:
+            collect(_sweepDurationRadius(duration, radius), duration, radius)
+    elif len(pairs) > 0:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_initSweepWorker, initargs=initArgs) as executor:
+            futures = { executor.submit(_sweepDurationRadius, duration, radius): (duration, radius)
+                        for duration, radius in pairs }
+            for future in as_completed(futures):
+                collect(future.result(), *futures[future])
+
+    sweepDF = pd.concat(resultDFs, ignore_index=True) if len(resultDFs) > 0 else pd.DataFrame(columns=SWEEP_COLUMNS)
+
+    # order rows as the nested loops of run_param_sweep(): timeframe, duration, radius, range
+    def gridOrder(col, grid):
+        position = { value: i for i, value in enumerate(grid) }
+        return sweepDF[col].map(position)
+    order = np.lexsort( (gridOrder("range", [int(rng) for rng in ranges]),
+                         gridOrder("radius", radii),
+                         gridOrder("duration", durations),
+                         gridOrder("timeframe", timeframes)) )
+    sweepDF = sweepDF.iloc[order][SWEEP_COLUMNS]
+    sweepDF.index = np.arange(len(sweepDF))
+
+    return sweepDF
+
+
+if __name__ == "__main__":
+
+    # same inputs and grid as run_param_sweep() in triangulation.ipynb
+    teacherPos = pd.read_csv("teacher_position_sprint1_shou.csv", index_col=False)
+    objPos = pd.read_csv("seating_chart_x_y_seat_only_sprint1_shou.csv", index_col=False)
+    obsLog = pd.read_csv("observation_distilled_sprint1_shou.tsv", sep="\t", index_col=False)
+
+    sweepDF = runParamSweep(teacherPos, objPos, obsLog,
+                            durations=np.arange(3, 30, step=4),
+                            radii=np.arange(200, 2000, step=200),
+                            ranges=np.arange(100, 1500, step=200),
+                            timeframes=np.arange(1, 19, step=4),
+                            checkpointPath="parameter_sweep_checkpoint.csv",
+                            verbose=True)
+    sweepDF.to_csv("parameter_sweep_master_sprint1.csv", index=False)
@@ -0,0 +1,243 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Python version of the partial correlation table of correlation_analysis.Rmd,
+# which calls ppcor::pcor.test() once per pair of variables. Here the
+# covariance matrices of every (x, y, control variables) set are built at once
+# from masked matrix products, each over the pair's own complete cases as in
+# the Rmd, and the partial correlations are read off their precision matrices.
+# P-values use the t-distribution, with the regularized incomplete beta
+# function computed in numpy. The Excel export streams rows into a write-only
+# workbook and marks p-values with conditional formatting rules instead of
+# filling cells one by one
+################################################################################
+
+import math
+import numpy as np
+import pandas as pd
+
+CONTROL_VAR_NAMES = ["PPreScore", "CPreScore", "totalTimeInTutor"]
+KC_LEVEL_COL_NAMES = ["cancel_constPerformance", "division_simplePerformance", "dividePerformance",
+                      "subtraction_constPerformance", "combine_like_constPerformance",
+                      "subtraction_varPerformance", "combine_like_varPerformance", "cancel_varPerformance",
+                      "distribute_divisionPerformance", "division_complexPerformance"]
+
+def _fixTiny(values, tiny=1e-300):
+    return np.where(np.abs(values) < tiny, tiny, values)
+
+def _betaContinuedFraction(a, b, x, maxIterations=1000, epsilon=1e-15):
+    """
+    Continued fraction of the incomplete beta function, evaluated with the
+    modified Lentz method for whole arrays at once
+    """
+    qab, qap, qam = a + b, a + 1, a - 1
+    c = np.ones_like(x)
+    d = 1 / _fixTiny(1 - qab * x / qap)
+    h = d.copy()
+    for m in range(1, maxIterations + 1):
+        m2 = 2 * m
+        numerator = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1 / _fixTiny(1 + numerator * d)
+        c = _fixTiny(1 + numerator / c)
+        h *= d * c
+        numerator = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1 / _fixTiny(1 + numerator * d)
+        c = _fixTiny(1 + numerator / c)
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1) < epsilon): break
+    return h
+
+def betaincReg(a, b, x):
+    """
+    Regularized incomplete beta function I_x(a, b), elementwise
+
+    Args:
+        a (numpy.ndarray): positive shape parameters
+        b (numpy.ndarray): positive shape parameters
+        x (numpy.ndarray): values in [0, 1]
+
+    Returns:
+        numpy.ndarray: I_x(a, b), NaN where the arguments are invalid
+    """
+
+    a, b, x = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64), np.asarray(x, dtype=np.float64))
+    result = np.full(x.shape, np.nan)
+    valid = (a > 0) & (b > 0) & (x >= 0) & (x <= 1)
+    if not np.any(valid): return result
+    a, b, x = a[valid], b[valid], x[valid]
+
+    # the continued fraction converges fast for x < (a + 1) / (a + b + 2), use I_x(a, b) = 1 - I_{1-x}(b, a) otherwise
+    swap = x > (a + 1) / (a + b + 2)
+    a, b, x = np.where(swap, b, a), np.where(swap, a, b), np.where(swap, 1 - x, x)
+
+    lgamma = np.frompyfunc(math.lgamma, 1, 1)
+    logBeta = (lgamma(a) + lgamma(b) - lgamma(a + b)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        front = np.exp(a * np.log(x) + b * np.log1p(-x) - logBeta) / a
+    value = front * _betaContinuedFraction(a, b, x)
+
+    result[valid] = np.clip(np.where(swap, 1 - value, value), 0, 1)
+    return result
+
+def tTestPValue(t, df):
+    """
+    Two-sided p-value of t statistics with df degrees of freedom, i.e.
+    2 * pt(-|t|, df) in R
+    """
+    t, df = np.broadcast_arrays(np.asarray(t, dtype=np.float64), np.asarray(df, dtype=np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(np.isinf(t), 0.0, df / (df + t**2))
+    return betaincReg(df / 2, 0.5, x)
+
+def getPartialCorrMatrix(DF, varNames, controlVarNames=CONTROL_VAR_NAMES):
+    """
+    Pearson partial correlation of every pair of variables controlling for
+    the control variables, same as ppcor::pcor.test() run on the complete
+    cases of each (x, y, controls) set. A variable with itself has estimate
+    1 and p-value 0
+
+    Args:
+        DF (pandas.DataFrame): data, NaN for missing values
+        varNames (List[str]): numeric columns to correlate
+        controlVarNames (List[str], optional): numeric columns to control for. Defaults to CONTROL_VAR_NAMES.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray): estimate, p-value and number of complete cases
+            matrices, of shape len(varNames) x len(varNames); NaN where there are too few cases
+    """
+
+    X = DF[list(varNames)].to_numpy(dtype=np.float64)
+    Z = DF[list(controlVarNames)].to_numpy(dtype=np.float64).reshape(len(DF), len(controlVarNames))
+    numOfVars, numOfControls = X.shape[1], Z.shape[1]
+
+    # rows usable for each variable, given that the controls must be complete too
+    isControlComplete = ~np.isnan(Z).any(axis=1)
+    mask = (~np.isnan(X) & isControlComplete[:, None]).astype(np.float64)
+    # centering does not change covariances but keeps the sums below small
+    with np.errstate(invalid="ignore"):
+        X = np.where(mask > 0, X - np.nanmean(np.where(mask > 0, X, np.nan), axis=0), 0.0)
+        Z = np.where(isControlComplete[:, None], Z - Z[isControlComplete].mean(axis=0), 0.0) if np.any(isControlComplete) else np.zeros_like(Z)
+    X = np.nan_to_num(X)
+
+    # sums over the complete cases of each pair (i, j): element [i, j] sums over rows where both i and j are usable
+    N = mask.T @ mask
+    sums = [X.T @ mask, (X.T @ mask).T] + [(mask * Z[:, [a]]).T @ mask for a in range(numOfControls)]
+    sizeOfSet = 2 + numOfControls
+    moments = np.empty((numOfVars, numOfVars, sizeOfSet, sizeOfSet))
+    moments[:, :, 0, 0] = (X**2).T @ mask
+    moments[:, :, 1, 1] = moments[:, :, 0, 0].T
+    moments[:, :, 0, 1] = moments[:, :, 1, 0] = X.T @ X
+    for a in range(numOfControls):
+        crossMoment = (X * Z[:, [a]]).T @ mask
+        moments[:, :, 0, 2 + a] = moments[:, :, 2 + a, 0] = crossMoment
+        moments[:, :, 1, 2 + a] = moments[:, :, 2 + a, 1] = crossMoment.T
+        for b in range(a, numOfControls):
+            moments[:, :, 2 + a, 2 + b] = moments[:, :, 2 + b, 2 + a] = (mask * (Z[:, [a]] * Z[:, [b]])).T @ mask
+
+    sums = np.stack(sums, axis=-1)
+    degreesOfFreedom = N - 2 - numOfControls
+    enoughCases = degreesOfFreedom >= 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (moments - sums[..., :, None] * sums[..., None, :] / N[..., None, None]) / (N[..., None, None] - 1)
+    cov[~enoughCases] = np.eye(sizeOfSet) # placeholder, results are set to NaN below
+
+    # as ppcor, the generalized inverse is used for (near) singular covariance matrices
+    isSingular = np.linalg.det(cov) < np.finfo(np.float64).eps
+    precision = np.empty_like(cov)
+    if np.any(~isSingular): precision[~isSingular] = np.linalg.inv(cov[~isSingular])
+    if np.any(isSingular): precision[isSingular] = np.linalg.pinv(cov[isSingular], hermitian=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimate = np.clip(-precision[..., 0, 1] / np.sqrt(precision[..., 0, 0] * precision[..., 1, 1]), -1, 1)
+        statistic = estimate * np.sqrt(degreesOfFreedom / (1 - estimate**2))
+    pValue = tTestPValue(statistic, np.maximum(degreesOfFreedom, 1))
+
+    estimate[~enoughCases], pValue[~enoughCases] = np.nan, np.nan
+    np.fill_diagonal(estimate, np.where(np.diag(enoughCases), 1.0, np.nan))
+    np.fill_diagonal(pValue, np.where(np.diag(enoughCases), 0.0, np.nan))
+
+    return estimate, pValue, N.astype(np.int64)
+
+def getPartialCorrTable(DF, varNames=None, controlVarNames=CONTROL_VAR_NAMES, excludeColNames=KC_LEVEL_COL_NAMES):
+    """
+    Partial correlation table in the layout written by
+    correlation_analysis.Rmd: one row per variable, with a `varName` column
+    followed by `{name}_estimate` and `{name}_p_value` columns for every
+    other variable
+
+    Args:
+        DF (pandas.DataFrame): usually the exported analytics data
+        varNames (List[str], optional): variables of the table. Defaults to all numeric columns except the
+            control variables and `excludeColNames`.
+        controlVarNames (List[str], optional): Defaults to CONTROL_VAR_NAMES.
+        excludeColNames (List[str], optional): Defaults to the KC level performance columns.
+
+    Returns:
+        pandas.DataFrame: partial correlation table
+    """
+
+    if varNames == None:
+        varNames = [ col for col in DF.columns if pd.api.types.is_numeric_dtype(DF[col])
+                     and col not in controlVarNames and col not in excludeColNames ]
+    estimate, pValue, _ = getPartialCorrMatrix(DF, varNames, controlVarNames)
+
+    # interleave estimate and p-value columns
+    values = np.empty((len(varNames), 2 * len(varNames)))
+    values[:, 0::2], values[:, 1::2] = estimate, pValue
+    colNames = [ f"{name}_{kind}" for name in varNames for kind in ["estimate", "p_value"] ]
+    tableDF = pd.DataFrame(values, columns=colNames)
+    tableDF.insert(0, "varName", varNames)
+
+    return tableDF
+
+def writePartialCorrExcel(tableDF, outputPath, significance=0.05, marginalSignificance=0.1):
+    """
+    Writes a partial correlation table to an Excel file, with p-values below
+    `significance` in red and below `marginalSignificance` in yellow, same
+    colours as annotate_partial_corr_table.createExcel(). Rows are streamed
+    into a write-only workbook, and the colours are conditional formatting
+    rules on the p-value columns, so the cost is one pass over the rows
+
+    Args:
+        tableDF (pandas.DataFrame): table with p-value columns containing "p_value" in their names
+        outputPath (str): path of the .xlsx file
+        significance (float, optional): Defaults to 0.05.
+        marginalSignificance (float, optional): Defaults to 0.1.
+    """
+
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+
+    redFill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
+    yellowFill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+    lastRow = len(tableDF) + 1
+    for col, name in enumerate(tableDF.columns, start=1):
+        if "p_value" not in name or lastRow < 2: continue
+        letter = get_column_letter(col)
+        # ISNUMBER keeps empty cells (NaN p-values) uncoloured, Excel compares them as 0 otherwise
+        # rules are checked in order, red takes precedence over yellow
+        ws.conditional_formatting.add(f"{letter}2:{letter}{lastRow}",
+                                      FormulaRule(formula=[f"AND(ISNUMBER({letter}2),{letter}2<{significance})"], fill=redFill, stopIfTrue=True))
+        ws.conditional_formatting.add(f"{letter}2:{letter}{lastRow}",
+                                      FormulaRule(formula=[f"AND(ISNUMBER({letter}2),{letter}2<{marginalSignificance})"], fill=yellowFill))
+
+    ws.append(list(tableDF.columns))
+    for row in tableDF.itertuples(index=False, name=None):
+        # empty cells for NaN, so they are not coloured
+        ws.append([ None if isinstance(value, float) and np.isnan(value) else value for value in row ])
+
+    wb.save(outputPath)
+
+
+if __name__ == "__main__":
+
+    analyticsDF = pd.read_csv("output_files/analytics_data.csv", index_col=False)
+    tableDF = getPartialCorrTable(analyticsDF)
+    tableDF.to_csv("output_files/partial_corrlation_table.csv", index=False)
+    writePartialCorrExcel(tableDF, "output_files/part_corr_tb_annotated.xlsx")
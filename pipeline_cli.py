@@ -0,0 +1,340 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Command-line entry point of the end-to-end pipeline, replacing the manual
+# run of tutor_distill, triangulation, merge_modalities, the analytics
+# notebook and the Rmd reports. Targets and their inputs, parameters and
+# outputs come from a json config (see pipeline_config.json). Like make, a
+# target is rebuilt only if its outputs are missing or changed, or the hash
+# of an input file, a parameter value or the source of its recipe and the
+# modules the recipe calls into differs from the state recorded at its last
+# build. A target depends on another if it reads one of its outputs;
+# targets whose dependencies are up to date are built concurrently
+#
+# usage: python pipeline_cli.py [targets ...] --config pipeline_config.json --jobs 4
+################################################################################
+
+import os
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import tutorDataAPI as tutorAPI
+import detectorDataAPI as detectorAPI
+import stop_detection as sd
+import spatial_index
+import id_resolution
+import class_schedule
+import event_master
+import feature_pipeline
+import param_sweep
+from class_schedule import ClassSchedule, getRETTLSchedule
+from feature_pipeline import hashFile, hashCode
+
+def hashPath(path):
+    """
+    Content hash of a file, or of all files under a directory; None if the
+    path does not exist
+    """
+    if os.path.isfile(path): return hashFile(path)
+    if not os.path.isdir(path): return None
+    hashes = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fileName in sorted(files):
+            fullPath = os.path.join(root, fileName)
+            hashes.append(f"{os.path.relpath(fullPath, path)}={hashFile(fullPath)}")
+    return feature_pipeline.hashOutput(hashes)
+
+
+class Target:
+
+    """
+    A pipeline target: recipe(inputs, params, outputs) reads the files in
+    `inputs` and writes the files in `outputs`, both mappings from a name to
+    a path. The recipe should be a module level function so that it can be
+    run in a worker process. `code` lists the modules the recipe calls into;
+    their source and the recipe's are hashed into the state
+    """
+
+    def __init__(self, name, recipe, inputs, params, outputs, code=None):
+        self.name = name
+        self.recipe = recipe
+        self.inputs = dict(inputs)
+        self.params = dict(params)
+        self.outputs = dict(outputs)
+        # hashed here since modules cannot be sent to worker processes
+        self.codeHash = feature_pipeline.hashOutput([hashCode(recipe)] + [ f"{obj.__name__}={hashCode(obj)}" for obj in code or [] ])
+
+    def getState(self):
+        """
+        Current hashes of the input files, parameter values and code, as
+        recorded in the state file
+        """
+        return {"inputs": { path: hashPath(path) for path in sorted(self.inputs.values()) },
+                "params": json.loads(json.dumps(self.params, sort_keys=True, default=str)),
+                "code": self.codeHash}
+
+    def getOutputState(self):
+        return { path: hashPath(path) for path in sorted(self.outputs.values()) }
+
+
+################################################################################
+# recipes
+################################################################################
+
+def _getSchedule(inputs):
+    return ClassSchedule.fromCSV(inputs["schedule"]) if "schedule" in inputs else getRETTLSchedule()
+
+def buildTutorEvents(inputs, params, outputs):
+    tutorLogDF = tutorAPI.getAnnotatedTutorLogDF(inputs["tutorLog"],
+                                                 startTimestamp=tutorAPI.EDTDatetime2epoch(params["experimentStart"]),
+                                                 endTimestamp=tutorAPI.EDTDatetime2epoch(params["experimentEnd"]))
+    event_master.distillTutorEvents(tutorLogDF, _getSchedule(inputs)).to_csv(outputs["tutorEvents"], index=False)
+
+def buildDetectorEvents(inputs, params, outputs):
+    detectorDF = detectorAPI.getDetectorResultsDF(inputs["detectorResults"])
+    detectorAPI.getDetectorEvents(detectorDF, params["detectors"]).to_csv(outputs["detectorEvents"], index=False)
+
+def buildEventMaster(inputs, params, outputs):
+    positionRawDF = pd.read_csv(inputs["teacherPosition"], index_col=False)
+    objPos = pd.read_csv(inputs["seatingChart"], index_col=False)
+    mappingDF = pd.read_csv(inputs["studentPosition"], index_col=False)
+    eventMasterDF = event_master.buildEventMaster(event_master.getTutorEventsDF(inputs["tutorEvents"]),
+                                                  event_master.getPositionEventsDF(positionRawDF, objPos, params["duration"],
+                                                                                   params["radius"], params["rng"]),
+                                                  event_master.getObservationEventsDF(inputs["observationEvents"]),
+                                                  mappingDF,
+                                                  pd.read_csv(inputs["detectorEvents"], index_col=False))
+    eventMasterDF.to_csv(outputs["eventMaster"], index=False)
+
+def buildParamSweep(inputs, params, outputs):
+    sweepDF = param_sweep.runParamSweep(pd.read_csv(inputs["teacherPosition"], index_col=False),
+                                        pd.read_csv(inputs["seatingChart"], index_col=False),
+                                        pd.read_csv(inputs["observationLog"], sep="\t", index_col=False),
+                                        durations=np.arange(*params["durations"]),
+                                        radii=np.arange(*params["radii"]),
+                                        ranges=np.arange(*params["ranges"]),
+                                        timeframes=np.arange(*params["timeframes"]),
+                                        processes=1)
+    sweepDF.to_csv(outputs["sweep"], index=False)
+
+def buildAnalytics(inputs, params, outputs):
+    pipeline = feature_pipeline.getAnalyticsPipeline({ rng: inputs[f"eventMaster_rng{rng}"] for rng in feature_pipeline.RNGS },
+                                                     tutorLogPath=inputs["tutorLog"],
+                                                     detectorResultsPath=inputs["detectorResults"],
+                                                     scoresPath=inputs["prePostScores"],
+                                                     IDMappingPath=inputs["studentPosition"],
+                                                     cacheDir=params["featureCacheDir"],
+                                                     processes=1)
+    feature_pipeline.exportAnalyticsDF(pipeline.run(["analytics"], verbose=False)["analytics"], outputs["analytics"])
+
+def renderReport(inputs, params, outputs):
+    outputPath = os.path.abspath(outputs["report"])
+    expression = f"rmarkdown::render({json.dumps(inputs['report'])}, " + \
+                 f"output_file={json.dumps(os.path.basename(outputPath))}, output_dir={json.dumps(os.path.dirname(outputPath))})"
+    subprocess.run(["Rscript", "-e", expression], check=True)
+
+
+################################################################################
+# targets and scheduling
+################################################################################
+
+def getTargets(config):
+    """
+    Builds the targets of the pipeline from a config dictionary, see
+    pipeline_config.json for its layout. The `data` of a report lists paths
+    or names of targets whose outputs the report reads
+
+    Returns:
+        dict: mapping from target name to Target
+    """
+
+    files, params, outputDir = config["inputs"], config["params"], config.get("outputDir", "output_files")
+    def output(fileName): return os.path.join(outputDir, fileName)
+    schedule = { "schedule": files["schedule"] } if "schedule" in files else {}
+
+    tutorEvents = output("tutor_events.csv")
+    detectorEvents = output("detector_events.csv")
+    eventMasters = { rng: output(f"event_master_file_D{params['duration']}_R{params['radius']}_RNG{rng}_sprint2_shou.csv")
+                     for rng in params["rngs"] }
+
+    targets = [Target("tutor_events", buildTutorEvents,
+                      dict(tutorLog=files["tutorLog"], **schedule),
+                      { key: params[key] for key in ["experimentStart", "experimentEnd"] },
+                      {"tutorEvents": tutorEvents},
+                      code=[tutorAPI, class_schedule, event_master]),
+               Target("detector_events", buildDetectorEvents,
+                      {"detectorResults": files["detectorResults"]},
+                      {"detectors": params["detectors"]},
+                      {"detectorEvents": detectorEvents},
+                      code=[detectorAPI]),
+               Target("param_sweep", buildParamSweep,
+                      {"teacherPosition": files["sweepTeacherPosition"],
+                       "seatingChart": files["sweepSeatingChart"],
+                       "observationLog": files["observationLog"]},
+                      params["sweep"],
+                      {"sweep": output("parameter_sweep_master_sprint1.csv")},
+                      code=[param_sweep, sd, spatial_index])]
+
+    for rng, path in eventMasters.items():
+        targets.append(Target(f"event_master_rng{rng}", buildEventMaster,
+                              {"tutorEvents": tutorEvents,
+                               "detectorEvents": detectorEvents,
+                               "teacherPosition": files["teacherPosition"],
+                               "seatingChart": files["seatingChart"],
+                               "studentPosition": files["studentPosition"],
+                               "observationEvents": files["observationEvents"]},
+                              {"duration": params["duration"], "radius": params["radius"], "rng": rng},
+                              {"eventMaster": path},
+                              code=[event_master, sd, spatial_index, id_resolution, detectorAPI]))
+
+    assert set(feature_pipeline.RNGS) <= set(eventMasters), f"Analytics needs the event master files of rng {feature_pipeline.RNGS}"
+    targets.append(Target("analytics", buildAnalytics,
+                          dict({ f"eventMaster_rng{rng}": eventMasters[rng] for rng in feature_pipeline.RNGS },
+                               tutorLog=files["tutorLog"],
+                               detectorResults=files["detectorResults"],
+                               prePostScores=files["prePostScores"],
+                               studentPosition=files["studentPosition"]),
+                          {"featureCacheDir": output("feature_cache")},
+                          {"analytics": output("analytics_data.csv")},
+                          code=[feature_pipeline] + feature_pipeline.CODE_MODULES))
+
+    # report data may name a target instead of a path, standing for all of its outputs
+    outputsByTarget = { target.name: list(target.outputs.values()) for target in targets }
+    for name, report in config.get("reports", {}).items():
+        dataPaths = [ path for data in report.get("data", []) for path in outputsByTarget.get(data, [data]) ]
+        targets.append(Target(name, renderReport,
+                              dict({ f"data{i}": path for i, path in enumerate(dataPaths) }, report=report["input"]),
+                              {},
+                              {"report": report["output"]}))
+
+    return { target.name: target for target in targets }
+
+def getDependencies(targets):
+    """
+    Returns a mapping from target name to the names of the targets producing
+    its input files
+    """
+    producers = { path: target.name for target in targets.values() for path in target.outputs.values() }
+    return { name: sorted({ producers[path] for path in target.inputs.values() if path in producers } - {name})
+             for name, target in targets.items() }
+
+def _buildTarget(target):
+    start = time.perf_counter()
+    for path in target.outputs.values():
+        directory = os.path.dirname(path)
+        if directory != "": os.makedirs(directory, exist_ok=True)
+    target.recipe(target.inputs, target.params, target.outputs)
+    return time.perf_counter() - start
+
+def readState(path):
+    if not os.path.exists(path): return dict()
+    with open(path) as stateFile: return json.load(stateFile)
+
+def writeState(path, state):
+    directory = os.path.dirname(path)
+    if directory != "": os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w") as stateFile: json.dump(state, stateFile, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def isUpToDate(target, state):
+    """
+    Whether the outputs of a target exist and are unchanged since its last
+    build, and its input hashes, parameters and code hash equal those of the
+    last build
+    """
+    if target.name not in state: return False
+    recorded = state[target.name]
+    outputState = target.getOutputState()
+    return all(value != None for value in outputState.values()) and outputState == recorded["outputs"] and \
+           target.getState() == {"inputs": recorded["inputs"], "params": recorded["params"], "code": recorded.get("code")}
+
+def runPipeline(config, targetNames=None, jobs=None, force=False, dryRun=False):
+    """
+    Brings the requested targets, and the targets they depend on, up to date
+
+    Args:
+        config (dict): pipeline config
+        targetNames (Iterable[str], optional): targets to build. Defaults to config["defaultTargets"], or all targets.
+        jobs (int, optional): number of concurrent builds. Defaults to os.cpu_count().
+        force (bool, optional): rebuild regardless of the recorded state. Defaults to False.
+        dryRun (bool, optional): only print the targets that would be rebuilt. Defaults to False.
+
+    Returns:
+        dict: mapping from target name to "up to date", "built" or "would build"
+    """
+
+    targets = getTargets(config)
+    dependencies = getDependencies(targets)
+    stateFile = config.get("stateFile", os.path.join(config.get("outputDir", "output_files"), "pipeline_state.json"))
+    state = readState(stateFile)
+
+    # requested targets and everything they depend on
+    needed = []
+    def visit(name):
+        assert name in targets, f"Unknown target <{name}>"
+        if name in needed: return
+        for dependency in dependencies[name]: visit(dependency)
+        needed.append(name)
+    for name in (targetNames or config.get("defaultTargets") or list(targets)): visit(name)
+
+    status = dict()
+    pending = list(needed)
+    running = dict() # mapping: future -> target name
+    executor = ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            # a target is checked once its dependencies are done, since their outputs are its inputs
+            ready = [ name for name in pending if all(status.get(dependency) in ("up to date", "built", "would build")
+                                                      for dependency in dependencies[name]) ]
+            for name in ready:
+                pending.remove(name)
+                rebuiltDependency = any(status[dependency] == "would build" for dependency in dependencies[name])
+                if not force and not rebuiltDependency and isUpToDate(targets[name], state):
+                    status[name] = "up to date"
+                    print(f"<{name}> is up to date")
+                elif dryRun:
+                    status[name] = "would build"
+                    print(f"<{name}> would be rebuilt")
+                else:
+                    print(f"<{name}> building ...")
+                    running[executor.submit(_buildTarget, targets[name])] = name
+
+            if len(ready) > 0 or len(running) == 0: continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                seconds = future.result() # re-raises a failed build, leaving its state unrecorded
+                status[name] = "built"
+                state[name] = dict(targets[name].getState(), outputs=targets[name].getOutputState())
+                writeState(stateFile, state)
+                print(f"<{name}> built in {seconds:.1f} s")
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    return status
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Builds the RETTL analytics pipeline, rebuilding only what changed")
+    parser.add_argument("targets", nargs="*", help="targets to build, defaults to the config's defaultTargets")
+    parser.add_argument("--config", default="pipeline_config.json", help="json config of inputs, parameters and reports")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="number of targets built at the same time")
+    parser.add_argument("--force", action="store_true", help="rebuild all requested targets")
+    parser.add_argument("--dry-run", "-n", action="store_true", help="only print what would be rebuilt")
+    parser.add_argument("--list", action="store_true", help="list the targets and their dependencies")
+    args = parser.parse_args()
+
+    with open(args.config) as configFile: config = json.load(configFile)
+
+    if args.list:
+        targets = getTargets(config)
+        for name, dependencies in getDependencies(targets).items():
+            print(f"{name}: {', '.join(dependencies) or '-'}  ->  {', '.join(targets[name].outputs.values())}")
+    else:
+        runPipeline(config, targetNames=args.targets, jobs=args.jobs, force=args.force, dryRun=args.dry_run)
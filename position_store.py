@@ -0,0 +1,241 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Compact binary storage of teacher position traces. A trace is stored as one
+# .npy file per column (float32 coordinates, float64 time stamps, int8 day and
+# period ID's with -1 for NaN) plus a small json manifest holding the row range
+# of every (dayID, periodID) run. Columns are memory-mapped on load, so slicing
+# out a period does not copy or parse anything. The resampling functions bound
+# the number of samples per second before stop detection
+################################################################################
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import stop_detection as sd
+
+# column name in the position dataframe -> (file name, dtype on disk)
+STORE_COLUMNS = {"chosen_X": ("X.npy", np.float32),
+                 "chosen_Y": ("Y.npy", np.float32),
+                 "time_stamp": ("time_stamp.npy", np.float64),
+                 "dayID": ("dayID.npy", np.int8),
+                 "periodID": ("periodID.npy", np.int8)}
+ID_COLUMNS = ["dayID", "periodID"]
+MISSING_ID = -1 # day/period ID on disk for rows not in any class window
+
+def savePositionStore(positionDF, directory):
+    """
+    Writes a teacher position dataframe to the binary layout
+
+    Args:
+        positionDF (pandas.DataFrame): position trace with `chosen_X`, `chosen_Y`, `time_stamp`, `dayID` and `periodID` columns, sorted by time
+        directory (str): output directory, created if not existing
+    """
+
+    for col in STORE_COLUMNS: assert col in positionDF.columns, f"Position data does not have column <{col}>"
+    assert positionDF["time_stamp"].is_monotonic_increasing, "Position data should be sorted by time stamp"
+
+    os.makedirs(directory, exist_ok=True)
+    for col, (fileName, dtype) in STORE_COLUMNS.items():
+        values = positionDF[col].to_numpy(dtype=np.float64)
+        if col in ID_COLUMNS:
+            assert np.all(np.isnan(values) | ((values >= 0) & (values <= np.iinfo(dtype).max))), \
+                   f"Column <{col}> does not fit in {np.dtype(dtype).name}"
+            values = np.where(np.isnan(values), MISSING_ID, values)
+        np.save(os.path.join(directory, fileName), values.astype(dtype))
+
+    # row range of each run of the same (dayID, periodID), NaN rows are left out
+    runStarts = sd.getSessionRuns(positionDF["periodID"], positionDF["dayID"])
+    days = positionDF["dayID"].to_numpy(dtype=np.float64)
+    periods = positionDF["periodID"].to_numpy(dtype=np.float64)
+    runs = [ [int(days[start]), int(periods[start]), int(start), int(end)]
+             for start, end in zip(runStarts[:-1].tolist(), runStarts[1:].tolist())
+             if not (np.isnan(days[start]) or np.isnan(periods[start])) ]
+
+    with open(os.path.join(directory, "manifest.json"), "w") as manifestFile:
+        json.dump({"numOfRows": len(positionDF), "runs": runs}, manifestFile)
+
+def convertPositionCSV(path, directory, schedule=None):
+    """
+    Converts a teacher position csv file, e.g. teacher_position_sprint1_shou.csv,
+    to the binary layout. See stop_detection.getTeacherPositionDF() for the
+    arguments
+    """
+    savePositionStore(sd.getTeacherPositionDF(path, schedule=schedule), directory)
+
+
+class PositionStore:
+
+    """
+    Memory-mapped teacher position trace written by savePositionStore().
+    Arrays returned by this class are read-only views into the files unless
+    noted otherwise
+    """
+
+    def __init__(self, directory):
+
+        with open(os.path.join(directory, "manifest.json")) as manifestFile:
+            manifest = json.load(manifestFile)
+
+        self.columns = { col: np.load(os.path.join(directory, fileName), mmap_mode="r")
+                         for col, (fileName, dtype) in STORE_COLUMNS.items() }
+        for col in self.columns: assert len(self.columns[col]) == manifest["numOfRows"], f"Column <{col}> is truncated"
+
+        # mapping: (dayID, periodID) -> list of [start, end) row ranges
+        self.runs = dict()
+        for dayID, periodID, start, end in manifest["runs"]:
+            self.runs.setdefault((dayID, periodID), []).append((start, end))
+
+    def __len__(self):
+        return len(self.columns["time_stamp"])
+
+    def getPeriods(self):
+        """
+        Returns the (dayID, periodID) keys in the trace, in time order
+        """
+        return list(self.runs.keys())
+
+    def getRowRange(self, dayID, periodID):
+        """
+        Returns the [start, end) row range of a class period. A period
+        interrupted by rows of another period (or rows outside any period) is
+        not a single range, in which case an AssertionError is raised
+        """
+        assert (dayID, periodID) in self.runs, f"No position data for day {dayID} period {periodID}"
+        ranges = self.runs[(dayID, periodID)]
+        assert len(ranges) == 1, f"Day {dayID} period {periodID} is not contiguous in the trace"
+        return ranges[0]
+
+    def getArrays(self, dayID=None, periodID=None):
+        """
+        Returns the columns of the whole trace, or of one period, in the order
+        of the getStops() arguments. Coordinates and time stamps are views;
+        day and period ID's are converted back to floats with NaN, so that
+        stop detection treats rows outside class windows the same as with the
+        csv data
+
+        Returns:
+            (numpy.ndarray, ...): X, Y, timestamp, periods, days
+        """
+
+        start, end = (0, len(self)) if dayID == None and periodID == None else self.getRowRange(dayID, periodID)
+        IDs = dict()
+        for col in ID_COLUMNS:
+            values = self.columns[col][start: end]
+            IDs[col] = np.where(values == MISSING_ID, np.nan, values.astype(np.float64))
+
+        return (self.columns["chosen_X"][start: end],
+                self.columns["chosen_Y"][start: end],
+                self.columns["time_stamp"][start: end],
+                IDs["periodID"],
+                IDs["dayID"])
+
+    def toDF(self, dayID=None, periodID=None):
+        """
+        Returns the whole trace, or one period, as a dataframe with the same
+        columns as stop_detection.getTeacherPositionDF(). Data are copied
+        """
+
+        X, Y, timestamp, periods, days = self.getArrays(dayID, periodID)
+        return pd.DataFrame({"chosen_X": X.astype(np.float64),
+                             "chosen_Y": Y.astype(np.float64),
+                             "time_stamp": np.array(timestamp),
+                             "dayID": days,
+                             "periodID": periods})
+
+
+def _runBins(timestamp, periods, days, rate):
+    """
+    Splits the trace into bins of 1/rate second, counted from the first
+    sample of each (dayID, periodID) run so that no bin spans two runs
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): run start indices (followed by the number of rows) and the bin of each row
+    """
+
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    runStarts = sd.getSessionRuns(periods, days)
+    runOfRow = np.repeat(np.arange(len(runStarts) - 1), np.diff(runStarts))
+    bins = np.floor((timestamp - timestamp[runStarts[:-1]][runOfRow]) * rate).astype(np.int64)
+
+    return runStarts, bins
+
+def decimatePositionDF(positionDF, rate):
+    """
+    Keeps the first sample of every 1/rate second window within each
+    (dayID, periodID) run, so that the trace has at most `rate` samples per
+    second. Samples are kept as recorded
+
+    Args:
+        positionDF (pandas.DataFrame): position trace sorted by time, with `time_stamp`, `dayID` and `periodID` columns
+        rate (float): maximum number of samples per second
+
+    Returns:
+        pandas.DataFrame: decimated position trace
+    """
+
+    assert rate > 0, "Rate should be positive"
+    if len(positionDF) == 0: return positionDF.copy()
+
+    runStarts, bins = _runBins(positionDF["time_stamp"], positionDF["periodID"], positionDF["dayID"], rate)
+    isFirstOfBin = np.ones(len(positionDF), dtype=bool)
+    isFirstOfBin[1:] = bins[1:] != bins[:-1]
+    isFirstOfBin[runStarts[:-1]] = True
+
+    return positionDF.loc[isFirstOfBin].reset_index(drop=True)
+
+def resamplePositionDF(positionDF, rate):
+    """
+    Resamples the trace to a uniform rate within each (dayID, periodID) run.
+    Samples are placed every 1/rate second from the start of the run, with
+    coordinates linearly interpolated between the recorded samples. Rows
+    outside class windows (NaN day/period ID's) are kept as recorded
+
+    Args:
+        positionDF (pandas.DataFrame): position trace sorted by time, with `chosen_X`, `chosen_Y`, `time_stamp`, `dayID` and `periodID` columns
+        rate (float): number of samples per second
+
+    Returns:
+        pandas.DataFrame: resampled position trace with the same columns
+    """
+
+    assert rate > 0, "Rate should be positive"
+    if len(positionDF) == 0: return positionDF[list(STORE_COLUMNS)].copy()
+
+    timestamp = positionDF["time_stamp"].to_numpy(dtype=np.float64)
+    X = positionDF["chosen_X"].to_numpy(dtype=np.float64)
+    Y = positionDF["chosen_Y"].to_numpy(dtype=np.float64)
+    days = positionDF["dayID"].to_numpy(dtype=np.float64)
+    periods = positionDF["periodID"].to_numpy(dtype=np.float64)
+    runStarts = sd.getSessionRuns(periods, days)
+
+    # number of uniform samples of each run, the last one at or before the run's last sample
+    firsts, lasts = runStarts[:-1], runStarts[1:] - 1
+    counts = np.floor((timestamp[lasts] - timestamp[firsts]) * rate).astype(np.int64) + 1
+    runOfSample = np.repeat(np.arange(len(firsts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    newTimestamp = timestamp[firsts][runOfSample] + offsets / rate
+
+    # fractional row index of each new sample; runs are in time order and each
+    # new sample lies within its own run, clipping only guards against ties
+    # at run boundaries and rounding
+    newIndex = np.interp(newTimestamp, timestamp, np.arange(len(timestamp), dtype=np.float64))
+    newIndex = np.clip(newIndex, firsts[runOfSample], lasts[runOfSample])
+
+    lower = np.floor(newIndex).astype(np.int64)
+    upper = np.minimum(lower + 1, lasts[runOfSample])
+    weight = newIndex - lower
+
+    return pd.DataFrame({"chosen_X": X[lower] + (X[upper] - X[lower]) * weight,
+                         "chosen_Y": Y[lower] + (Y[upper] - Y[lower]) * weight,
+                         "time_stamp": newTimestamp,
+                         "dayID": days[runStarts[:-1]][runOfSample],
+                         "periodID": periods[runStarts[:-1]][runOfSample]})
+
+
+if __name__ == "__main__":
+
+    convertPositionCSV("output_files/teacher_position_sprint1_shou.csv", "output_files/teacher_position_store")
+    store = PositionStore("output_files/teacher_position_store")
+    print(len(store), "rows,", len(store.getPeriods()), "periods")
@@ -0,0 +1,189 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Opt-in instrumentation of the API modules. Functions decorated with
+# @instrument, and code blocks wrapped in section(), record wall time, call
+# counts, input row counts and peak memory while a Profiler is active:
+#
+#     with Profiler() as profiler:
+#         tutorLogDF = tutorAPI.getAnnotatedTutorLogDF(path)
+#     print(profiler.report())
+#
+# Without an active Profiler an instrumented function costs one extra call and
+# a global check. Times and memory are inclusive of nested instrumented calls.
+# Calls made in worker processes (e.g. stop_detection.getStopsParallel()) are
+# not recorded
+################################################################################
+
+import json
+import time
+import functools
+import tracemalloc
+import pandas as pd
+
+_activeProfiler = None # the Profiler recording calls, None when profiling is off
+
+def _numOfRows(args):
+    """
+    Number of rows of the first argument if it is a dataframe, series or
+    array; None otherwise
+    """
+    if len(args) == 0: return None
+    shape = getattr(args[0], "shape", None)
+    return shape[0] if shape != None and len(shape) > 0 else None
+
+def instrument(func):
+    """
+    Decorator recording the calls of a function in the active Profiler,
+    under the name `module.qualname`
+    """
+
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _activeProfiler is None: return func(*args, **kwargs)
+        return _activeProfiler.call(name, func, args, kwargs)
+
+    return wrapper
+
+class _Section:
+
+    def __init__(self, profiler, name, rows):
+        self.profiler, self.name, self.rows = profiler, name, rows
+
+    def __enter__(self):
+        self.profiler._enter()
+        return self
+
+    def __exit__(self, *excInfo):
+        self.profiler._exit(self.name, self.rows)
+        return False
+
+class _NullSection:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        return False
+
+_NULL_SECTION = _NullSection()
+
+def section(name, rows=None):
+    """
+    Context manager recording a code block in the active Profiler, e.g. the
+    csv parsing inside a loader. Does nothing when profiling is off
+
+    Args:
+        name (str): name of the block in the report
+        rows (int, optional): number of input rows to record. Defaults to None.
+    """
+    if _activeProfiler is None: return _NULL_SECTION
+    return _Section(_activeProfiler, name, rows)
+
+
+class Profiler:
+
+    """
+    Context manager turning the instrumentation on. Each function or section
+    gets a record of its call count, total and maximum wall time, total input
+    rows and peak memory (the largest increase of traced memory during one
+    call). Profilers do not nest; entering one while another is active raises
+    an AssertionError
+    """
+
+    def __init__(self, traceMemory=True):
+        """
+        Args:
+            traceMemory (bool, optional): whether to trace peak memory with tracemalloc, which slows
+                down allocation heavy code. Defaults to True.
+        """
+        self.traceMemory = traceMemory
+        self.records = dict() # mapping: name -> record dictionary
+        self._stack = [] # [start time, traced memory at start, peak of finished children] of running calls
+        self._startedTracing = False
+
+    def __enter__(self):
+        global _activeProfiler
+        assert _activeProfiler is None, "Another profiler is already active"
+        if self.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+        _activeProfiler = self
+        return self
+
+    def __exit__(self, *excInfo):
+        global _activeProfiler
+        _activeProfiler = None
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+        self._stack = []
+        return False
+
+    def call(self, name, func, args, kwargs):
+        """
+        Calls func(*args, **kwargs) and records it under name
+        """
+        self._enter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._exit(name, _numOfRows(args))
+
+    def _enter(self):
+        current = 0
+        if self.traceMemory:
+            current, peak = tracemalloc.get_traced_memory()
+            # keep the peak of the enclosing call before the peak is reset
+            if len(self._stack) > 0: self._stack[-1][2] = max(self._stack[-1][2], peak)
+            tracemalloc.reset_peak()
+        self._stack.append([time.perf_counter(), current, 0])
+
+    def _exit(self, name, rows):
+        start, startMemory, childPeak = self._stack.pop()
+        seconds = time.perf_counter() - start
+
+        peakMemory = None
+        if self.traceMemory:
+            peak = max(tracemalloc.get_traced_memory()[1], childPeak)
+            peakMemory = peak - startMemory
+            if len(self._stack) > 0: self._stack[-1][2] = max(self._stack[-1][2], peak)
+
+        record = self.records.setdefault(name, {"calls": 0, "rows": None, "totalSeconds": 0.0, "maxSeconds": 0.0, "peakMemoryBytes": None})
+        record["calls"] += 1
+        record["totalSeconds"] += seconds
+        record["maxSeconds"] = max(record["maxSeconds"], seconds)
+        if rows != None: record["rows"] = (record["rows"] or 0) + rows
+        if peakMemory != None: record["peakMemoryBytes"] = max(record["peakMemoryBytes"] or 0, peakMemory)
+
+    def toDF(self):
+        """
+        Returns the records as a dataframe, one row per function or section,
+        sorted by total time
+        """
+        DF = pd.DataFrame([ dict(name=name, **record) for name, record in self.records.items() ],
+                          columns=["name", "calls", "rows", "totalSeconds", "maxSeconds", "peakMemoryBytes"])
+        DF["rows"] = DF["rows"].astype("Int64") # None for calls without a dataframe argument
+        DF["meanSeconds"] = DF["totalSeconds"] / DF["calls"]
+        return DF.sort_values("totalSeconds", ascending=False, ignore_index=True)
+
+    def report(self):
+        """
+        Returns the records as a text table, with times in seconds and peak
+        memory in MB
+        """
+        DF = self.toDF()
+        DF["peakMemoryMB"] = DF["peakMemoryBytes"] / 2**20
+        return DF[["name", "calls", "rows", "totalSeconds", "meanSeconds", "maxSeconds", "peakMemoryMB"]].to_string(index=False, float_format="%.4f")
+
+    def toJSON(self, path=None):
+        """
+        Returns the records as a json string, also written to path if given
+        """
+        text = json.dumps({"traceMemory": self.traceMemory,
+                           "records": [ dict(name=name, **record) for name, record in self.records.items() ]}, indent=2)
+        if path != None:
+            with open(path, "w") as jsonFile: jsonFile.write(text)
+        return text
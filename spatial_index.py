@@ -0,0 +1,427 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Spatial index over the classroom seating chart. Objects (seats) are bucketed
+# into a uniform grid, so that "objects within range r of point p" and
+# k-nearest queries only look at the grid cells around each point. Queries
+# take whole arrays of points, e.g. every stop centroid of a position trace,
+# and are answered in one call. ClassroomObjectIndex keeps one grid per
+# (dayID, periodID) when the seating chart changes between class sessions
+################################################################################
+
+import numpy as np
+import pandas as pd
+from stop_detection import getDists
+
+class UniformGridIndex:
+
+    """
+    Uniform grid over a set of 2D points. Points are sorted by grid cell and
+    each cell keeps the offset of its first point, so the points of any cell
+    are a contiguous slice
+    """
+
+    def __init__(self, X, Y, cellSize=None):
+
+        self.X = np.asarray(X, dtype=np.float64)
+        self.Y = np.asarray(Y, dtype=np.float64)
+        assert len(self.X) == len(self.Y), "Lengths of X, Y coordinate arrays should be identical"
+        assert np.all(np.isfinite(self.X)) and np.all(np.isfinite(self.Y)), "Object coordinates should be finite"
+
+        numOfPoints = len(self.X)
+        self.minX = self.X.min() if numOfPoints > 0 else 0.0
+        self.minY = self.Y.min() if numOfPoints > 0 else 0.0
+        width = self.X.max() - self.minX if numOfPoints > 0 else 0.0
+        height = self.Y.max() - self.minY if numOfPoints > 0 else 0.0
+
+        # by default, about one point per cell
+        if cellSize == None:
+            cellSize = np.sqrt(max(width * height, 1.0) / max(numOfPoints, 1))
+            cellSize = max(cellSize, width / 1024, height / 1024, 1.0)
+        assert cellSize > 0, "Cell size should be positive"
+        self.cellSize = float(cellSize)
+
+        self.numOfCols = int(width // self.cellSize) + 1
+        self.numOfRows = int(height // self.cellSize) + 1
+
+        # sort points by cell, cellStarts[c]:cellStarts[c+1] are the points of cell c
+        cellIDs = self._cellRow(self.Y) * self.numOfCols + self._cellCol(self.X)
+        self.order = np.argsort(cellIDs, kind="stable")
+        self.cellStarts = np.searchsorted(cellIDs[self.order], np.arange(self.numOfCols * self.numOfRows + 1))
+
+    def __len__(self):
+        return len(self.X)
+
+    def _cellCol(self, X):
+        return np.floor((X - self.minX) / self.cellSize).astype(np.int64)
+
+    def _cellRow(self, Y):
+        return np.floor((Y - self.minY) / self.cellSize).astype(np.int64)
+
+    def _queryCells(self, X, Y):
+        """
+        Cell column and row of each query point. Points outside the grid are
+        clipped to the ring of cells around it, which keeps far away points
+        from overflowing and still has every grid cell within reach of the
+        true cell within reach of the clipped one
+        """
+        with np.errstate(invalid="ignore"):
+            cols = np.clip(np.floor((X - self.minX) / self.cellSize), -1, self.numOfCols).astype(np.int64)
+            rows = np.clip(np.floor((Y - self.minY) / self.cellSize), -1, self.numOfRows).astype(np.int64)
+        return cols, rows
+
+    def _candidates(self, X, Y, reach):
+        """
+        Returns (queryIdx, pointIdx) pairs for every point in the cells within
+        `reach` cells of each query point's cell
+        """
+
+        cols, rows = self._queryCells(X, Y)
+        offsets = np.arange(-reach, reach + 1)
+        cellCols = (cols[:, None, None] + offsets[None, None, :]).repeat(len(offsets), axis=1)
+        cellRows = (rows[:, None, None] + offsets[None, :, None]).repeat(len(offsets), axis=2)
+        cellCols, cellRows = cellCols.reshape(len(X), -1), cellRows.reshape(len(X), -1)
+
+        inGrid = (cellCols >= 0) & (cellCols < self.numOfCols) & (cellRows >= 0) & (cellRows < self.numOfRows)
+        cellIDs = np.where(inGrid, cellRows * self.numOfCols + cellCols, 0)
+        starts = self.cellStarts[cellIDs]
+        counts = np.where(inGrid, self.cellStarts[cellIDs + 1] - starts, 0)
+
+        # expand every (query, cell) pair into the points of the cell
+        counts, starts = counts.ravel(), starts.ravel()
+        queryIdx = np.repeat(np.repeat(np.arange(len(X)), cellIDs.shape[1]), counts)
+        firstPos = np.cumsum(counts) - counts
+        positions = np.arange(counts.sum()) - np.repeat(firstPos - starts, counts)
+
+        return queryIdx, self.order[positions]
+
+    def _distOutsideSquare(self, X, Y, reach):
+        """
+        Lower bound of the distance from each query point to the grid cells
+        not within `reach` cells of its own cell; inf if there is none
+        """
+
+        cols, rows = self._queryCells(X, Y)
+        gridLeft, gridRight = self.minX, self.minX + self.numOfCols * self.cellSize
+        gridBottom, gridTop = self.minY, self.minY + self.numOfRows * self.cellSize
+        left = np.maximum(self.minX + (cols - reach) * self.cellSize, gridLeft)
+        right = np.minimum(self.minX + (cols + reach + 1) * self.cellSize, gridRight)
+        bottom = np.maximum(self.minY + (rows - reach) * self.cellSize, gridBottom)
+        top = np.minimum(self.minY + (rows + reach + 1) * self.cellSize, gridTop)
+
+        def distToRect(x0, x1, y0, y1, isEmpty):
+            dx = np.maximum(np.maximum(x0 - X, X - x1), 0)
+            dy = np.maximum(np.maximum(y0 - Y, Y - y1), 0)
+            return np.where(isEmpty, np.inf, np.sqrt(dx * dx + dy * dy))
+
+        # the rest of the grid is covered by the strips left, right, below and above the square
+        return np.minimum.reduce([ distToRect(gridLeft, left, gridBottom, gridTop, left <= gridLeft),
+                                   distToRect(right, gridRight, gridBottom, gridTop, right >= gridRight),
+                                   distToRect(gridLeft, gridRight, gridBottom, bottom, bottom <= gridBottom),
+                                   distToRect(gridLeft, gridRight, top, gridTop, top >= gridTop) ])
+
+    def queryRange(self, X, Y, rng, strict=False, chunkSize=100000):
+        """
+        Finds all points within range of each query point
+
+        Args:
+            X (Iterable[float]): x-coordinates of query points, NaN queries have no results
+            Y (Iterable[float]): y-coordinates of query points
+            rng (float): range, in the same unit as the coordinates
+            strict (bool, optional): whether the distance must be strictly smaller than rng. Defaults to False.
+            chunkSize (int, optional): number of query points handled at once, bounds memory use. Defaults to 100000.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray): query index, point index and distance of every match,
+            ordered by query index and then point index
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        # beyond max(numOfCols, numOfRows) cells every grid cell is in reach already
+        reach = min(rng / self.cellSize, max(self.numOfCols, self.numOfRows))
+        reach = int(np.ceil(reach))
+
+        queryIdxs, pointIdxs, dists = [], [], []
+        for chunkStart in range(0, len(X), chunkSize):
+            chunkX, chunkY = X[chunkStart: chunkStart + chunkSize], Y[chunkStart: chunkStart + chunkSize]
+            valid = np.flatnonzero(np.isfinite(chunkX) & np.isfinite(chunkY))
+            queryIdx, pointIdx = self._candidates(chunkX[valid], chunkY[valid], reach)
+            queryIdx = valid[queryIdx]
+
+            dist = getDists(chunkX[queryIdx], chunkY[queryIdx], self.X[pointIdx], self.Y[pointIdx])
+            inRange = dist < rng if strict else dist <= rng
+
+            queryIdxs.append(queryIdx[inRange] + chunkStart)
+            pointIdxs.append(pointIdx[inRange])
+            dists.append(dist[inRange])
+
+        queryIdx = np.concatenate(queryIdxs) if len(queryIdxs) > 0 else np.zeros(0, dtype=np.int64)
+        pointIdx = np.concatenate(pointIdxs) if len(pointIdxs) > 0 else np.zeros(0, dtype=np.int64)
+        dist = np.concatenate(dists) if len(dists) > 0 else np.zeros(0)
+        order = np.lexsort((pointIdx, queryIdx))
+
+        return queryIdx[order], pointIdx[order], dist[order]
+
+    def queryKNearest(self, X, Y, k=1):
+        """
+        Finds the k nearest points of each query point. The search square
+        around each query is doubled until the k-th nearest candidate is
+        closer than any point outside the square
+
+        Args:
+            X (Iterable[float]): x-coordinates of query points
+            Y (Iterable[float]): y-coordinates of query points
+            k (int, optional): number of neighbors. Defaults to 1.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): (len(X), k) arrays of point indices and distances, nearest first and ties
+            broken by point index; -1 and inf where there is no neighbor (NaN query or fewer than k points)
+        """
+
+        assert k > 0, "k should be positive"
+
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        resIdx = np.full((len(X), k), -1)
+        resDist = np.full((len(X), k), np.inf)
+        neededK = min(k, len(self))
+        if neededK == 0: return resIdx, resDist
+
+        active = np.flatnonzero(np.isfinite(X) & np.isfinite(Y))
+        reach = 1
+        while len(active) > 0:
+            activeX, activeY = X[active], Y[active]
+            queryIdx, pointIdx = self._candidates(activeX, activeY, reach)
+            dist = getDists(activeX[queryIdx], activeY[queryIdx], self.X[pointIdx], self.Y[pointIdx])
+
+            # rank candidates of each query by distance, then by point index
+            order = np.lexsort((pointIdx, dist, queryIdx))
+            queryIdx, pointIdx, dist = queryIdx[order], pointIdx[order], dist[order]
+            counts = np.bincount(queryIdx, minlength=len(active))
+            rank = np.arange(len(queryIdx)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+            # points outside the search square are at least this far from the query
+            guaranteed = self._distOutsideSquare(activeX, activeY, reach)
+
+            kthDist = np.full(len(active), np.inf)
+            isKth = rank == neededK - 1
+            kthDist[queryIdx[isKth]] = dist[isKth]
+            resolved = (counts >= neededK) & (kthDist < guaranteed)
+
+            keep = (rank < k) & resolved[queryIdx]
+            resIdx[active[queryIdx[keep]], rank[keep]] = pointIdx[keep]
+            resDist[active[queryIdx[keep]], rank[keep]] = dist[keep]
+
+            active = active[~resolved]
+            reach *= 2
+
+        return resIdx, resDist
+
+
+class ClassroomObjectIndex:
+
+    """
+    Spatial index over a seating chart, with one UniformGridIndex per
+    (dayID, periodID) if the chart has these columns, and a single grid
+    otherwise. Results refer to rows of the seating chart by position
+    """
+
+    def __init__(self, objDF, keyCols=("dayID", "periodID"), nameCol="object", xCol="X", yCol="Y", cellSize=None):
+
+        assert nameCol in objDF.columns and xCol in objDF.columns and yCol in objDF.columns, \
+               "Seating chart does not have necessary column(s)"
+
+        self.names = objDF[nameCol].to_numpy()
+        self.keyCols = [ col for col in keyCols if col in objDF.columns ]
+        X = objDF[xCol].to_numpy(dtype=np.float64)
+        Y = objDF[yCol].to_numpy(dtype=np.float64)
+
+        # mapping: key -> (grid, positions of the grid's objects in objDF)
+        self.grids = dict()
+        if len(self.keyCols) == 0:
+            rows = np.arange(len(objDF))
+            self.grids[None] = (UniformGridIndex(X, Y, cellSize), rows)
+        else:
+            groups = pd.Series(np.arange(len(objDF))).groupby([ objDF[col].to_numpy() for col in self.keyCols ])
+            for key, rows in groups:
+                rows = rows.to_numpy()
+                self.grids[key] = (UniformGridIndex(X[rows], Y[rows], cellSize), rows)
+
+    def _keysOf(self, numOfQueries, keys):
+        """
+        Key of each query point; every query uses the single grid if the chart
+        is not keyed
+        """
+        if len(self.keyCols) == 0: return None
+        assert keys != None and len(keys) == len(self.keyCols), f"Keys for {self.keyCols} should be given"
+        keys = [ np.asarray(col) for col in keys ]
+        for col in keys: assert len(col) == numOfQueries, "Keys should be of the same length as query points"
+        return keys
+
+    def _groupQueries(self, numOfQueries, keys):
+        """
+        Yields (grid, grid object positions, query positions) for each key
+        that has both queries and objects
+        """
+        keys = self._keysOf(numOfQueries, keys)
+        if keys == None:
+            grid, rows = self.grids[None]
+            yield grid, rows, np.arange(numOfQueries)
+            return
+
+        groups = pd.Series(np.arange(numOfQueries)).groupby(keys)
+        for key, queries in groups:
+            if key not in self.grids: continue
+            grid, rows = self.grids[key]
+            yield grid, rows, queries.to_numpy()
+
+    def _uniqueQueries(self, X, Y, keys):
+        """
+        Rows of a position trace share the centroid of their stop, so queries
+        are answered once per distinct (X, Y, keys) point
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, List[numpy.ndarray], numpy.ndarray): distinct X, Y, keys, and the distinct
+            point of each query (-1 for NaN points)
+        """
+
+        keys = self._keysOf(len(X), keys)
+        cols = [X, Y] + (keys if keys != None else [])
+        pointIDs = pd.DataFrame(dict(enumerate(cols))).groupby(list(range(len(cols))), sort=False, dropna=True).ngroup()
+        pointIDs = pointIDs.fillna(-1).to_numpy(dtype=np.int64)
+
+        IDs, firstRows = np.unique(pointIDs, return_index=True)
+        firstRows = firstRows[IDs >= 0]
+        uniqueKeys = [ col[firstRows] for col in keys ] if keys != None else None
+
+        return X[firstRows], Y[firstRows], uniqueKeys, pointIDs
+
+    def queryRange(self, X, Y, rng, keys=None, strict=False):
+        """
+        Finds all objects within range of each query point
+
+        Args:
+            X (Iterable[float]): x-coordinates of query points
+            Y (Iterable[float]): y-coordinates of query points
+            rng (float): range, in milimeter
+            keys (List[Iterable], optional): one array per key column (e.g. [dayIDs, periodIDs]) if the chart is keyed. Defaults to None.
+            strict (bool, optional): whether the distance must be strictly smaller than rng. Defaults to False.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray): query index, object row position and distance of every match,
+            ordered by query index and then object row position
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        queryIdxs, objIdxs, dists = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for grid, rows, queries in self._groupQueries(len(X), keys):
+            queryIdx, pointIdx, dist = grid.queryRange(X[queries], Y[queries], rng, strict=strict)
+            queryIdxs.append(queries[queryIdx])
+            objIdxs.append(rows[pointIdx])
+            dists.append(dist)
+
+        queryIdx, objIdx, dist = np.concatenate(queryIdxs), np.concatenate(objIdxs), np.concatenate(dists)
+        order = np.lexsort((objIdx, queryIdx))
+        return queryIdx[order], objIdx[order], dist[order]
+
+    def queryKNearest(self, X, Y, k=1, keys=None):
+        """
+        Finds the k nearest objects of each query point
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): (len(X), k) arrays of object row positions and distances, nearest first;
+            -1 and inf where there is no neighbor
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        resIdx = np.full((len(X), k), -1)
+        resDist = np.full((len(X), k), np.inf)
+        for grid, rows, queries in self._groupQueries(len(X), keys):
+            pointIdx, dist = grid.queryKNearest(X[queries], Y[queries], k)
+            resIdx[queries] = np.where(pointIdx >= 0, rows[pointIdx], -1)
+            resDist[queries] = dist
+
+        return resIdx, resDist
+
+    def getObjDistDicts(self, centroids, rng, keys=None):
+        """
+        Same output as getClosestObjs() in triangulation.ipynb: for each
+        centroid, a dictionary of {<object name>: <distance>} for objects
+        strictly within range, or NaN if the centroid is not a point
+
+        Args:
+            centroids (Iterable[(float, float)]): centroid points; NaN for rows not in a stop
+            rng (float): range, in milimeter
+
+        Returns:
+            List[dict]: one dictionary per centroid, objects in seating chart order
+        """
+
+        centroidX, centroidY, uniqueKeys, pointIDs = self._uniqueQueries(*centroids2cols(centroids), keys)
+        queryIdx, objIdx, dist = self.queryRange(centroidX, centroidY, rng, keys=uniqueKeys, strict=True)
+
+        objDistDicts = [ dict() for i in range(len(centroidX)) ]
+        for i, j, d in zip(queryIdx.tolist(), objIdx.tolist(), dist.tolist()):
+            objDistDicts[i][self.names[j]] = d
+
+        # every row gets its own copy, same as the notebook
+        return [ dict(objDistDicts[i]) if i >= 0 else np.nan for i in pointIDs.tolist() ]
+
+    def getObjsInRange(self, centroids, rng=float("inf"), keys=None, prefix="seat", sep=";"):
+        """
+        Same output as getObjsInRange() in merge_modalities.ipynb: for each
+        centroid, the numbers of objects within range joined by `sep`, or NaN
+        if there is none or the centroid is not a point
+
+        Args:
+            centroids (Iterable[(float, float)]): centroid points
+            rng (float, optional): range, in milimeter. Defaults to float("inf").
+            prefix (str, optional): leading letters of object names dropped in the output, e.g. seat12 -> 12. Defaults to "seat".
+            sep (str, optional): separator of object numbers. Defaults to ";".
+
+        Returns:
+            List[str]: object numbers within range of each centroid
+        """
+
+        centroidX, centroidY, uniqueKeys, pointIDs = self._uniqueQueries(*centroids2cols(centroids), keys)
+        queryIdx, objIdx, dist = self.queryRange(centroidX, centroidY, rng, keys=uniqueKeys)
+
+        objNums = pd.Series(self.names[objIdx], dtype=object).str[len(prefix):]
+        joined = objNums.groupby(queryIdx).agg(sep.join)
+        objsInRange = np.full(len(centroidX) + 1, np.nan, dtype=object) # last entry for rows without a point
+        objsInRange[joined.index.to_numpy()] = joined.to_numpy()
+
+        return objsInRange[pointIDs].tolist()
+
+    def getClosestObj(self, centroids, rng=float("inf"), keys=None, prefix="seat"):
+        """
+        Same output as getClosestObj() in merge_modalities.ipynb: for each
+        centroid, the number of the closest object if it is within range,
+        NaN otherwise
+
+        Returns:
+            List[int]: closest object number of each centroid
+        """
+
+        centroidX, centroidY, uniqueKeys, pointIDs = self._uniqueQueries(*centroids2cols(centroids), keys)
+        objIdx, dist = self.queryKNearest(centroidX, centroidY, k=1, keys=uniqueKeys)
+
+        closestObjs = [ int(self.names[j][len(prefix):]) if j >= 0 and d <= rng else np.nan
+                        for j, d in zip(objIdx[:, 0].tolist(), dist[:, 0].tolist()) ]
+        closestObjs.append(np.nan) # for rows without a point
+
+        return [ closestObjs[i] for i in pointIDs.tolist() ]
+
+
+def centroids2cols(centroids):
+    """
+    Converts an iterable of centroid tuples, with NaN for rows not in a stop,
+    to X and Y arrays with NaN for rows not in a stop
+    """
+
+    X = np.array([ centroid[0] if isinstance(centroid, tuple) else np.nan for centroid in centroids ], dtype=np.float64)
+    Y = np.array([ centroid[1] if isinstance(centroid, tuple) else np.nan for centroid in centroids ], dtype=np.float64)
+    return X, Y
@@ -7,10 +7,16 @@
 ###########################################################
 
 
+import os
 import math
+import numpy as np
 import pandas as pd
 from os import times 
+from concurrent.futures import ProcessPoolExecutor
+from profiling import instrument
+from observationDataAPI import isValidStudIDs
 
+@instrument
 def getObsStopEvents(): 
 
     """
@@ -58,6 +64,18 @@ def getDist(point0, point1):
     return math.sqrt( (X0 - X1)**2 + (Y0 - Y1)**2 )
 
 
+def getDists(X0, Y0, X1, Y1): 
+
+    '''
+    Vectorized getDist() over arrays of points. np.float_power calls pow() 
+    like the ** operator on Python floats, whereas ** on arrays multiplies, 
+    which can be 1 ulp off and flip a distance sitting exactly on a range 
+    boundary 
+    '''
+
+    return np.sqrt( np.float_power(X0 - X1, 2) + np.float_power(Y0 - Y1, 2) ) 
+
+
 def getCentroid(points): 
     sumX, sumY = 0, 0
     for point in points: 
@@ -91,6 +109,7 @@ def withinRadius(points, radius):
     return True
 
 
+@instrument
 def validateStops(stops, duration, maxDuration, epsilon=0.4): 
 
     '''
@@ -129,6 +148,7 @@ def validateStops(stops, duration, maxDuration, epsilon=0.4):
 
     return True
 
+@instrument
 def getStops(X, Y, timestamp, periods, days, duration, radius): 
 
     '''
@@ -196,6 +216,7 @@ def getStops(X, Y, timestamp, periods, days, duration, radius):
     assert(validateStops(stops, duration, maxDuration))
     return stops
 
+@instrument
 def getStopsAndCentroids(X, Y, timestamp, periods, days, duration, radius): 
 
     '''
@@ -261,6 +282,458 @@ def getStopsAndCentroids(X, Y, timestamp, periods, days, duration, radius):
     
     return stops
 
+def _windowWithinRadius(Xwindow, Ywindow, centroidX, centroidY, extremes, radius): 
+
+    '''
+    Checks whether every point in the window is within radius of the window 
+    centroid, giving the same answer as withinRadius() without always going 
+    thru all the points 
+
+    @param Xwindow: numpy array of x-coordinates in the window 
+    @param Ywindow: numpy array of y-coordinates in the window 
+    @param extremes: a list of points (tuples) holding the smallest and largest 
+                X and Y coordinates of the window, newest point first 
+    @return: a boolean logical of whether all points are within radius
+    '''
+
+    # the corner of the bounding box farthest from the centroid is an upper 
+    # bound on every point's distance. Rounding is monotonic, so the bound 
+    # computed with floats also bounds getDist() of every point computed with floats
+    minX, maxX, minY, maxY = extremes[1][0], extremes[2][0], extremes[3][1], extremes[4][1]
+    farX = max(abs(minX - centroidX), abs(maxX - centroidX)) 
+    farY = max(abs(minY - centroidY), abs(maxY - centroidY)) 
+    if(math.sqrt(farX**2 + farY**2) <= radius): return True 
+
+    # the newest point and the points on the bounding box are the most likely 
+    # ones to be out of radius, so check them before going thru the window 
+    for point in extremes: 
+        if(getDist(point, (centroidX, centroidY)) > radius): return False 
+
+    # bounds are not conclusive, check every point in the window 
+    dist = np.sqrt( (Xwindow - centroidX)**2 + (Ywindow - centroidY)**2 ) 
+    return not np.any(dist > radius) 
+
+@instrument
+def scanStops(X, Y, timestamp, periods, days, duration, radius, startLimit=None): 
+
+    '''
+    Array-native version of the loop in getStops(). The centroid of the window 
+    is kept as running sums of the coordinates, which are added in the same 
+    order as in withinRadius(), and the radius check is done with a bounding 
+    box bound before falling back to checking every point. Results are the 
+    same as getStops() and getStopsAndCentroids() 
+
+    @param X: an array of x-coordinates 
+    @param Y: an array of y-coordinates, must be same length as X
+    @param timestamp: an array of timestamps, must be same length as X and Y
+    @param periods: an array of period IDs, must be same length as X and Y
+    @param days: an array of day IDs, must be same length as X and Y
+    @param duration: the minimum duration that the teacher stays in-place to 
+                    establish a stop. Unit is second
+    @param radius: teacher position must be with in the radius of coordinate 
+                centroid to establish a stop. Unit is milimeter
+    @param startLimit: stops are only searched for starting indices smaller 
+                than this number. Defaults to len(X) - duration as in getStops() 
+    @return: an array of tuple (<startIndex>, <endIndex>, <centroidX>, <centroidY>), 
+            where both indices are inclusive 
+    '''
+
+    assert len(X) == len(Y), "Lengths of X, Y coordinate arrays should be identical"
+    assert len(timestamp) == len(X), "Lengths timestamp array should be identical to coordinate arrays" 
+
+    # arrays for slicing windows, lists for fast access to single points 
+    Xarr = np.asarray(X, dtype=np.float64) 
+    Yarr = np.asarray(Y, dtype=np.float64) 
+    Xlist, Ylist = Xarr.tolist(), Yarr.tolist() 
+    timestamp = np.asarray(timestamp).tolist() 
+    periods = np.asarray(periods).tolist() 
+    days = np.asarray(days).tolist() 
+    numOfPoints = len(Xlist) 
+    if(startLimit == None): startLimit = numOfPoints - duration 
+
+    stops = [] # output array 
+
+    startIndex = 0
+    while(startIndex < startLimit): 
+
+        # window starts with a single point 
+        point = (Xlist[startIndex], Ylist[startIndex]) 
+        sumX, sumY = 0.0 + point[0], 0.0 + point[1] 
+        count = 1 
+        centroidX, centroidY = sumX / count, sumY / count 
+        # newest point, then points with min X, max X, min Y, max Y 
+        extremes = [point, point, point, point, point] 
+        isWithin = getDist(point, (centroidX, centroidY)) <= radius 
+        endIndex = startIndex + 1 
+
+        # same loop condition as getStops(), with the window being startIndex..endIndex-1 
+        while(isWithin and 
+              endIndex < numOfPoints and 
+              periods[startIndex] == periods[endIndex] and 
+              days[startIndex] == days[endIndex]): 
+
+            # add point endIndex to the window 
+            point = (Xlist[endIndex], Ylist[endIndex]) 
+            sumX += point[0] 
+            sumY += point[1] 
+            count += 1 
+            centroidX, centroidY = sumX / count, sumY / count 
+            extremes[0] = point 
+            if(point[0] < extremes[1][0]): extremes[1] = point 
+            if(point[0] > extremes[2][0]): extremes[2] = point 
+            if(point[1] < extremes[3][1]): extremes[3] = point 
+            if(point[1] > extremes[4][1]): extremes[4] = point 
+            endIndex += 1 
+
+            isWithin = _windowWithinRadius(Xarr[startIndex: endIndex], Yarr[startIndex: endIndex], 
+                                           centroidX, centroidY, extremes, radius) 
+
+        endIndex -= 1 # end and start are both inclusive 
+
+        # this means that no stop is detected 
+        if(timestamp[endIndex] < timestamp[startIndex] + duration): 
+            startIndex += 1 
+        # a stop is detected, the window is exactly the points of the stop 
+        else: 
+            stops.append( (startIndex, endIndex, centroidX, centroidY) ) 
+            # start of next timeframe should be the end of this stop 
+            startIndex = endIndex 
+
+    return stops 
+
+@instrument
+def getStopsFast(X, Y, timestamp, periods, days, duration, radius): 
+
+    '''
+    Same as getStops(), but runs on scanStops() 
+
+    @return: an array of tuple (<stopStartTime>, <stopEndTime>) 
+    '''
+
+    maxDuration = 600 # a stop should not exceed 10 minutes 
+
+    timestamp = np.asarray(timestamp) 
+    stops = [ (timestamp[start], timestamp[end]) 
+              for start, end, centroidX, centroidY in scanStops(X, Y, timestamp, periods, days, duration, radius) ] 
+
+    assert(validateStops(stops, duration, maxDuration))
+    return stops
+
+@instrument
+def getStopsAndCentroidsFast(X, Y, timestamp, periods, days, duration, radius): 
+
+    '''
+    Same as getStopsAndCentroids(), but runs on scanStops() 
+
+    @return: an array of tuple (<stopStartTime>, <stopEndTime>, <centroidX>, <centroidY>) 
+    '''
+
+    timestamp = np.asarray(timestamp) 
+    stops = [ (timestamp[start], timestamp[end], np.float64(centroidX), np.float64(centroidY)) 
+              for start, end, centroidX, centroidY in scanStops(X, Y, timestamp, periods, days, duration, radius) ] 
+
+    return stops
+
+@instrument
+def getSessionRuns(periods, days): 
+
+    '''
+    Splits a position trace into runs of consecutive samples with the same 
+    (dayID, periodID). getStops() never lets a stop cross a run boundary, 
+    and every sample with a NaN ID is a run of its own 
+
+    @param periods: an array of period IDs 
+    @param days: an array of day IDs, must be same length as periods 
+    @return: an array of run start indices, followed by len(periods) 
+    '''
+
+    periods = np.asarray(periods) 
+    days = np.asarray(days) 
+    assert len(periods) == len(days), "Lengths of period and day arrays should be identical" 
+
+    isBoundary = (periods[1:] != periods[:-1]) | (days[1:] != days[:-1]) 
+    return np.concatenate([ [0], np.flatnonzero(isBoundary) + 1, [len(periods)] ]) if len(periods) > 0 else np.zeros(1, dtype=np.int64) 
+
+def _scanPartition(X, Y, timestamp, periods, days, duration, radius, startLimit, offset): 
+
+    # process pool task of _scanStopsParallel(), indices are shifted back to the whole trace 
+    return [ (start + offset, end + offset, centroidX, centroidY) 
+             for start, end, centroidX, centroidY in scanStops(X, Y, timestamp, periods, days, duration, radius, startLimit) ] 
+
+def _scanStopsParallel(X, Y, timestamp, periods, days, duration, radius, processes=None, partitionsPerProcess=4): 
+
+    '''
+    Runs scanStops() on partitions of the trace in a process pool. Partitions 
+    are made of whole (dayID, periodID) runs, and the scan always enters a 
+    run at its first sample, so scanning each partition on its own gives the 
+    same stops as scanning the whole trace 
+    '''
+
+    assert len(X) == len(Y), "Lengths of X, Y coordinate arrays should be identical"
+    assert len(timestamp) == len(X), "Lengths timestamp array should be identical to coordinate arrays" 
+
+    X = np.asarray(X, dtype=np.float64) 
+    Y = np.asarray(Y, dtype=np.float64) 
+    timestamp = np.asarray(timestamp) 
+    periods = np.asarray(periods) 
+    days = np.asarray(days) 
+    numOfPoints = len(X) 
+    if(processes == None): processes = os.cpu_count() or 1 
+
+    # cut the trace at run boundaries into partitions of about the same size 
+    runStarts = getSessionRuns(periods, days) 
+    numOfPartitions = max(1, processes * partitionsPerProcess) 
+    targets = np.linspace(0, numOfPoints, numOfPartitions + 1)[1:-1] 
+    cuts = np.unique(runStarts[np.searchsorted(runStarts, targets)]) 
+    bounds = np.unique(np.concatenate([ [0], cuts, [numOfPoints] ])).tolist() 
+
+    tasks = [] 
+    for start, end in zip(bounds[:-1], bounds[1:]): 
+        # getStops() only looks for stops starting before len(X) - duration 
+        startLimit = min(end - start, numOfPoints - duration - start) 
+        if(startLimit <= 0): break 
+        tasks.append( (X[start: end], Y[start: end], timestamp[start: end], periods[start: end], days[start: end], 
+                       duration, radius, startLimit, start) ) 
+
+    if(processes == 1 or len(tasks) <= 1): 
+        results = [ _scanPartition(*task) for task in tasks ] 
+    else: 
+        with ProcessPoolExecutor(max_workers=processes) as executor: 
+            results = list(executor.map(_scanPartition, *zip(*tasks))) 
+
+    # partitions are in time order, so are the stops within each partition 
+    return [ stop for partitionStops in results for stop in partitionStops ] 
+
+@instrument
+def getStopsParallel(X, Y, timestamp, periods, days, duration, radius, processes=None): 
+
+    '''
+    Same as getStops(), with the trace split on (dayID, periodID) boundaries 
+    and the partitions scanned in a process pool 
+
+    @param processes: number of worker processes. Defaults to the number of CPUs 
+    @return: an array of tuple (<stopStartTime>, <stopEndTime>) 
+    '''
+
+    maxDuration = 600 # a stop should not exceed 10 minutes 
+
+    timestamp = np.asarray(timestamp) 
+    stops = [ (timestamp[start], timestamp[end]) 
+              for start, end, centroidX, centroidY in _scanStopsParallel(X, Y, timestamp, periods, days, duration, radius, processes) ] 
+
+    assert(validateStops(stops, duration, maxDuration))
+    return stops
+
+@instrument
+def getStopsAndCentroidsParallel(X, Y, timestamp, periods, days, duration, radius, processes=None): 
+
+    '''
+    Same as getStopsAndCentroids(), with the trace split on (dayID, periodID) 
+    boundaries and the partitions scanned in a process pool 
+
+    @param processes: number of worker processes. Defaults to the number of CPUs 
+    @return: an array of tuple (<stopStartTime>, <stopEndTime>, <centroidX>, <centroidY>) 
+    '''
+
+    timestamp = np.asarray(timestamp) 
+    stops = [ (timestamp[start], timestamp[end], np.float64(centroidX), np.float64(centroidY)) 
+              for start, end, centroidX, centroidY in _scanStopsParallel(X, Y, timestamp, periods, days, duration, radius, processes) ] 
+
+    return stops
+
+class OnlineStopDetector: 
+
+    '''
+    Stop detection for a live stream of position samples. Runs the same scan 
+    as scanStops(), but keeps it paused whenever the current window reaches 
+    the newest sample, so only the samples from the current window start 
+    onwards are buffered. A stop is emitted once its window breaks and enough 
+    samples have arrived after its start that getStops() would also report 
+    it; on replay, the stops emitted by update() and flush() are the same as 
+    getStopsAndCentroidsFast() on the whole stream 
+
+    Example: 
+        detector = OnlineStopDetector(duration=10, radius=600) 
+        for sample in stream: 
+            for stop in detector.update(*sample): print(stop) 
+        for stop in detector.flush(): print(stop) 
+    '''
+
+    def __init__(self, duration, radius, capacity=1024): 
+
+        '''
+        @param duration: the minimum duration that the teacher stays in-place to 
+                        establish a stop. Unit is second
+        @param radius: teacher position must be with in the radius of coordinate 
+                    centroid to establish a stop. Unit is milimeter
+        @param capacity: initial number of buffered samples, grows as needed 
+        '''
+
+        self.duration = duration 
+        self.radius = radius 
+        self.numOfSamples = 0 # samples seen so far 
+        self.isFlushed = False 
+
+        # buffer holds samples offset, offset+1, ..., numOfSamples-1 
+        self.offset = 0 
+        self.bufX = np.empty(capacity) 
+        self.bufY = np.empty(capacity) 
+        self.bufTimestamp = np.empty(capacity) 
+        self.bufPeriod = np.empty(capacity) 
+        self.bufDay = np.empty(capacity) 
+
+        self.pendingStops = [] # detected stops waiting to be emitted 
+        self._resetWindow(0) 
+
+    def _resetWindow(self, startIndex): 
+
+        # the window is startIndex..endIndex-1, same as in scanStops() 
+        self.startIndex = startIndex 
+        self.endIndex = startIndex 
+        self.sumX, self.sumY, self.count = 0.0, 0.0, 0 
+        self.centroid = None 
+        self.extremes = None 
+        self.isWithin = True 
+
+    def _append(self, x, y, timestamp, period, day): 
+
+        size = self.numOfSamples - self.offset 
+        if(size == len(self.bufX)): 
+            # drop samples before the window start, grow the buffer if still full 
+            keep = self.numOfSamples - self.startIndex 
+            capacity = len(self.bufX) * 2 if keep * 2 > len(self.bufX) else len(self.bufX) 
+            for name in ["bufX", "bufY", "bufTimestamp", "bufPeriod", "bufDay"]: 
+                buf = np.empty(capacity) 
+                buf[:keep] = getattr(self, name)[size - keep: size] 
+                setattr(self, name, buf) 
+            self.offset = self.startIndex 
+            size = keep 
+
+        self.bufX[size] = x 
+        self.bufY[size] = y 
+        self.bufTimestamp[size] = timestamp 
+        self.bufPeriod[size] = period 
+        self.bufDay[size] = day 
+        self.numOfSamples += 1 
+
+    def _addToWindow(self, index): 
+
+        i = index - self.offset 
+        point = (float(self.bufX[i]), float(self.bufY[i])) 
+        self.sumX += point[0] 
+        self.sumY += point[1] 
+        self.count += 1 
+        self.centroid = (self.sumX / self.count, self.sumY / self.count) 
+        if(self.count == 1): 
+            # newest point, then points with min X, max X, min Y, max Y 
+            self.extremes = [point, point, point, point, point] 
+            self.isWithin = getDist(point, self.centroid) <= self.radius 
+        else: 
+            extremes = self.extremes 
+            extremes[0] = point 
+            if(point[0] < extremes[1][0]): extremes[1] = point 
+            if(point[0] > extremes[2][0]): extremes[2] = point 
+            if(point[1] < extremes[3][1]): extremes[3] = point 
+            if(point[1] > extremes[4][1]): extremes[4] = point 
+            start = self.startIndex - self.offset 
+            self.isWithin = _windowWithinRadius(self.bufX[start: i+1], self.bufY[start: i+1], 
+                                                self.centroid[0], self.centroid[1], extremes, self.radius) 
+        self.endIndex = index + 1 
+
+    def _scan(self, isFinal): 
+
+        '''
+        Advances the scan as far as the samples seen so far allow 
+        @param isFinal: whether the stream has ended 
+        '''
+
+        while(self.startIndex < self.numOfSamples): 
+            # getStops() only looks for stops starting before len(X) - duration 
+            if(isFinal and self.startIndex >= self.numOfSamples - self.duration): break 
+
+            if(self.count == 0): self._addToWindow(self.startIndex) 
+
+            start = self.startIndex - self.offset 
+            while(self.isWithin and 
+                  self.endIndex < self.numOfSamples and 
+                  self.bufPeriod[start] == self.bufPeriod[self.endIndex - self.offset] and 
+                  self.bufDay[start] == self.bufDay[self.endIndex - self.offset]): 
+                self._addToWindow(self.endIndex) 
+
+            # the window may still grow with the next sample 
+            if(self.isWithin and self.endIndex == self.numOfSamples and not isFinal): break 
+
+            endIndex = self.endIndex - 1 # end and start are both inclusive 
+            end = endIndex - self.offset 
+            # this means that no stop is detected 
+            if(self.bufTimestamp[end] < self.bufTimestamp[start] + self.duration): 
+                self._resetWindow(self.startIndex + 1) 
+            # a stop is detected 
+            else: 
+                self.pendingStops.append( (self.startIndex, self.bufTimestamp[start], self.bufTimestamp[end], 
+                                           np.float64(self.centroid[0]), np.float64(self.centroid[1])) ) 
+                # start of next timeframe should be the end of this stop 
+                self._resetWindow(endIndex) 
+
+    def _emit(self, isFinal): 
+
+        # a stop starting at index s is only reported by getStops() if 
+        # s < len(X) - duration, which is known to hold once more than 
+        # s + duration samples have been seen 
+        emitted = [] 
+        while(len(self.pendingStops) > 0 and 
+              self.pendingStops[0][0] < self.numOfSamples - self.duration): 
+            emitted.append(self.pendingStops.pop(0)[1:]) 
+        if(isFinal): self.pendingStops = [] 
+
+        return emitted 
+
+    def update(self, x, y, timestamp, period, day): 
+
+        '''
+        Adds one position sample 
+
+        @param x: x-coordinate 
+        @param y: y-coordinate 
+        @param timestamp: epoch time stamp, samples must come in time order 
+        @param period: period ID of the sample 
+        @param day: day ID of the sample 
+        @return: newly confirmed stops, as a list of tuple 
+                (<stopStartTime>, <stopEndTime>, <centroidX>, <centroidY>) 
+        '''
+
+        assert not self.isFlushed, "Stream has already been flushed" 
+        self._append(x, y, timestamp, period, day) 
+        self._scan(isFinal=False) 
+        return self._emit(isFinal=False) 
+
+    def updateBatch(self, X, Y, timestamp, periods, days): 
+
+        '''
+        Adds a batch of position samples, same parameters as getStops() 
+        @return: newly confirmed stops, same format as update() 
+        '''
+
+        assert len(X) == len(Y) == len(timestamp) == len(periods) == len(days), \
+               "Lengths of position sample arrays should be identical" 
+
+        assert not self.isFlushed, "Stream has already been flushed" 
+        for sample in zip(X, Y, timestamp, periods, days): self._append(*sample) 
+        self._scan(isFinal=False) 
+        return self._emit(isFinal=False) 
+
+    def flush(self): 
+
+        '''
+        Ends the stream, closing the current window at the last sample 
+        @return: remaining stops, same format as update() 
+        '''
+
+        self.isFlushed = True 
+        self._scan(isFinal=True) 
+        return self._emit(isFinal=True) 
+
+@instrument
 def getStopsFromObs(obsLog): 
 
     """
@@ -268,14 +741,73 @@ def getStopsFromObs(obsLog):
     :return: returns a list of timestamps signaling the start of each stopping events in observation log. Ending timestamp is not included here since it is difficult to datamine the end of an observation event 
     """ 
 
-    stops = [] # to be returned 
-    # go through observation log to find the stopping events 
-    for i in range(len(obsLog)): 
-        if( obsLog.iloc[i]["event"] in getObsStopEvents() ): 
-            stops.append(obsLog.iloc[i]["timestamp"]) # attach the stopping event's timestamp to the list if found 
+    # timestamps of the stopping events, in the order of the observation log 
+    isStop = obsLog["event"].isin(getObsStopEvents()) 
+    stops = obsLog.loc[isStop, "timestamp"].tolist() 
 
     return stops
 
+@instrument
+def getStopAgreement(posStops, obsStops, timeframes): 
+
+    """
+    Array-native version of getPercentages() in triangulation.ipynb, for one 
+    or many timeframes at once. A position stop is extended by half a 
+    timeframe on both sides; it is position-only if the first observation 
+    stop at or after the extended start is after the extended end, and an 
+    observation stop is observation-only if the first position stop whose 
+    extended end is at or after it starts later. Both "first" searches are 
+    binary searches on running maxima, which gives the same answer as the 
+    notebook's scans even if a list is not sorted 
+
+    :param posStops: stops datamined from position data, formatted as [(start_stop_1, end_stop_1), (start_stop_2, end_stop_2), ... ]
+    :param obsStops: stops datamined from observation data, formatted as [start_stop_1, start_stop_2, ... ]
+    :param timeframes: a timeframe parameter or a list of them 
+    :return: a dataframe with one row per timeframe, holding the counts of stops in both (matches), only in position 
+            data (false positives), and only in observation data (misses), and the percentages returned by getPercentages(); 
+            percentages are NaN if there is no stop 
+    """
+
+    timeframes = np.atleast_1d(np.asarray(timeframes, dtype=np.float64)) 
+    obsStops = np.asarray(obsStops, dtype=np.float64) 
+    starts = np.array([ stop[0] for stop in posStops ], dtype=np.float64) 
+    ends = np.array([ stop[1] for stop in posStops ], dtype=np.float64) 
+    posStopsCount, obsStopsCount = len(starts), len(obsStops) 
+
+    # running maxima, the first element reaching a value is found by binary search 
+    obsMax = np.maximum.accumulate(obsStops) if obsStopsCount > 0 else obsStops 
+
+    rows = [] 
+    for timeframe in timeframes.tolist(): 
+        back = timeframe / 2 
+        forward = timeframe - back 
+        TFstarts = starts - back # timeframe starts 
+        TFends = ends + forward  # timeframe ends 
+
+        # first observation stop at or after each timeframe start 
+        ind = np.searchsorted(obsMax, TFstarts, side="left") 
+        clipped = np.minimum(ind, obsStopsCount - 1) 
+        inPosCount = int(np.sum((ind < obsStopsCount) & (obsStops[clipped] > TFends))) if obsStopsCount > 0 else 0 
+
+        # first position stop whose timeframe ends at or after each observation stop 
+        TFendMax = np.maximum.accumulate(TFends) if posStopsCount > 0 else TFends 
+        ind = np.searchsorted(TFendMax, obsStops, side="left") 
+        clipped = np.minimum(ind, posStopsCount - 1) 
+        inObsCount = int(np.sum((ind < posStopsCount) & (TFstarts[clipped] > obsStops))) if posStopsCount > 0 else 0 
+
+        inBothCount = int((obsStopsCount + posStopsCount - inObsCount - inPosCount) / 2) 
+        totalCount = inBothCount + inPosCount + inObsCount 
+        rows.append({"timeframe": timeframe, 
+                     "in_both": inBothCount, 
+                     "in_pos": inPosCount, 
+                     "in_obs": inObsCount, 
+                     "perc_of_stops_in_both": inBothCount / totalCount if totalCount > 0 else np.nan, 
+                     "perc_of_stops_in_pos": inPosCount / totalCount if totalCount > 0 else np.nan, 
+                     "perc_of_stops_in_obs": inObsCount / totalCount if totalCount > 0 else np.nan}) 
+
+    return pd.DataFrame(rows) 
+
+@instrument
 def getStopTags(timestamps, stops): 
     """
     Returns a pd.Series object of the same length as input variable timestamp, tagging True or False for every timestamp on if it is in any stop
@@ -307,6 +839,251 @@ def getStopTags(timestamps, stops):
 
     return pd.Series(tags) 
 
+@instrument
+def getStopLabels(timestamps, stops): 
+    """
+    Labels every timestamp with the index of the stop it is in, using binary 
+    search against stop starts and ends instead of walking thru the stops. 
+    A timestamp on the shared boundary of two stops belongs to the earlier 
+    stop, same as getStopEvent() in triangulation.ipynb 
+
+    Args:
+        timestamps (Iterable[float]): epoch timestamps 
+        stops (List[(float, float)]): start and end time of each stop, usually returned by getStops(), sorted and non-overlapping 
+
+    Returns:
+        numpy.ndarray: an int array of the same length as timestamps, holding the stop index of each timestamp; -1 if not in any stop 
+    """
+
+    timestamps = np.asarray(timestamps, dtype=np.float64) 
+    if(len(stops) == 0): return np.full(len(timestamps), -1) 
+
+    starts = np.array([ stop[0] for stop in stops ], dtype=np.float64) 
+    ends = np.array([ stop[1] for stop in stops ], dtype=np.float64) 
+
+    # first stop that ends at or after each timestamp 
+    ind = np.searchsorted(ends, timestamps, side="left") 
+    clipped = np.minimum(ind, len(stops) - 1) 
+    inStop = (ind < len(stops)) & (starts[clipped] <= timestamps) 
+
+    return np.where(inStop, ind, -1) 
+
+@instrument
+def getStopTagsFast(timestamps, stops): 
+    """
+    Same as getStopTags(), derived from getStopLabels() 
+
+    Returns:
+        pd.Series: True for every timestamp in any stop, False otherwise 
+    """
+    return pd.Series(getStopLabels(timestamps, stops) >= 0) 
+
+@instrument
+def getStopCentroidsFromLabels(X, Y, labels, numOfStops=None): 
+    """
+    Computes the centroid of every stop with one grouped reduction over the 
+    stop labels. Coordinates of each stop are summed in row order, so the 
+    centroids are the same as getCentroid() on the rows of the stop 
+
+    Args:
+        X (Iterable[float]): x-coordinates of the position rows 
+        Y (Iterable[float]): y-coordinates of the position rows 
+        labels (numpy.ndarray): stop index of each row, usually returned by getStopLabels() 
+        numOfStops (int, optional): number of stops. Defaults to None to use the largest label + 1.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): centroid X and Y of each stop; NaN for stops without any row 
+    """
+
+    labels = np.asarray(labels) 
+    if(numOfStops == None): numOfStops = labels.max() + 1 if len(labels) > 0 else 0 
+
+    inStop = labels >= 0 
+    counts = np.bincount(labels[inStop], minlength=numOfStops) 
+    sumX = np.bincount(labels[inStop], weights=np.asarray(X, dtype=np.float64)[inStop], minlength=numOfStops) 
+    sumY = np.bincount(labels[inStop], weights=np.asarray(Y, dtype=np.float64)[inStop], minlength=numOfStops) 
+
+    with np.errstate(invalid="ignore", divide="ignore"): 
+        return sumX / counts, sumY / counts 
+
+@instrument
+def getStopEventsFromLabels(X, Y, labels): 
+    """
+    Array-native version of getStopEvent() in triangulation.ipynb, generating 
+    the events and centroids of each position row from its stop label 
+
+    Args:
+        X (Iterable[float]): x-coordinates of the position rows 
+        Y (Iterable[float]): y-coordinates of the position rows 
+        labels (numpy.ndarray): stop index of each row, usually returned by getStopLabels() 
+
+    Returns:
+        (List[str], List[(float, float)]): event of each row ("Stopping in location: <centroid>" or "Moving") and centroid of each row (NaN if moving) 
+    """
+
+    labels = np.asarray(labels) 
+    centroidX, centroidY = getStopCentroidsFromLabels(X, Y, labels) 
+
+    # one centroid tuple and one event string per stop, shared by all rows of the stop 
+    stopCentroids = [ (centroidX[k], centroidY[k]) for k in range(len(centroidX)) ] 
+    stopEvents = [ "Stopping in location: " + str(centroid) for centroid in stopCentroids ] 
+
+    labels = labels.tolist() 
+    events = [ stopEvents[k] if k >= 0 else "Moving" for k in labels ] 
+    centroids = [ stopCentroids[k] if k >= 0 else np.nan for k in labels ] 
+
+    return events, centroids 
+
+@instrument
+def joinTransactionsToStops(studentX, studentY, timestamps, stops, centroids, rng): 
+    """
+    Array-native version of isBesideStop() in stamp_tutor_with_stops.ipynb. 
+    Each transaction is matched to the stops covering its timestamp by binary 
+    search, and a transaction is beside a stop if the student's seat is 
+    within rng of the stop centroid. Since stops only share boundaries, at 
+    most two stops cover a timestamp: the first stop ending at or after it, 
+    and the next one if it starts exactly on that end 
+
+    Args:
+        studentX (Iterable[float]): x-coordinate of the student's seat for each transaction, NaN if unknown 
+        studentY (Iterable[float]): y-coordinate of the student's seat for each transaction, NaN if unknown 
+        timestamps (Iterable[float]): epoch timestamp of each transaction, need not be sorted 
+        stops (List[(float, float)]): start and end time of each stop, usually returned by getStops(), sorted and non-overlapping 
+        centroids (List[(float, float)]): centroid of each stop 
+        rng (float): maximum distance between seat and centroid, unit is milimeter 
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): whether the teacher is beside the student at each transaction, and the index 
+        of the matching stop (the earlier one if two stops match); -1 if not beside any stop 
+    """
+
+    assert len(stops) == len(centroids), "Stops and centroids should be of the same length" 
+    studentX = np.asarray(studentX, dtype=np.float64) 
+    studentY = np.asarray(studentY, dtype=np.float64) 
+    timestamps = np.asarray(timestamps, dtype=np.float64) 
+    assert len(studentX) == len(studentY) == len(timestamps), "Transaction arrays should be of the same length" 
+
+    isBeside = np.zeros(len(timestamps), dtype=bool) 
+    stopIDs = np.full(len(timestamps), -1) 
+    if(len(stops) == 0): return isBeside, stopIDs 
+
+    starts = np.array([ stop[0] for stop in stops ], dtype=np.float64) 
+    ends = np.array([ stop[1] for stop in stops ], dtype=np.float64) 
+    centroidX = np.array([ centroid[0] for centroid in centroids ], dtype=np.float64) 
+    centroidY = np.array([ centroid[1] for centroid in centroids ], dtype=np.float64) 
+    assert np.all(ends > starts), "Stops should end after they start" 
+    assert np.all(starts[1:] >= ends[:-1]), "Stops should be sorted and non-overlapping" 
+
+    # first stop that ends at or after each timestamp 
+    ind = np.searchsorted(ends, timestamps, side="left") 
+    # check the later candidate first, so that the earlier stop wins if both match 
+    for candidate in [ind + 1, ind]: 
+        clipped = np.minimum(candidate, len(stops) - 1) 
+        covers = (candidate < len(stops)) & (starts[clipped] <= timestamps) & (timestamps <= ends[clipped]) 
+        # NaN seats or centroids are never within range 
+        isMatch = covers & (getDists(studentX, studentY, centroidX[clipped], centroidY[clipped]) <= rng) 
+        isBeside |= isMatch 
+        stopIDs[isMatch] = clipped[isMatch] 
+
+    return isBeside, stopIDs 
+
+@instrument
+def getStopRuns(stopsDFs, timestampCol="timestamp", contentCol="content", subjectCol="subject"): 
+    """
+    Stops of the stop events of several event master files (one per rng), 
+    found in one pass. Same as insertStopsCols() of the analytics notebook: 
+    stops are runs of rows with equal `content`, found by comparing each row 
+    with the previous one; a stop lasts from its first to its last row's 
+    timestamp, belongs to the subject of its last row, and the last stop of 
+    each frame is not counted. Unlike the notebook, spaces around the subject 
+    are stripped, so stops at the second and later seats of a split subject 
+    are counted too 
+
+    Args:
+        stopsDFs (dict): mapping from rng to the "Stopping" events of that rng's event master file 
+        timestampCol (str, optional): Defaults to "timestamp". 
+        contentCol (str, optional): Defaults to "content". 
+        subjectCol (str, optional): Defaults to "subject". 
+
+    Returns:
+        pandas.DataFrame: one row per stop of a valid student, in frame order, with `rng`, `studentID`, `length` 
+        and `endRow` (position of the stop's last row in its frame) columns 
+    """
+
+    rngs = list(stopsDFs) 
+    frameIDs = np.concatenate([ np.full(len(stopsDFs[rng]), i) for i, rng in enumerate(rngs) ] + [np.zeros(0, dtype=np.int64)]).astype(np.int64) 
+    frameStarts = np.cumsum([0] + [ len(stopsDFs[rng]) for rng in rngs ]) 
+    timestamps = np.concatenate([ stopsDFs[rng][timestampCol].to_numpy(dtype=np.float64) for rng in rngs ] + [np.zeros(0)]) 
+    contents = np.concatenate([ stopsDFs[rng][contentCol].to_numpy(dtype=object) for rng in rngs ] + [np.zeros(0, dtype=object)]) 
+    subjects = np.concatenate([ stopsDFs[rng][subjectCol].to_numpy(dtype=object) for rng in rngs ] + [np.zeros(0, dtype=object)]) 
+
+    # a run starts at the first row of a frame, and wherever content changes; 
+    # NaN content never equals the previous row, same as the notebook's != 
+    isStart = np.ones(len(contents), dtype=bool) 
+    isStart[1:] = (frameIDs[1:] != frameIDs[:-1]) | (contents[1:] != contents[:-1]) 
+    starts = np.flatnonzero(isStart) 
+    ends = np.append(starts[1:], len(contents)) - 1 
+    # runs followed by another run of the same frame, i.e. all but the last one of each frame 
+    isCounted = np.append(frameIDs[starts[1:]] == frameIDs[starts[:-1]], False) if len(starts) > 0 else isStart[:0] 
+    starts, ends = starts[isCounted], ends[isCounted] 
+
+    # resolved subjects are joined with "; ", so split subjects may start with a space 
+    studentIDs = subjects[ends].copy() 
+    isString = pd.Series(studentIDs).map(type).to_numpy() == str 
+    studentIDs[isString] = pd.Series(studentIDs[isString], dtype=object).str.strip().to_numpy(dtype=object) 
+    isValid = isValidStudIDs(studentIDs) 
+    starts, ends = starts[isValid], ends[isValid] 
+
+    return pd.DataFrame({"rng": np.array(rngs + [None], dtype=object)[:-1][frameIDs[starts]], 
+                         "studentID": studentIDs[isValid], 
+                         "length": timestamps[ends] - timestamps[starts], 
+                         "endRow": ends - frameStarts[frameIDs[ends]]}) 
+
+@instrument
+def getStudentStopLengths(stopsDFs, timestampCol="timestamp", contentCol="content", subjectCol="subject"): 
+    """
+    Lengths of the teacher's stops in range of each student, for the stops 
+    found by getStopRuns() 
+
+    Args:
+        stopsDFs (dict): mapping from rng to the "Stopping" events of that rng's event master file 
+
+    Returns:
+        pandas.DataFrame: `rng`, `studentID`, `count`, `total`, `mean`, `std`, `min` and `max` columns, one row per 
+        rng and student with at least one stop, in order of the student's first stop; std is the population std 
+    """
+
+    lengthsDF = getStopRuns(stopsDFs, timestampCol=timestampCol, contentCol=contentCol, subjectCol=subjectCol) 
+
+    statsDF = lengthsDF.groupby(["rng", "studentID"], sort=False)["length"].agg(["count", "sum", "mean", "min", "max"]) 
+    statsDF.insert(3, "std", lengthsDF.groupby(["rng", "studentID"], sort=False)["length"].std(ddof=0)) 
+    # groupby keeps the rng order of first appearance, which is the order of stopsDFs 
+    return statsDF.rename(columns={"sum": "total"}).reset_index() 
+
+@instrument
+def getTeacherPositionDF(path="output_files/teacher_position_sprint1_shou.csv", schedule=None):
+    """
+    Reads in teacher position data, which has `chosen_X`, `chosen_Y`, and
+    `time_stamp` columns
+
+    Args:
+        path (str, optional): path to position data file. Defaults to "output_files/teacher_position_sprint1_shou.csv".
+        schedule (ClassSchedule, optional): if given, `dayID` and `periodID` columns are (re-)assigned from it, so that
+            the position trace agrees with tutor and detector data on class windows. Defaults to None.
+
+    Returns:
+        pd.DataFrame: teacher position dataframe
+    """
+
+    posDF = pd.read_csv(path, index_col=False)
+    assert "chosen_X" in posDF.columns and "chosen_Y" in posDF.columns and "time_stamp" in posDF.columns, \
+           "Imported position data file does not have necessary column(s)"
+
+    # assign day and period ID's with the shared class schedule
+    if schedule is not None: posDF = schedule.annotateDF(posDF, timestampCol="time_stamp")
+
+    return posDF
+
 
 # testing code 
 # teacherPosDF = pd.read_csv("teacher_position_sprint1_shou.csv", index_col="Unnamed: 0") 
@@ -0,0 +1,329 @@
+################################################################################
+# Created for CMU Vincent's Lab, RETTL Project
+
+# Seeded generators of synthetic study data, since the original data cannot be
+# shared (IRB). Output files follow the formats read by the APIs: Datashop
+# by-transaction tutor logs (tutorDataAPI.getAnnotatedTutorLogDF()), raw
+# LearnSphere detector tsv files (detectorDataAPI.transformRawDetectorResults()),
+# the encoded detector results file (detectorDataAPI.getDetectorResultsDF())
+# and teacher position traces (stop_detection.getTeacherPositionDF()). The
+# unit of scale is a classroom, i.e. one class period of one day, so a data
+# set can be made from one classroom up to hundreds of them
+################################################################################
+
+import os
+import numpy as np
+import pandas as pd
+from class_schedule import ClassSchedule
+import tutorDataAPI as tutorAPI
+import detectorDataAPI as detectorAPI
+
+OUTCOMES = np.array(["CORRECT", "INCORRECT", "HINT"], dtype=object)
+OUTCOME_PROBS = [0.65, 0.22, 0.13]
+KC_LEVELS = ['cancel-const', 'division-simple', 'divide',
+             'subtraction-const', 'combine-like-const', 'subtraction-var',
+             'combine-like-var', 'cancel-var', 'distribute-division',
+             'division-complex']
+STEPS_PER_PROBLEM = 5 # average number of steps of a problem, including "done ButtonPressed"
+PROBLEMS_PER_SET = 4 # problems of a student's problem set level
+
+# raw detector name -> (values, probability of each value), values are the ones
+# label encoded by detectorDataAPI.transformRawDetectorResults()
+DETECTOR_VALUES = {
+    "critical_struggle": (['0, > 0 s,  ',
+                           '1, > 25 s, slow to master some skills',
+                           '1, > 45 s, slow to master some skills',
+                           '1, > 1 min, slow to master some skills',
+                           '1, > 2 min, slow to master some skills',
+                           '1, > 5 min, slow to master some skills',
+                           '1, > 10 min, slow to master some skills'],
+                          [0.70, 0.10, 0.07, 0.05, 0.04, 0.03, 0.01]),
+    "idle": (['1, > 2 min',
+              '1, > 5 min'],
+             [0.8, 0.2]),
+    "system_misuse": (['0, > 0 s,  ',
+                       '1, > 25 s, abusing hints?',
+                       '1, > 25 s, fast attempts in a row, not deliberate?',
+                       '1, > 45 s, abusing hints?',
+                       '1, > 1 min, abusing hints?',
+                       '1, > 2 min, fast attempts in a row, not deliberate?',
+                       '1, > 5 min, abusing hints?'],
+                      [0.75, 0.08, 0.06, 0.04, 0.03, 0.02, 0.02]),
+    "gaming": (['Not gaming',
+                'Gaming'],
+               [0.85, 0.15])
+}
+# fraction of transactions a detector reports a value at
+DETECTOR_RATES = {"critical_struggle": 0.5, "idle": 0.05, "system_misuse": 0.5, "gaming": 0.5}
+
+def getSyntheticSchedule(numOfClassrooms, periodsPerDay=5, periodLength=40*60, breakLength=20*60, firstDate="2022-05-23 08:30:00"):
+    """
+    Schedule of a synthetic study, one window per classroom. Classrooms fill
+    the periods of a day before moving to the next day
+
+    Args:
+        numOfClassrooms (int): number of class windows
+        periodsPerDay (int, optional): Defaults to 5.
+        periodLength (float, optional): length of a period in seconds. Defaults to 40*60.
+        breakLength (float, optional): time between two periods in seconds. Defaults to 20*60.
+        firstDate (str, optional): start of the first period, in EDT. Defaults to "2022-05-23 08:30:00".
+
+    Returns:
+        ClassSchedule: schedule with dayID's and periodID's counting from 1
+    """
+
+    assert numOfClassrooms > 0, "There should be at least one classroom"
+
+    classrooms = np.arange(numOfClassrooms)
+    days, periods = classrooms // periodsPerDay, classrooms % periodsPerDay
+    starts = tutorAPI.EDTDatetime2epoch(firstDate) + days * 24*60*60 + periods * (periodLength + breakLength)
+
+    return ClassSchedule(days + 1, periods + 1, starts, starts + periodLength)
+
+def _formatUTC(timestamps, format="%Y-%m-%d %H:%M:%S"):
+    return pd.to_datetime(np.asarray(timestamps, dtype=np.float64), unit="s", utc=True).strftime(format).to_numpy(dtype=object)
+
+def _withinGroup(groupOfRow):
+    """
+    Position of each row within its group, for rows sorted by group
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): position of each row, first row of each group
+    """
+    firsts = np.flatnonzero(np.diff(groupOfRow, prepend=-1) != 0)
+    counts = np.diff(np.append(firsts, len(groupOfRow)))
+    return np.arange(len(groupOfRow)) - np.repeat(firsts, counts), firsts
+
+def generateTutorLogDF(schedule, studentsPerClassroom=25, transactionsPerStudent=150, seed=0):
+    """
+    Generates a Datashop by-transaction tutor log. Each student works on
+    problems of a few steps during one class window; a step is attempted until
+    a correct attempt, with incorrect attempts and hint requests before it,
+    and every problem ends with a single "done ButtonPressed" step
+
+    Args:
+        schedule (ClassSchedule): class windows, one classroom of students per window
+        studentsPerClassroom (int, optional): Defaults to 25.
+        transactionsPerStudent (int, optional): mean number of transactions of a student. Defaults to 150.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        pandas.DataFrame: tutor log with raw Datashop columns (time as UTC date-time strings, `Duration (sec)` with "." for the first transactions)
+    """
+
+    rng = np.random.default_rng(seed)
+    scheduleDF = schedule.toDF()
+    numOfStudents = len(scheduleDF) * studentsPerClassroom
+    classroomOfStudent = np.repeat(np.arange(len(scheduleDF)), studentsPerClassroom)
+    studentIDs = np.array([ "Stu_" + rng.bytes(16).hex() for _ in range(numOfStudents) ], dtype=object)
+
+    # attempts of every student, rows are sorted by student
+    studentOfRow = np.repeat(np.arange(numOfStudents), np.maximum(rng.poisson(transactionsPerStudent, numOfStudents), 1))
+    outcome = rng.choice(len(OUTCOMES), size=len(studentOfRow), p=OUTCOME_PROBS)
+    isLastOfStudent = np.append(studentOfRow[1:] != studentOfRow[:-1], True)
+    outcome[isLastOfStudent] = 0 # close the last step of each student
+
+    # a step ends with its correct attempt
+    stepOfRow = np.concatenate([[0], np.cumsum(outcome == 0)[:-1]])
+    stepFirsts = np.flatnonzero(np.diff(stepOfRow, prepend=-1) != 0)
+    studentOfStep = studentOfRow[stepFirsts]
+    isLastStepOfStudent = np.append(studentOfStep[1:] != studentOfStep[:-1], True)
+    # a step closes its problem as the "done ButtonPressed" step
+    isDoneStep = (rng.random(len(stepFirsts)) < 1 / STEPS_PER_PROBLEM) | isLastStepOfStudent
+    problemOfStep = np.concatenate([[0], np.cumsum(isDoneStep)[:-1]])
+    stepInProblem, _ = _withinGroup(problemOfStep)
+    kcOfStep = rng.choice(len(KC_LEVELS), size=len(stepFirsts))
+
+    # "done ButtonPressed" is pressed once, keep only its correct attempt
+    keep = ~isDoneStep[stepOfRow] | (outcome == 0)
+    studentOfRow, outcome, stepOfRow = studentOfRow[keep], outcome[keep], stepOfRow[keep]
+    attemptAtStep, _ = _withinGroup(stepOfRow)
+    positionOfRow, studentFirsts = _withinGroup(studentOfRow)
+    problemOfRow = problemOfStep[stepOfRow]
+    _, problemFirsts = _withinGroup(problemOfRow)
+    problemInStudent, _ = _withinGroup(studentOfStep[isDoneStep])
+
+    # time of every transaction: each student starts within the first minutes
+    # of the window and spreads the transactions over the rest of it
+    windowStart = scheduleDF["start"].to_numpy()[classroomOfStudent]
+    windowEnd = scheduleDF["end"].to_numpy()[classroomOfStudent]
+    studentStart = windowStart + rng.uniform(0, 180, numOfStudents)
+    gaps = rng.exponential(1.0, len(studentOfRow))
+    gaps[studentFirsts] = 0
+    offsets = np.cumsum(gaps)
+    offsets -= offsets[studentFirsts][studentOfRow]
+    totals = np.maximum(offsets[np.append(studentFirsts[1:], len(offsets)) - 1], 1e-9)
+    scale = (windowEnd - studentStart - 60) * rng.uniform(0.7, 1.0, numOfStudents) / totals
+    times = np.floor(studentStart[studentOfRow] + offsets * scale[studentOfRow])
+
+    durations = np.char.mod("%.2f", np.diff(times, prepend=np.nan)).astype(object)
+    durations[positionOfRow == 0] = "."
+    problemStartTimes = times[problemFirsts][np.repeat(np.arange(len(problemFirsts)), np.diff(np.append(problemFirsts, len(times))))]
+
+    isDoneRow = isDoneStep[stepOfRow]
+    stepNames = np.char.add(np.char.add("solve", stepInProblem[stepOfRow].astype(str)), " UpdateTextArea").astype(object)
+    stepNames[isDoneRow] = "done ButtonPressed"
+    KCs = np.array(KC_LEVELS, dtype=object)[kcOfStep[stepOfRow]]
+    KCs[isDoneRow] = np.nan
+    levels = problemInStudent[problemOfRow] + 1
+    # attempts get a result and hint requests a hint message from the tutor
+    inputs = np.char.add("x = ", rng.integers(-20, 21, len(times)).astype(str)).astype(object)
+    inputs[outcome == 2] = np.nan
+    feedbacks = np.char.add("Hint on ", np.array(KC_LEVELS)[kcOfStep[stepOfRow]]).astype(object)
+    feedbacks[outcome != 2] = np.nan
+
+    return pd.DataFrame({"Row": np.arange(1, len(times) + 1),
+                         "Anon Student Id": studentIDs[studentOfRow],
+                         "Time": _formatUTC(times),
+                         "Time Zone": "UTC",
+                         "Duration (sec)": durations,
+                         "Student Response Type": np.where(outcome == 2, "HINT_REQUEST", "ATTEMPT"),
+                         "Tutor Response Type": np.where(outcome == 2, "HINT_MSG", "RESULT"),
+                         "Problem Name": np.char.add("LYN-", problemOfRow.astype(str)),
+                         "Level (ProblemSet)": np.char.add("ProblemSet", ((levels - 1) // PROBLEMS_PER_SET + 1).astype(str)),
+                         "Level (Position)": levels,
+                         "Problem Start Time": _formatUTC(problemStartTimes),
+                         "Step Name": stepNames,
+                         "Attempt At Step": attemptAtStep + 1,
+                         "Is Last Attempt": (outcome == 0).astype(int),
+                         "Input": inputs,
+                         "Outcome": OUTCOMES[outcome],
+                         "Feedback Text": feedbacks,
+                         "KC (Default)": KCs,
+                         "Class": np.char.add("Period", scheduleDF["periodID"].to_numpy()[classroomOfStudent][studentOfRow].astype(str))})
+
+def generateDetectorDFs(tutorLogDF, switchProb=0.2, seed=0):
+    """
+    Generates raw LearnSphere detector results for the students of a tutor
+    log. Detectors report at a subset of each student's transactions, and a
+    student's value changes with probability `switchProb` between reports
+
+    Args:
+        tutorLogDF (pandas.DataFrame): raw tutor log, e.g. returned by generateTutorLogDF()
+        switchProb (float, optional): probability of drawing a new value at a report. Defaults to 0.2.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        dict: mapping from raw detector name to a dataframe with `Detector_Name`, `Student_ID`, `Time` and `Value` columns
+    """
+
+    rng = np.random.default_rng(seed)
+    logDF = tutorLogDF.sort_values(["Anon Student Id", "Time"], kind="stable")
+    students = logDF["Anon Student Id"].to_numpy()
+    # detector time stamps are ISO date-times in UTC
+    times = pd.to_datetime(logDF["Time"], utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S.000Z").to_numpy(dtype=object)
+
+    detectorDFs = dict()
+    for detector, (values, probs) in DETECTOR_VALUES.items():
+        rows = np.flatnonzero(rng.random(len(students)) < DETECTOR_RATES[detector])
+        isFirstOfStudent = np.ones(len(rows), dtype=bool)
+        isFirstOfStudent[1:] = students[rows][1:] != students[rows][:-1]
+
+        # sticky values: a new value is drawn at the first report and at switches
+        isSwitch = isFirstOfStudent | (rng.random(len(rows)) < switchProb)
+        drawn = rng.choice(len(values), size=len(rows), p=probs)
+        lastSwitch = np.maximum.accumulate(np.where(isSwitch, np.arange(len(rows)), 0))
+
+        detectorDFs[detector] = pd.DataFrame({"Detector_Name": detector,
+                                              "Student_ID": students[rows],
+                                              "Time": times[rows],
+                                              "Value": np.array(values, dtype=object)[drawn[lastSwitch]]})
+
+    return detectorDFs
+
+def generateTeacherPositionDF(schedule, rate=2, roomSize=(9000, 7000), meanDwell=30, speed=800, noise=80, seed=0):
+    """
+    Generates a teacher position trace for every class window. The teacher
+    alternates between dwelling at a random spot of the room and walking to
+    the next spot in a straight line; samples are taken at `rate` Hz with
+    gaussian noise
+
+    Args:
+        schedule (ClassSchedule): class windows
+        rate (float, optional): samples per second. Defaults to 2.
+        roomSize ((float, float), optional): room width and depth, in the unit of the coordinates. Defaults to (9000, 7000).
+        meanDwell (float, optional): mean dwell time at a spot in seconds. Defaults to 30.
+        speed (float, optional): walking speed, in unit of coordinates per second. Defaults to 800.
+        noise (float, optional): standard deviation of the position noise. Defaults to 80.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        pandas.DataFrame: position trace with `chosen_X`, `chosen_Y`, `time_stamp`, `dayID` and `periodID` columns, sorted by time
+    """
+
+    rng = np.random.default_rng(seed)
+    DFs = []
+    for _, window in schedule.toDF().iterrows():
+
+        timestamp = np.arange(window["start"], window["end"], 1 / rate)
+        # key frames of the path: every spot is entered and left once
+        keyTimes, keyX, keyY = [], [], []
+        t = window["start"]
+        x, y = rng.uniform(0, roomSize[0]), rng.uniform(0, roomSize[1])
+        while t < window["end"]:
+            leave = t + rng.exponential(meanDwell)
+            keyTimes += [t, leave]
+            keyX += [x, x]
+            keyY += [y, y]
+            nextX, nextY = rng.uniform(0, roomSize[0]), rng.uniform(0, roomSize[1])
+            t = leave + np.hypot(nextX - x, nextY - y) / speed
+            x, y = nextX, nextY
+
+        DFs.append(pd.DataFrame({"chosen_X": np.interp(timestamp, keyTimes, keyX) + rng.normal(0, noise, len(timestamp)),
+                                 "chosen_Y": np.interp(timestamp, keyTimes, keyY) + rng.normal(0, noise, len(timestamp)),
+                                 "time_stamp": timestamp,
+                                 "dayID": float(window["dayID"]),
+                                 "periodID": float(window["periodID"])}))
+
+    return pd.concat(DFs, ignore_index=True)
+
+def writeSyntheticDataset(directory, numOfClassrooms, studentsPerClassroom=25, transactionsPerStudent=150, positionRate=2, seed=0,
+                          encodeDetectorResults=True):
+    """
+    Writes a synthetic data set of `numOfClassrooms` classrooms in the file
+    formats of the original data
+
+    Args:
+        directory (str): output directory, created if not existing
+        numOfClassrooms (int): number of classrooms (class windows)
+        studentsPerClassroom (int, optional): Defaults to 25.
+        transactionsPerStudent (int, optional): Defaults to 150.
+        positionRate (float, optional): teacher position samples per second. Defaults to 2.
+        seed (int, optional): random seed; each kind of data uses its own stream derived from it. Defaults to 0.
+        encodeDetectorResults (bool, optional): whether to also write the encoded detector results csv. Defaults to True.
+
+    Returns:
+        dict: paths of the `schedule` csv, `tutorLog` tsv, `detectorResults` directory, `detectorResultsEncoded`
+            csv (if written) and `teacherPosition` csv
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    tutorSeed, detectorSeed, positionSeed = np.random.SeedSequence(seed).generate_state(3)
+    paths = {"schedule": os.path.join(directory, "schedule.csv"),
+             "tutorLog": os.path.join(directory, "tutor_log.tsv"),
+             "detectorResults": os.path.join(directory, "detector_results"),
+             "teacherPosition": os.path.join(directory, "teacher_position.csv")}
+
+    schedule = getSyntheticSchedule(numOfClassrooms)
+    schedule.toDF().to_csv(paths["schedule"], index=False)
+
+    tutorLogDF = generateTutorLogDF(schedule, studentsPerClassroom, transactionsPerStudent, seed=tutorSeed)
+    tutorLogDF.to_csv(paths["tutorLog"], sep="\t", index=False)
+
+    # the detector directory should only hold detector output files
+    os.makedirs(paths["detectorResults"], exist_ok=True)
+    for detector, detectorDF in generateDetectorDFs(tutorLogDF, seed=detectorSeed).items():
+        detectorDF.to_csv(os.path.join(paths["detectorResults"], f"{detector}.tsv"), sep="\t", index=False)
+    if encodeDetectorResults:
+        paths["detectorResultsEncoded"] = os.path.join(directory, "detector_results.csv")
+        detectorAPI.transformRawDetectorResults(paths["detectorResults"], schedule=schedule).to_csv(paths["detectorResultsEncoded"], index=False)
+
+    generateTeacherPositionDF(schedule, rate=positionRate, seed=positionSeed).to_csv(paths["teacherPosition"], index=False)
+
+    return paths
+
+
+if __name__ == "__main__":
+
+    paths = writeSyntheticDataset("output_files/synthetic_data", 5)
+    print(paths)
@@ -9,6 +9,8 @@
 import pandas as pd 
 import numpy as np 
 from datetime import datetime, timezone, timedelta
+from profiling import instrument, section
+from id_resolution import StudentIDResolver
 
 def EDTDatetime2epoch(dateTime, format="%Y-%m-%d %H:%M:%S"):
     """Converts EDT date-time string to epoch time represented by an interger 
@@ -61,6 +63,7 @@ def epoch2datetimeInEDT(timestamp):
     dateTime = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
     return dateTime 
 
+@instrument
 def filterWithStudents(tutorLogDF, students): 
     """filter tutor log dataframe by students' anon user ids and return a filtered dataset 
 
@@ -78,6 +81,7 @@ def filterWithStudents(tutorLogDF, students):
 
     return filteredDF
 
+@instrument
 def filterWithTime(tutorLogDF, startTime, endTime):
     """filter tutor log data by start and end time stamp. Usually used to extract data from a period 
 
@@ -102,6 +106,7 @@ def filterWithTime(tutorLogDF, startTime, endTime):
 
     return filteredDF
 
+@instrument
 def getStudentIDsByTime(tutorLogDF, startTime=None, endTime=None): 
     """
     Get student ID's who have transaction records between start and end time
@@ -113,6 +118,7 @@ def getStudentIDsByTime(tutorLogDF, startTime=None, endTime=None):
     studentIDs = filteredDF["Anon Student Id"].unique().tolist() 
     return studentIDs 
 
+@instrument
 def getStudentIDsByPeriod(tutorLogDF, periodID): 
     """
     Get student ID's who have transaction records by period ID. Note that the 
@@ -123,6 +129,7 @@ def getStudentIDsByPeriod(tutorLogDF, periodID):
     studentIDs = filteredDF["Anon Student Id"].unique().tolist() 
     return studentIDs 
 
+@instrument
 def getStudentPerformanceSummary(tutorLogDF, students=None, startTime=None, endTime=None):
     """
     Measures student performance by percentage of attempt correctness during a time interval
@@ -163,7 +170,8 @@ def getStudentPerformanceSummary(tutorLogDF, students=None, startTime=None, endT
     else: return totalCorrect / totalAttempts
 
 
-def getNumOfProblemsSolved(tutorLogDF, students=None, startTime=None, endTime=None): 
+@instrument
+def getNumOfProblemsSolved(tutorLogDF, students=None, startTime=None, endTime=None, problemTable=None): 
     """Generate descriptive stats of the total number of problems solved by given students during given time interval 
 
     Args:
@@ -171,11 +179,17 @@ def getNumOfProblemsSolved(tutorLogDF, students=None, startTime=None, endTime=No
         students (Iterable): one/several anon_stud_id's to get the performance percentage 
         startTime (_int_): unix time stamp indicating the start of the interval 
         endTime (_int_): unix time stamp indicating the end of the interval 
+        problemTable (pd.DataFrame, optional): getProblemTable() of tutorLogDF; if given, done problem instances 
+            are counted from it instead of scanning the log. Defaults to None.
 
     Returns:
         int: total number of problems solved by given students during given time interval 
     """    
 
+    if problemTable is not None: 
+        problemsDF = _filterProblemTable(problemTable, students, startTime, endTime, "doneTimestamp") 
+        return int(problemsDF["isDone"].sum()) 
+
     # do some filtering with students and start/end timestamp 
     filteredDF = filterWithStudents(tutorLogDF, students) 
     filteredDF = filterWithTime(filteredDF, startTime, endTime) 
@@ -188,6 +202,7 @@ def getNumOfProblemsSolved(tutorLogDF, students=None, startTime=None, endTime=No
 
     return numOfProblemsSolved
 
+@instrument
 def getNumOfHints(tutorLogDF, students=None, startTime=None, endTime=None): 
     """Generate descriptive stats of the total number of hints requested by given students during given time interval 
 
@@ -210,6 +225,7 @@ def getNumOfHints(tutorLogDF, students=None, startTime=None, endTime=None):
     return numOfHints
 
 
+@instrument
 def getAveNumOfHintsPerProblem(tutorLogDF, students=None, startTime=None, endTime=None): 
     """Generates average number of hints used by given students in given time period 
 
@@ -229,7 +245,8 @@ def getAveNumOfHintsPerProblem(tutorLogDF, students=None, startTime=None, endTim
 
     return numOfHints / numOfProblems 
 
-def getTimeToSolveSummary(tutorLogDF, students=None, startTime=None, endTime=None): 
+@instrument
+def getTimeToSolveSummary(tutorLogDF, students=None, startTime=None, endTime=None, problemTable=None): 
     """ 
     Get the mean and std the time, in seconds, to solve each problem for 
     given student in given time interval
@@ -239,6 +256,8 @@ def getTimeToSolveSummary(tutorLogDF, students=None, startTime=None, endTime=Non
         students (Iterable): one/several anon_stud_id's to get the performance percentage 
         startTime (_int_): unix time stamp indicating the start of the interval 
         endTime (_int_): unix time stamp indicating the end of the interval 
+        problemTable (pd.DataFrame, optional): getProblemTable() of tutorLogDF; if given, its already parsed 
+            `timeToSolve` is used instead of parsing the log's date-times. Defaults to None.
 
     Returns:
         (float, float): mean and std of time taken to solve the problems (unit is second)
@@ -246,6 +265,12 @@ def getTimeToSolveSummary(tutorLogDF, students=None, startTime=None, endTime=Non
 
     timeTakenForOneProblemUpperBound = 60*20 # in second 
 
+    if problemTable is not None: 
+        problemsDF = _filterProblemTable(problemTable, students, startTime, endTime, "doneTimestamp") 
+        timeTaken = problemsDF["timeToSolve"].loc[problemsDF["isDone"]] 
+        timeTaken = timeTaken.loc[timeTaken < timeTakenForOneProblemUpperBound] 
+        return np.mean(timeTaken), np.std(timeTaken) 
+
     # basic filtering 
     filteredDF = filterWithStudents(tutorLogDF, students) 
     filteredDF = filterWithTime(filteredDF, startTime, endTime) 
@@ -255,11 +280,13 @@ def getTimeToSolveSummary(tutorLogDF, students=None, startTime=None, endTime=Non
     filteredDF = filteredDF.loc[filteredDF["Step Name"] == "done ButtonPressed"] 
     # the difference in time between the "done ButtonPressed" transaction and 
     # the `Problem Start Time` value should be time taken to solve the problem
-    timeTaken = filteredDF["Time"].apply(UTCDatetime2epoch) - filteredDF["Problem Start Time"].apply(UTCDatetime2epoch) 
+    with section("tutorDataAPI.getTimeToSolveSummary: strptime", rows=len(filteredDF)): 
+        timeTaken = filteredDF["Time"].apply(UTCDatetime2epoch) - filteredDF["Problem Start Time"].apply(UTCDatetime2epoch) 
     timeTaken = timeTaken.loc[timeTaken < timeTakenForOneProblemUpperBound]
 
     return np.mean(timeTaken), np.std(timeTaken) 
 
+@instrument
 def getKCLevelPerformance(tutorLogDF, students=None, startTime=None, endTime=None, suffix="_rate"): 
     """Generate the performance of given students in given time interval in each KC levels 
 
@@ -293,6 +320,7 @@ def getKCLevelPerformance(tutorLogDF, students=None, startTime=None, endTime=Non
     return kc2CorrectRateMapping
 
 
+@instrument
 def getProblemLevelSummary(tutorLogDF, students=None, startTime=None, endTime=None): 
 
     # basic filtering 
@@ -306,7 +334,18 @@ def getProblemLevelSummary(tutorLogDF, students=None, startTime=None, endTime=No
     return np.mean(filteredDF["Level (Position)"]), np.std(filteredDF["Level (Position)"])
 
 
-def getNumOfSteps(tutorLogDF, students=None, startTime=None, endTime=None):
+@instrument
+def getNumOfSteps(tutorLogDF, students=None, startTime=None, endTime=None, problemTable=None):
+    """
+    Number of steps, i.e. last attempts, of given students in given time 
+    interval. If problemTable, the getProblemTable() of tutorLogDF, is given 
+    and there is no time interval, steps are summed over its problem instances 
+    instead of scanning the log; a problem may straddle the interval, so the 
+    log is still scanned with one 
+    """
+
+    if problemTable is not None and startTime == None and endTime == None: 
+        return _filterProblemTable(problemTable, students, None, None, "startTimestamp")["numOfSteps"].sum() 
 
     # basic filtering 
     filteredDF = filterWithStudents(tutorLogDF, students) 
@@ -318,6 +357,7 @@ def getNumOfSteps(tutorLogDF, students=None, startTime=None, endTime=None):
 
     return numOfSteps
 
+@instrument
 def getTimePerStep(tutorLogDF, students=None, startTime=None, endTime=None): 
 
     # basic filtering 
@@ -332,6 +372,7 @@ def getTimePerStep(tutorLogDF, students=None, startTime=None, endTime=None):
     else: return totalTime / numOfSteps
 
 
+@instrument
 def getIncorrectCount(tutorLogDF, students=None, startTime=None, endTime=None): 
     """
     Returns a dataframe with total count of incorrect attempts for each student 
@@ -354,6 +395,7 @@ def getIncorrectCount(tutorLogDF, students=None, startTime=None, endTime=None):
     return resDF
 
 
+@instrument
 def getFirstAttemptPerf(tutorLogDF, students=None, startTime=None, endTime=None): 
     """
     Returned a pandas dataframe with two columns: `studentID` and `firstAttemptPerformance`. 
@@ -377,6 +419,7 @@ def getFirstAttemptPerf(tutorLogDF, students=None, startTime=None, endTime=None)
     # get the correct first attempts only 
     studentGroups = filteredDF.groupby("Anon Student Id") # groupby object by studentID's 
 
+    @instrument
     def getIndStudFirstAttemptPerf(indStudDF): 
 
         indStudDF = indStudDF.loc[ indStudDF["Attempt At Step"] == 1 ] 
@@ -394,6 +437,7 @@ def getFirstAttemptPerf(tutorLogDF, students=None, startTime=None, endTime=None)
     firstAttemptPerf.index = np.arange(len(firstAttemptPerf)) 
     return firstAttemptPerf
 
+@instrument
 def getAvgCorrectStepDuration(tutorLogDF, students=None, startTime=None, endTime=None): 
     """
     Returns a dataframe with a column of `studentID` and a column with the average 
@@ -425,6 +469,7 @@ def getAvgCorrectStepDuration(tutorLogDF, students=None, startTime=None, endTime
     
     return resDF 
 
+@instrument
 def getAvgErrorStepDuration(tutorLogDF, students=None, startTime=None, endTime=None): 
     """
     Returns a dataframe with a column of `studentID` and a column with the average 
@@ -461,6 +506,7 @@ def getAvgErrorStepDuration(tutorLogDF, students=None, startTime=None, endTime=N
     
     return resDF 
 
+@instrument
 def getAvgHintDurationPerStep(tutorLogDF, students=None, startTime=None, endTime=None): 
 
     """
@@ -484,6 +530,7 @@ def getAvgHintDurationPerStep(tutorLogDF, students=None, startTime=None, endTime
     studentGroups = filteredDF.groupby("Anon Student Id") 
 
     # helper function to put into .apply() 
+    @instrument
     def getAvgHintDurationPerStepPerStud(studDF): 
 
         # obtain the errorous steps count 
@@ -515,6 +562,7 @@ def getAvgHintDurationPerStep(tutorLogDF, students=None, startTime=None, endTime
 
     return resDF 
 
+@instrument
 def getAssistanceScorePerStep(tutorLogDF, students=None, startTime=None, endTime=None): 
 
     """
@@ -540,6 +588,7 @@ def getAssistanceScorePerStep(tutorLogDF, students=None, startTime=None, endTime
     studentGroups = filteredDF.groupby("Anon Student Id") 
 
     # helper function to put into .apply() 
+    @instrument
     def getAssistanceScorePerStepPerStud(studDF): 
 
         totalAssistanceScore = 0 
@@ -558,7 +607,8 @@ def getAssistanceScorePerStep(tutorLogDF, students=None, startTime=None, endTime
 
     return resDF 
 
-def getAnnotatedTutorLogDF(tutorLogFilePath: str, delimiter: str="\t", startTimestamp: float=None, endTimestamp: float=None): 
+@instrument
+def getAnnotatedTutorLogDF(tutorLogFilePath: str, delimiter: str="\t", startTimestamp: float=None, endTimestamp: float=None, schedule=None): 
 
     """
     Function for reading-in Datashop by-transaction format Lynnette tutor log 
@@ -569,15 +619,19 @@ def getAnnotatedTutorLogDF(tutorLogFilePath: str, delimiter: str="\t", startTime
         delimiter (str, optional): Defaults to "\t".
         startTimestamp (float, optional): start timestamp for filtering the data. Defaults to None.
         endTimestamp (float, optional): end timestamp for filtering the data. Defaults to None.
+        schedule (ClassSchedule, optional): if given, `dayID` and `periodID` columns are assigned from it. Defaults to None.
 
     Returns:
         pandas.DataFrame: pandas dataframe that carries the annotated Lynnette tutor log data
     """    
 
-    tutorLogDF = pd.read_csv(tutorLogFilePath, delimiter=delimiter, index_col=False) 
+    with section("tutorDataAPI.getAnnotatedTutorLogDF: read_csv"): 
+        tutorLogDF = pd.read_csv(tutorLogFilePath, delimiter=delimiter, index_col=False) 
     tutorLogDF["Time Zone"] = "UTC" # the logs are entered in UTC time zone 
-    tutorLogDF["timestamp"] = tutorLogDF["Time"].apply(UTCDatetime2epoch) # add a new column with unix time stamps 
-    tutorLogDF["EDT_time"] = tutorLogDF["timestamp"].apply(epoch2datetimeInEDT) # append a new column with EDT time information to be more intuitive 
+    with section("tutorDataAPI.getAnnotatedTutorLogDF: strptime", rows=len(tutorLogDF)): 
+        tutorLogDF["timestamp"] = tutorLogDF["Time"].apply(UTCDatetime2epoch) # add a new column with unix time stamps 
+    with section("tutorDataAPI.getAnnotatedTutorLogDF: strftime", rows=len(tutorLogDF)): 
+        tutorLogDF["EDT_time"] = tutorLogDF["timestamp"].apply(epoch2datetimeInEDT) # append a new column with EDT time information to be more intuitive 
 
     # only aceepting data within the experiment period, which is between 05/23/2022 and 05/25/2022 
     tutorLogDF = filterWithTime(tutorLogDF, startTimestamp, endTimestamp) 
@@ -586,6 +640,344 @@ def getAnnotatedTutorLogDF(tutorLogFilePath: str, delimiter: str="\t", startTime
     tutorLogDF = tutorLogDF.replace({ "Duration (sec)": {".": "0"} }) # replace dot with 0, sicne dot cannot be parsed 
     tutorLogDF["Duration (sec)"] = pd.to_numeric(tutorLogDF["Duration (sec)"]) 
 
+    # assign day and period ID's with the shared class schedule 
+    if schedule is not None: tutorLogDF = schedule.annotateDF(tutorLogDF, timestampCol="timestamp") 
+
     return tutorLogDF
 
-    
\ No newline at end of file
+@instrument
+def getStudentPositions(tutorLogDF, positionMappingDF, studentCol="Anon Student Id", mappingStudentCol="anon_user_id"): 
+
+    """
+    Looks up the seat coordinates of the student of every transaction, by 
+    (dayID, periodID, student ID) in a hash index of the seat table. Same 
+    result as the row-by-row positionMapping lookup in 
+    stamp_tutor_with_stops.ipynb 
+
+    Args:
+        tutorLogDF (pandas.DataFrame): tutor log with `dayID` and `periodID` columns 
+        positionMappingDF (pandas.DataFrame): student seat table with `dayID`, `periodID`, `X`, `Y` and student ID columns, e.g. output_files/student_position_sprint1_shou.csv 
+        studentCol (str, optional): student ID column of the tutor log. Defaults to "Anon Student Id".
+        mappingStudentCol (str, optional): student ID column of the seat table. Defaults to "anon_user_id".
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): X and Y arrays aligned with the rows of tutorLogDF; NaN if the student's seat is not documented 
+    """    
+
+    # the resolver keeps the last row of duplicated keys and never matches NaN keys, 
+    # same as the notebook's mapping dictionary 
+    resolver = StudentIDResolver(positionMappingDF[["dayID", "periodID", mappingStudentCol, "X", "Y"]], anonIDCol=mappingStudentCol) 
+
+    return resolver.getPositions(tutorLogDF["dayID"].to_numpy(), tutorLogDF["periodID"].to_numpy(), tutorLogDF[studentCol].to_numpy()) 
+
+
+@instrument
+def segmentTutorLog(tutorLogDF, idleGap=300, studentCol="Anon Student Id"): 
+
+    """
+    Assigns every transaction an integer problem instance ID and work session 
+    ID. Transactions are ordered by student and time; a new problem instance 
+    starts when `Problem Name` or `Problem Start Time` changes from the 
+    student's previous transaction, so a problem worked on twice gets two 
+    instances, and a new session starts when the student has been idle for 
+    more than idleGap seconds. Both ID's count from 0 in this order 
+
+    Args:
+        tutorLogDF (pandas.DataFrame): usually returned by getAnnotatedTutorLogDF() 
+        idleGap (float, optional): longest pause, in seconds, within a work session. Defaults to 300.
+        studentCol (str, optional): Defaults to "Anon Student Id".
+
+    Returns:
+        pandas.DataFrame: copy of tutorLogDF with `problemInstanceID` and `sessionID` columns 
+    """
+
+    assert idleGap >= 0, "Idle gap should be non-negative" 
+
+    students = tutorLogDF[studentCol].to_numpy(dtype=object) 
+    timestamps = tutorLogDF["timestamp"].to_numpy(dtype=np.float64) 
+    # stable sort by student, then time, keeps the log order of simultaneous transactions 
+    studentCodes = pd.factorize(students)[0] 
+    order = np.lexsort((timestamps, studentCodes)) 
+
+    def isChanged(values): 
+        # NaN never equals the previous value, same as comparing with != 
+        values = values[order] 
+        changed = np.ones(len(values), dtype=bool) 
+        changed[1:] = values[1:] != values[:-1] 
+        return changed 
+
+    isNewStudent = isChanged(studentCodes) 
+    isNewProblem = isNewStudent | isChanged(tutorLogDF["Problem Name"].to_numpy(dtype=object)) | \
+                   isChanged(tutorLogDF["Problem Start Time"].to_numpy(dtype=object)) 
+    sortedTimestamps = timestamps[order] 
+    isNewSession = isNewStudent.copy() 
+    isNewSession[1:] |= (sortedTimestamps[1:] - sortedTimestamps[:-1]) > idleGap 
+
+    segmentedDF = tutorLogDF.copy() 
+    for col, isNew in [("problemInstanceID", isNewProblem), ("sessionID", isNewSession)]: 
+        IDs = np.empty(len(order), dtype=np.int64) 
+        IDs[order] = np.cumsum(isNew) - 1 
+        segmentedDF[col] = IDs 
+
+    return segmentedDF 
+
+def _filterProblemTable(problemTable, students, startTime, endTime, timestampCol): 
+    """
+    Problem instances of given students whose timestampCol lies within given 
+    time interval 
+    """
+    problemsDF = problemTable 
+    if students != None: problemsDF = problemsDF.loc[problemsDF["studentID"].isin(students)] 
+    if startTime != None: problemsDF = problemsDF.loc[problemsDF[timestampCol] >= startTime] 
+    if endTime != None: problemsDF = problemsDF.loc[problemsDF[timestampCol] <= endTime] 
+    return problemsDF 
+
+@instrument
+def getProblemTable(segmentedDF, studentCol="Anon Student Id"): 
+
+    """
+    One row per problem instance of a log segmented by segmentTutorLog(). 
+    `Problem Start Time` is parsed once per instance, and the columns replace 
+    the per-transaction proxies, e.g. `numOfSteps` is the number of last 
+    attempts and `isDone` whether `done ButtonPressed` was reached 
+
+    Args:
+        segmentedDF (pandas.DataFrame): returned by segmentTutorLog() 
+        studentCol (str, optional): Defaults to "Anon Student Id".
+
+    Returns:
+        pandas.DataFrame: `problemInstanceID`, `studentID`, `sessionID` (of the first transaction), `problemName`, 
+        `level`, `problemStartTimestamp`, `startTimestamp`, `endTimestamp`, `doneTimestamp`, `timeToSolve`, 
+        `numOfTransactions`, `numOfSteps`, `numOfCorrect`, `numOfIncorrect`, `numOfHints`, `totalDuration` 
+        and `isDone` columns, sorted by problemInstanceID 
+    """
+
+    outcomes = segmentedDF["Outcome"].to_numpy(dtype=object) 
+    isDoneRow = (segmentedDF["Step Name"] == "done ButtonPressed").to_numpy() 
+    rowsDF = pd.DataFrame({"problemInstanceID": segmentedDF["problemInstanceID"].to_numpy(), 
+                           "studentID": segmentedDF[studentCol].to_numpy(dtype=object), 
+                           "sessionID": segmentedDF["sessionID"].to_numpy(), 
+                           "problemName": segmentedDF["Problem Name"].to_numpy(dtype=object), 
+                           "level": segmentedDF["Level (Position)"].to_numpy(), 
+                           "problemStartTime": segmentedDF["Problem Start Time"].to_numpy(dtype=object), 
+                           "timestamp": segmentedDF["timestamp"].to_numpy(dtype=np.float64), 
+                           "doneTimestamp": np.where(isDoneRow, segmentedDF["timestamp"].to_numpy(dtype=np.float64), np.nan), 
+                           "isLastAttempt": pd.to_numeric(segmentedDF["Is Last Attempt"], errors="coerce").to_numpy(), 
+                           "isCorrect": outcomes == "CORRECT", 
+                           "isIncorrect": outcomes == "INCORRECT", 
+                           "isHint": outcomes == "HINT", 
+                           "duration": pd.to_numeric(segmentedDF["Duration (sec)"], errors="coerce").to_numpy(), 
+                           "isDone": isDoneRow}) 
+
+    # transactions of an instance are not necessarily contiguous in the log, so sort them first 
+    rowsDF = rowsDF.sort_values(["problemInstanceID", "timestamp"], kind="stable") 
+    problemsDF = rowsDF.groupby("problemInstanceID", sort=True).agg(studentID=("studentID", "first"), 
+                                                                     sessionID=("sessionID", "first"), 
+                                                                     problemName=("problemName", "first"), 
+                                                                     level=("level", "first"), 
+                                                                     problemStartTime=("problemStartTime", "first"), 
+                                                                     startTimestamp=("timestamp", "min"), 
+                                                                     endTimestamp=("timestamp", "max"), 
+                                                                     doneTimestamp=("doneTimestamp", "max"), 
+                                                                     numOfTransactions=("timestamp", "size"), 
+                                                                     numOfSteps=("isLastAttempt", "sum"), 
+                                                                     numOfCorrect=("isCorrect", "sum"), 
+                                                                     numOfIncorrect=("isIncorrect", "sum"), 
+                                                                     numOfHints=("isHint", "sum"), 
+                                                                     totalDuration=("duration", "sum"), 
+                                                                     isDone=("isDone", "any")) 
+
+    # one parse per problem instance instead of per transaction 
+    problemStartTimes = pd.to_datetime(problemsDF["problemStartTime"], format="%Y-%m-%d %H:%M:%S", errors="coerce", utc=True) 
+    problemsDF.insert(4, "problemStartTimestamp", (problemStartTimes - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)) 
+    problemsDF = problemsDF.drop(columns="problemStartTime") 
+    problemsDF.insert(problemsDF.columns.get_loc("doneTimestamp") + 1, "timeToSolve", 
+                      problemsDF["doneTimestamp"] - problemsDF["problemStartTimestamp"]) 
+
+    return problemsDF.reset_index() 
+
+@instrument
+def getSessionTable(segmentedDF, studentCol="Anon Student Id"): 
+
+    """
+    One row per work session of a log segmented by segmentTutorLog() 
+
+    Args:
+        segmentedDF (pandas.DataFrame): returned by segmentTutorLog() 
+        studentCol (str, optional): Defaults to "Anon Student Id".
+
+    Returns:
+        pandas.DataFrame: `sessionID`, `studentID`, `startTimestamp`, `endTimestamp`, `sessionLength` (seconds), 
+        `numOfTransactions`, `numOfProblems` (instances worked on), `numOfProblemsDone` and `numOfSteps` columns, 
+        sorted by sessionID 
+    """
+
+    rowsDF = pd.DataFrame({"sessionID": segmentedDF["sessionID"].to_numpy(), 
+                           "studentID": segmentedDF[studentCol].to_numpy(dtype=object), 
+                           "timestamp": segmentedDF["timestamp"].to_numpy(dtype=np.float64), 
+                           "problemInstanceID": segmentedDF["problemInstanceID"].to_numpy(), 
+                           "doneProblemInstanceID": segmentedDF["problemInstanceID"].where(segmentedDF["Step Name"] == "done ButtonPressed").to_numpy(), 
+                           "isLastAttempt": pd.to_numeric(segmentedDF["Is Last Attempt"], errors="coerce").to_numpy()}) 
+
+    sessionsDF = rowsDF.groupby("sessionID", sort=True).agg(studentID=("studentID", "first"), 
+                                                             startTimestamp=("timestamp", "min"), 
+                                                             endTimestamp=("timestamp", "max"), 
+                                                             numOfTransactions=("timestamp", "size"), 
+                                                             numOfProblems=("problemInstanceID", "nunique"), 
+                                                             numOfProblemsDone=("doneProblemInstanceID", "nunique"), 
+                                                             numOfSteps=("isLastAttempt", "sum")) 
+    sessionsDF.insert(3, "sessionLength", sessionsDF["endTimestamp"] - sessionsDF["startTimestamp"]) 
+
+    return sessionsDF.reset_index() 
+
+def _getAttemptIndicators(tutorLogDF, studentCol): 
+    """
+    Transactions sorted by student and time, with attempt, correct and hint 
+    indicators in that order, shared by the rolling window metrics 
+    """
+
+    studentCodes = pd.factorize(tutorLogDF[studentCol].to_numpy(dtype=object))[0] 
+    timestamps = tutorLogDF["timestamp"].to_numpy(dtype=np.float64) 
+    # stable sort by student, then time, keeps the log order of simultaneous transactions 
+    order = np.lexsort((timestamps, studentCodes)) 
+
+    outcomes = tutorLogDF["Outcome"].to_numpy(dtype=object)[order] 
+    isCorrect = outcomes == "CORRECT" 
+    isHint = outcomes == "HINT" 
+    isAttempt = isCorrect | isHint | (outcomes == "INCORRECT") 
+
+    # position of the first transaction of each row's student in the sorted order 
+    sortedCodes = studentCodes[order] 
+    isFirst = np.ones(len(order), dtype=bool) 
+    isFirst[1:] = sortedCodes[1:] != sortedCodes[:-1] 
+    groupStarts = np.maximum.accumulate(np.where(isFirst, np.arange(len(order)), 0)) 
+
+    return order, sortedCodes, timestamps[order], groupStarts, isAttempt, isCorrect, isHint 
+
+def _getWindowRates(order, starts, ends, isAttempt, isCorrect, isHint, suffix): 
+    """
+    Attempt count, correct rate and hint rate over the sorted rows 
+    [starts, ends) of each row, put back in the original row order 
+    """
+
+    # prefix sums, so every window is a difference of two entries 
+    def prefixSum(indicators): 
+        return np.concatenate([[0], np.cumsum(indicators, dtype=np.int64)]) 
+
+    attempts = prefixSum(isAttempt)[ends] - prefixSum(isAttempt)[starts] 
+    correct = prefixSum(isCorrect)[ends] - prefixSum(isCorrect)[starts] 
+    hints = prefixSum(isHint)[ends] - prefixSum(isHint)[starts] 
+    with np.errstate(divide="ignore", invalid="ignore"): 
+        correctRates = np.where(attempts > 0, correct / attempts, np.nan) 
+        hintRates = np.where(attempts > 0, hints / attempts, np.nan) 
+
+    res = dict() 
+    for name, values in [(f"attempts{suffix}", attempts), (f"correctRate{suffix}", correctRates), (f"hintRate{suffix}", hintRates)]: 
+        unsorted = np.empty(len(order), dtype=values.dtype) 
+        unsorted[order] = values 
+        res[name] = unsorted 
+    return res 
+
+def _withUntimedRows(values, isTimed): 
+    """
+    Spreads values of the timed transactions back over all transactions, 
+    with NaN for those without a time stamp 
+    """
+    if np.all(isTimed): return values 
+    allValues = np.full(len(isTimed), np.nan) 
+    allValues[isTimed] = values 
+    return allValues 
+
+@instrument
+def getRollingTimeMetrics(tutorLogDF, windows=[300], studentCol="Anon Student Id"): 
+
+    """
+    Correct rate and hint rate of each student over the last N seconds at 
+    every transaction, i.e. over the student's attempts (correct, incorrect 
+    and hint outcomes) with a timestamp in (t - N, t] up to and including the 
+    transaction. Window starts are found by one binary search over all 
+    students, whose time stamps are laid out on disjoint ranges of one axis 
+
+    Args:
+        tutorLogDF (pandas.DataFrame): usually returned by getAnnotatedTutorLogDF() 
+        windows (List[float], optional): window lengths in seconds. Defaults to [300].
+        studentCol (str, optional): Defaults to "Anon Student Id".
+
+    Returns:
+        pandas.DataFrame: same index as tutorLogDF, with `attemptsLast{N}s`, `correctRateLast{N}s` and 
+        `hintRateLast{N}s` columns for each window; NaN rates if there is no attempt in the window, and NaN 
+        in all columns for transactions without a time stamp 
+    """
+
+    for window in windows: assert window > 0, "Window lengths should be positive" 
+
+    # transactions without a time stamp belong to no time window, and are left out of the others' windows 
+    isTimed = np.isfinite(tutorLogDF["timestamp"].to_numpy(dtype=np.float64)) 
+    timedDF = tutorLogDF.loc[isTimed] 
+
+    order, sortedCodes, sortedTimestamps, groupStarts, isAttempt, isCorrect, isHint = _getAttemptIndicators(timedDF, studentCol) 
+    rollingDF = pd.DataFrame(index=tutorLogDF.index) 
+    ends = np.arange(1, len(order) + 1) 
+    for window in windows: 
+        if len(order) > 0: 
+            # each student's time stamps shifted onto its own range, so a single sorted key covers all students 
+            minTimestamp, maxTimestamp = np.min(sortedTimestamps), np.max(sortedTimestamps) 
+            stride = (maxTimestamp - minTimestamp) + window + 1 
+            keys = sortedCodes * stride + (sortedTimestamps - minTimestamp) 
+            starts = np.maximum(np.searchsorted(keys, keys - window, side="right"), groupStarts) 
+        else: starts = ends 
+        rates = _getWindowRates(order, starts, ends, isAttempt, isCorrect, isHint, f"Last{window:g}s") 
+        for name, values in rates.items(): rollingDF[name] = _withUntimedRows(values, isTimed) 
+
+    return rollingDF 
+
+@instrument
+def getRollingAttemptMetrics(tutorLogDF, windows=[10], studentCol="Anon Student Id"): 
+
+    """
+    Correct rate and hint rate of each student over the last K attempts at 
+    every transaction, up to and including the transaction. Windows are 
+    differences of prefix sums, so no per-student loop is needed 
+
+    Args:
+        tutorLogDF (pandas.DataFrame): usually returned by getAnnotatedTutorLogDF() 
+        windows (List[int], optional): numbers of attempts. Defaults to [10].
+        studentCol (str, optional): Defaults to "Anon Student Id".
+
+    Returns:
+        pandas.DataFrame: same index as tutorLogDF, with `attemptsLast{K}`, `correctRateLast{K}` and 
+        `hintRateLast{K}` columns for each window; `attemptsLast{K}` is less than K early in the student's log, 
+        and all columns are NaN for transactions without a time stamp 
+    """
+
+    for window in windows: assert int(window) == window and window > 0, "Windows should be positive integers" 
+
+    # transactions without a time stamp cannot be ordered, so they are left out as in getRollingTimeMetrics() 
+    isTimed = np.isfinite(tutorLogDF["timestamp"].to_numpy(dtype=np.float64)) 
+    order, sortedCodes, sortedTimestamps, groupStarts, isAttempt, isCorrect, isHint = _getAttemptIndicators(tutorLogDF.loc[isTimed], studentCol) 
+    rollingDF = pd.DataFrame(index=tutorLogDF.index) 
+
+    # attempts are numbered in the sorted order; the window of row i holds attempts 
+    # numbered (attemptsSoFar[i] - K, attemptsSoFar[i]], within the row's student 
+    attemptsSoFar = np.cumsum(isAttempt, dtype=np.int64) 
+    attemptsBeforeStudent = attemptsSoFar[groupStarts] - isAttempt[groupStarts] 
+    attemptRows = np.flatnonzero(isAttempt) 
+    ends = np.arange(1, len(order) + 1) 
+    for window in windows: 
+        firstAttempt = np.maximum(attemptsSoFar - int(window), attemptsBeforeStudent) 
+        # sorted row of the first attempt in the window; rows before it hold no attempts of the window 
+        starts = np.where(firstAttempt < attemptsSoFar, attemptRows[np.minimum(firstAttempt, len(attemptRows) - 1)] if len(attemptRows) > 0 else 0, ends) 
+        rates = _getWindowRates(order, starts, ends, isAttempt, isCorrect, isHint, f"Last{int(window)}") 
+        for name, values in rates.items(): rollingDF[name] = _withUntimedRows(values, isTimed) 
+
+    return rollingDF 
+
+
+# test cases 
+if __name__ == "__main__": 
+
+    # rolling windows of one student, the transaction without a time stamp gets NaN's 
+    logDF = pd.DataFrame({"Anon Student Id": ["Stu_a"] * 7, 
+                          "timestamp": [0, 10, 20, np.nan, 70, 80, 200], 
+                          "Outcome": ["CORRECT", "INCORRECT", "HINT", "CORRECT", "CORRECT", "INCORRECT", "CORRECT"]}) 
+    print(pd.concat([logDF, getRollingTimeMetrics(logDF, windows=[60]), getRollingAttemptMetrics(logDF, windows=[3])], axis=1)) 